@@ -1,18 +1,26 @@
+import time
+_import_started = time.perf_counter()
+
 import streamlit as st
 import os
-from PIL import Image
 from dotenv import load_dotenv
-from transformers import AutoProcessor, AutoModelForZeroShotImageClassification
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct
 import numpy as np
-from embeddings import embed_image, embed_text
-from vector_db import VectorDatabase
-import torch
-from database import init_db, save_outfit, get_saved_outfits
-
-# Jank way to suppress error
-torch.classes.__path__ = []
+# embeddings defers torch/transformers until the model is first loaded
+from embeddings import embed_text, load_model as load_clip_model, warm_up
+from preprocess import decode_image
+from vector_db import VectorDatabase, collapse_filter, create_client, GRID_PAYLOAD_FIELDS, OUTFIT_SLOTS as DEFAULT_OUTFIT_SLOTS
+from collection_setup import search_params_from_env
+from complements import ComplementTable
+from tagging import AutoTagger, parse_clothing_tags
+from embedding_cache import TextEmbeddingCache, ImageEmbeddingCache
+from embedding_worker import EmbeddingWorker, WardrobeUploadPipeline, FINISHED
+from thumbnails import ImagePathIndex, ThumbnailCache
+from reconcile import ImageStatusIndex
+from database import init_db, save_outfit, get_saved_outfits_page
+from startup import BackgroundModel, timings
+import metrics
+
+timings.record("app_import_s", time.perf_counter() - _import_started, once=True)
 
 # Load environment variables
 load_dotenv()
@@ -21,30 +29,166 @@ QDRANT_HOST = os.getenv("QDRANT_HOST")
 QDRANT_API_KEY =os.getenv("QDRANT_THRIFT_API_KEY")
 QDRANT_WARDROBE_COLLECTION = os.getenv('QDRANT_WARDROBE_COLLECTION')
 QDRANT_MARKETPLACE_COLLECTION = os.getenv('QDRANT_MARKETPLACE_COLLECTION')
-CLOTHING_TAGS = os.getenv('CLOTHING_TAGS')
-
-# Initialize Qdrant client
-client = QdrantClient(
-    url=QDRANT_HOST,
-    api_key=QDRANT_API_KEY,
-)
-
-db = VectorDatabase(QDRANT_HOST, QDRANT_API_KEY, QDRANT_WARDROBE_COLLECTION)
-marketplace_db = VectorDatabase(QDRANT_HOST, QDRANT_API_KEY, QDRANT_MARKETPLACE_COLLECTION)
-
-# Initialize CLIP model
-@st.cache_resource(show_spinner="Loading AI model...")
-def load_model():
+CLOTHING_TAGS = parse_clothing_tags(os.getenv('CLOTHING_TAGS'))
+OUTFIT_CANDIDATE_POOL = int(os.getenv('OUTFIT_CANDIDATE_POOL', 100))
+# Wardrobe categories, in the order outfits are assembled
+OUTFIT_SLOTS = [slot.strip() for slot in os.getenv('OUTFIT_SLOTS', ','.join(DEFAULT_OUTFIT_SLOTS)).split(',') if slot.strip()]
+OUTFIT_BEAM_WIDTH = int(os.getenv('OUTFIT_BEAM_WIDTH', 128))
+OUTFIT_MAX_ITEM_USES = int(os.getenv('OUTFIT_MAX_ITEM_USES', 1)) or None
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'qdrant')
+GRID_PAGE_SIZE = int(os.getenv('GRID_PAGE_SIZE', 30))
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', 0)) or None
+EMBEDDING_PREPROCESS = os.getenv('EMBEDDING_PREPROCESS', 'processor')
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', '1') == '1'
+SHOW_TIMINGS = os.getenv('SHOW_TIMINGS', '0') == '1'
+METRICS_PANEL = os.getenv('METRICS_PANEL', '0') == '1'
+COMPLEMENTS_PATH = os.getenv('COMPLEMENTS_PATH', os.path.join('.cache', 'complements.sqlite'))
+COMPLEMENTS_TOP_K = int(os.getenv('COMPLEMENTS_TOP_K', 5))
+COMPLEMENTS_MAX_AGE = float(os.getenv('COMPLEMENTS_MAX_AGE', 0)) or None
+METRICS_EXPORT_PATH = os.getenv('METRICS_EXPORT_PATH')
+METRICS_EXPORT_FORMAT = os.getenv('METRICS_EXPORT_FORMAT', 'prometheus')
+METRICS_EXPORT_INTERVAL = float(os.getenv('METRICS_EXPORT_INTERVAL', 15))
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 1))
+UPLOAD_BATCH_WINDOW_MS = float(os.getenv('UPLOAD_BATCH_WINDOW_MS', 50))
+UPLOAD_MAX_BATCH = int(os.getenv('UPLOAD_MAX_BATCH', 16))
+UPLOAD_POLL_INTERVAL = float(os.getenv('UPLOAD_POLL_INTERVAL', 1))
+IMAGE_INDEX_PATH = os.getenv('IMAGE_INDEX_PATH', os.path.join('.cache', 'image_index.sqlite'))
+COLLAPSE_DUPLICATES = os.getenv('COLLAPSE_DUPLICATES', '0') == '1'
+
+if metrics.is_enabled() and METRICS_EXPORT_PATH:
+    metrics.start_exporter(METRICS_EXPORT_PATH, METRICS_EXPORT_FORMAT, METRICS_EXPORT_INTERVAL)
+
+# One Qdrant client (or the local NumPy index when VECTOR_BACKEND=local) shared by every collection
+@st.cache_resource
+def load_client():
+    return create_client(QDRANT_HOST, QDRANT_API_KEY)
+
+client = load_client()
+
+# HNSW ef and quantisation rescoring for every search (QDRANT_SEARCH_EF, QDRANT_QUANTIZATION, ...)
+search_params = search_params_from_env()
+
+db = VectorDatabase(QDRANT_HOST, QDRANT_API_KEY, QDRANT_WARDROBE_COLLECTION, client=client,
+                    search_params=search_params)
+marketplace_db = VectorDatabase(QDRANT_HOST, QDRANT_API_KEY, QDRANT_MARKETPLACE_COLLECTION, client=client,
+                                search_params=search_params)
+
+def _load_clip():
+    processor, model = load_clip_model("./model", EMBEDDING_BACKEND, EMBEDDING_THREADS, EMBEDDING_PREPROCESS)
+    import torch
+    # Jank way to suppress error
+    torch.classes.__path__ = []
+    return processor, model
+
+# Initialize CLIP model in the background; pages that don't embed never wait for it
+@st.cache_resource
+def model_loader():
+    return BackgroundModel(_load_clip, warm_up=warm_up if MODEL_WARMUP else None)
+
+def get_model():
+    """(processor, model), waiting for the background load if it is still running"""
     try:
-        processor = AutoProcessor.from_pretrained("./model")
-        model = AutoModelForZeroShotImageClassification.from_pretrained("./model")
-        return processor, model
+        with st.spinner("Loading AI model..."), timings.measure("first_model_wait_s", once=True):
+            return model_loader().get()
     except Exception as e:
         st.error(f"Error loading model: {str(e)}")
         return None, None
 
-if 'model' not in st.session_state:
-    st.session_state.processor, st.session_state.model = load_model()
+model_loader()
+
+@st.cache_resource(show_spinner="Preparing clothing tags...")
+def load_tagger(_processor, _model):
+    if _model is None or not CLOTHING_TAGS:
+        return None
+    try:
+        return AutoTagger(CLOTHING_TAGS, _processor, _model)
+    except Exception as e:
+        st.error(f"Error preparing tags: {str(e)}")
+        return None
+
+@st.cache_resource
+def load_text_cache(_model):
+    return TextEmbeddingCache(_model) if _model is not None else None
+
+@st.cache_resource
+def load_image_cache(_model):
+    return ImageEmbeddingCache(_model) if _model is not None else None
+
+@st.cache_resource
+def load_image_index():
+    # Path statuses from the last `python reconcile.py` run, opened once; unknown paths fall back to os.stat
+    path_index = ImagePathIndex(snapshot=ImageStatusIndex.open(IMAGE_INDEX_PATH))
+    return path_index, ThumbnailCache(path_index=path_index)
+
+path_index, thumbnails = load_image_index()
+
+# Precomputed marketplace -> wardrobe outfit ideas (python complements.py build)
+@st.cache_resource
+def load_complements():
+    return ComplementTable(COMPLEMENTS_PATH, k=COMPLEMENTS_TOP_K, max_age=COMPLEMENTS_MAX_AGE)
+
+complements = load_complements()
+
+# Uploads are embedded, tagged and upserted by background workers shared by every session
+@st.cache_resource
+def load_upload_worker():
+    loader = model_loader()
+
+    def resources():
+        processor, model = loader.get()
+        return processor, model, load_image_cache(model), load_tagger(processor, model)
+
+    pipeline = WardrobeUploadPipeline(db, resources, complements=complements, path_index=path_index)
+    return EmbeddingWorker(pipeline, workers=UPLOAD_WORKERS, batch_window=UPLOAD_BATCH_WINDOW_MS / 1000,
+                           max_batch=UPLOAD_MAX_BATCH)
+
+upload_worker = load_upload_worker()
+
+def thumbnail(image_path):
+    """Small cached thumbnail for grid views, falling back to the original"""
+    return thumbnails.get(image_path) or image_path
+
+def grid_items(key, vector_db, scroll_filter=None):
+    """
+    Items loaded so far for a grid, one scroll page at a time. Pages are kept
+    in the session so reruns don't re-scroll, and only the payload fields
+    the grid shows are fetched.
+    """
+    state = st.session_state.get(key)
+    if state is None:
+        state = st.session_state[key] = {"items": [], "next_offset": None, "done": False}
+        load_more_items(key, vector_db, scroll_filter)
+    return state
+
+def load_more_items(key, vector_db, scroll_filter=None):
+    state = st.session_state[key]
+    if state["done"]:
+        return
+    points, next_offset = vector_db.get_page(state["next_offset"], GRID_PAGE_SIZE, GRID_PAYLOAD_FIELDS,
+                                             scroll_filter=scroll_filter)
+    state["items"].extend(points)
+    state["next_offset"] = next_offset
+    state["done"] = next_offset is None
+
+def reset_grid(key):
+    st.session_state.pop(key, None)
+
+def embed_prompt(prompt):
+    """Embed an outfit prompt, serving repeated prompts from the cache"""
+    processor, model = get_model()
+    text_cache = load_text_cache(model)
+    with timings.measure("first_prompt_embedding_s", once=True):
+        if text_cache is None:
+            return embed_text(prompt, processor, model)
+        return text_cache.embed_text(prompt, processor, model)
+
+def show_timings():
+    """Startup and first-request timings, in the sidebar"""
+    with st.sidebar.expander("Startup timings"):
+        st.caption("Model ready" if model_loader().ready else "Model loading in the background...")
+        for name, seconds in timings.as_dict().items():
+            st.text(f"{name}: {seconds * 1000:.0f} ms")
 
 # Initialize session state for generated outfits
 if 'generated_outfits_data' not in st.session_state:
@@ -71,69 +215,99 @@ def main():
     elif page == "🛍️ Thrift Marketplace":
         show_marketplace()
 
+    timings.record("first_render_s", time.perf_counter() - _import_started, once=True)
+    if SHOW_TIMINGS:
+        show_timings()
+    if METRICS_PANEL and metrics.is_enabled():
+        show_metrics_panel()
+
+def show_metrics_panel():
+    """Per-span latency, cache counters and the last request's span breakdown, in the sidebar"""
+    with st.sidebar.expander("Metrics"):
+        snapshot = metrics.snapshot()
+        st.dataframe([
+            {"span": name, "count": h["count"], "p50 ms": round(h["p50_s"] * 1000, 1),
+             "p95 ms": round(h["p95_s"] * 1000, 1), "total s": round(h["sum_s"], 2)}
+            for name, h in sorted(snapshot["histograms"].items(), key=lambda item: -item[1]["sum_s"])
+        ])
+        for counter in snapshot["counters"]:
+            labels = ", ".join(f"{key}={value}" for key, value in counter["labels"].items())
+            st.text(f"{counter['name']}{{{labels}}}: {counter['value']:g}")
+        traces = metrics.recent_traces()
+        if traces:
+            st.caption(f"Last request: {traces[0]['name']}")
+            st.text("\n".join(
+                f"{'  ' * depth}{name}: {(seconds or 0) * 1000:.1f} ms" for name, depth, seconds in traces[0]["spans"]
+            ))
+
+@st.fragment(run_every=UPLOAD_POLL_INTERVAL)
+def show_upload_status():
+    """Poll this session's upload jobs; rerun the page once they have all finished"""
+    jobs = [job for job in map(upload_worker.status, st.session_state.upload_jobs) if job is not None]
+    if all(job["status"] in FINISHED for job in jobs):
+        st.session_state.upload_jobs = []
+        st.session_state.finished_uploads = jobs
+        reset_grid("wardrobe_grid")
+        st.rerun()
+    for job in jobs:
+        st.caption(f"{job['filename']}: {job['status']}...")
+
+def show_finished_uploads():
+    for job in st.session_state.pop("finished_uploads", []):
+        if job["status"] == "done":
+            st.success(f"{job['filename']} added to wardrobe!")
+            if job["tags"]:
+                st.caption(f"Tags: {', '.join(job['tags'])}")
+        elif job["status"] == "duplicate":
+            st.info(f"{job['filename']} is already in your wardrobe.")
+        else:
+            st.error(f"Error adding {job['filename']}: {job['error']}")
+
+@metrics.traced("page.wardrobe")
 def show_wardrobe_page():
     st.header("My Virtual Wardrobe 👔")
     
     # Upload new item
     uploaded_file = st.file_uploader("Upload a new clothing item", type=["jpg", "png", "jpeg"])
     if uploaded_file:
-        # Show preview
-        image = Image.open(uploaded_file)
+        # Show preview; a phone photo is decoded at reduced scale, not at full resolution
+        image = decode_image(uploaded_file.getvalue(), min_size=1024)
         st.image(image, caption="Preview", use_column_width=True)
         
         # Get item details
-        category = st.selectbox("Category", ["top", "bottom"])
+        category = st.selectbox("Category", OUTFIT_SLOTS)
         description = st.text_input("Description (optional)")
         
         if st.button("Add to Wardrobe"):
-            try:
-                # Save image
-                save_path = os.path.join("images", uploaded_file.name)
-                image.save(save_path)
-                  # Get embedding
-                embedding = embed_image(save_path, st.session_state.processor, st.session_state.model)
-                
-                # Add to Qdrant
-                client.upsert(
-                    collection_name=QDRANT_WARDROBE_COLLECTION,
-                    points=[
-                        PointStruct(
-                            vector=embedding.tolist(),
-                            payload={
-                                "image_path": save_path,
-                                "category": category,
-                                "description": description
-                            }
-                        )
-                    ]
-                )
-                st.success("Item added to wardrobe!")
-            except Exception as e:
-                st.error(f"Error adding item: {str(e)}")
+            job_id = upload_worker.submit(uploaded_file.getvalue(), uploaded_file.name, category, description)
+            st.session_state.setdefault("upload_jobs", []).append(job_id)
+
+    if st.session_state.get("upload_jobs"):
+        show_upload_status()
+    show_finished_uploads()
     
     # Display wardrobe
     st.subheader("My Items")
     try:
-        # Get all items
-        scroll_result = client.scroll(
-            collection_name=QDRANT_WARDROBE_COLLECTION,
-            limit=100,
-            with_payload=True
-        )
-        items = scroll_result[0]
-        # wardrobe_items = db.get_all_items(limit=50) # You can adjust the limit as needed
+        # Items are loaded a page at a time
+        grid = grid_items("wardrobe_grid", db)
+        items = grid["items"]
 
         # st.write(items)
         # Display in grid
         cols = st.columns(3)
         for idx, item in enumerate(items):
             with cols[idx % 3]:
-                if os.path.exists(item.payload["image_path"]):
-                    st.image(item.payload["image_path"])
+                if path_index.exists(item.payload["image_path"]):
+                    st.image(thumbnail(item.payload["image_path"]))
                     st.caption(f"{item.payload.get('product_name', 'No description')}")
+        if not grid["done"] and st.button("Load more", key="wardrobe_load_more"):
+            load_more_items("wardrobe_grid", db)
+            st.rerun()
     except Exception as e:
         st.error(f"Error loading wardrobe: {str(e)}")
 
+@metrics.traced("page.outfit_generator")
 def show_outfit_generator():
     st.header("AI Outfit Generator 🎨")
     
@@ -142,21 +316,24 @@ def show_outfit_generator():
     if st.button("Generate Outfits"):
         try:
             with st.spinner("Generating outfit recommendations..."):
-                query_embedding = embed_text(prompt_input, st.session_state.processor, st.session_state.model)
-                outfits = db.get_outfit_recommendations(query_embedding, limit=3)
-                
-                marketplace_bottom_hits_results = [] # Renamed from potential_outfits_results
-                base_top_for_potential_outfits = None
-
-                if outfits and outfits[0].get('bottom') and outfits[0]['bottom'].get('id'):
-                    base_top_for_potential_outfits = outfits[0]['bottom']
-                    # Use marketplace_db for marketplace items
-                    marketplace_bottom_hits_results = marketplace_db.get_similar_items_in_collection( # Renamed
-                        base_top_for_potential_outfits['id'], 
-                        'clothes', 
-                        QDRANT_MARKETPLACE_COLLECTION, # Ensure this is the correct marketplace collection name
-                        'top' 
-                    )
+                query_embedding = embed_prompt(prompt_input)
+                # Wardrobe tops/bottoms are fetched concurrently, and the marketplace
+                # search reuses the best bottom's vector instead of re-fetching it
+                bundle = db.get_outfit_bundle(
+                    query_embedding,
+                    QDRANT_MARKETPLACE_COLLECTION,
+                    'top',
+                    limit=3,
+                    candidate_limit=OUTFIT_CANDIDATE_POOL,
+                    slots=OUTFIT_SLOTS,
+                    beam_width=OUTFIT_BEAM_WIDTH,
+                    max_item_uses=OUTFIT_MAX_ITEM_USES
+                )
+                outfits = bundle["outfits"]
+                marketplace_bottom_hits_results = bundle["complements"] # Renamed from potential_outfits_results
+                base_top_for_potential_outfits = bundle["base_item"]
+                for error in bundle["errors"]:
+                    st.warning(f"Some results may be missing: {error}")
                 
                 if not outfits:
                     st.warning("Not enough items in your wardrobe or no matching outfits found. Please add more clothes!")
@@ -192,19 +369,14 @@ def show_outfit_generator():
             st.subheader("Recommended Outfits (From Your Wardrobe)")
 
             for idx, outfit in enumerate(outfits_to_display):
-                col1, col2 = st.columns(2)
-                with col1:
-                    if "top" in outfit and outfit["top"] and "image_path" in outfit["top"] and os.path.exists(outfit["top"]["image_path"]):
-                        st.image(outfit["top"]["image_path"], 
-                               caption=outfit["top"].get("product_name", "Top"))
-                    else:
-                        st.write("Top image not available.")
-                with col2:
-                    if "bottom" in outfit and outfit["bottom"] and "image_path" in outfit["bottom"] and os.path.exists(outfit["bottom"]["image_path"]):
-                        st.image(outfit["bottom"]["image_path"], 
-                               caption=outfit["bottom"].get("product_name", "Bottom"))
-                    else:
-                        st.write("Bottom image not available.")
+                outfit_slots = [slot for slot in OUTFIT_SLOTS if outfit.get(slot)]
+                for column, slot in zip(st.columns(len(outfit_slots)), outfit_slots):
+                    with column:
+                        if "image_path" in outfit[slot] and path_index.exists(outfit[slot]["image_path"]):
+                            st.image(thumbnail(outfit[slot]["image_path"]),
+                                   caption=outfit[slot].get("product_name", slot.title()))
+                        else:
+                            st.write(f"{slot.title()} image not available.")
                 
                 # st.markdown(f"Match Score: {outfit.get('score', 0.0):.2f}")
                 
@@ -212,12 +384,12 @@ def show_outfit_generator():
                 if st.button("💾 Save Outfit", key=save_button_key):
                     try:
                         outfit_to_save = {
-                            "top": outfit["top"],
-                            "bottom": outfit["bottom"],
+                            **{slot: outfit[slot] for slot in outfit_slots},
                             # "score": outfit["score"],
                             "prompt": current_prompt
                         }
                         save_outfit(outfit_to_save)
+                        st.session_state.pop('saved_outfits_page', None)
                         st.success(f"Outfit {idx + 1} saved!")
                     except Exception as e:
                         st.error(f"Failed to save outfit {idx + 1}: {str(e)}")
@@ -230,8 +402,8 @@ def show_outfit_generator():
         if marketplace_bottoms_to_display and base_top_item: 
             st.subheader("Potential Outfits (Your Pieces + Marketplace Pieces)")
             st.write(f"Your piece: {base_top_item.get('description', 'Top')}")
-            if "image_path" in base_top_item and os.path.exists(base_top_item["image_path"]): # Added check for image_path key
-                st.image(base_top_item["image_path"], width=150) 
+            if "image_path" in base_top_item and path_index.exists(base_top_item["image_path"]): # Added check for image_path key
+                st.image(thumbnail(base_top_item["image_path"]), width=150) 
             else:
                 st.write("Base top image not available.")
             st.markdown("---")
@@ -243,8 +415,8 @@ def show_outfit_generator():
                 
                 with col1: 
                     st.write("Marketplace Bottom:")
-                    if "image_path" in potential_item.payload and os.path.exists(potential_item.payload['image_path']):
-                        st.image(potential_item.payload["image_path"], caption=potential_item.payload['product_name'])
+                    if "image_path" in potential_item.payload and path_index.exists(potential_item.payload['image_path']):
+                        st.image(thumbnail(potential_item.payload["image_path"]), caption=potential_item.payload['product_name'])
                     else:
                         st.write("Marketplace item image not available.")
                     st.write(f"Name: {potential_item.payload['product_name']}")
@@ -255,8 +427,8 @@ def show_outfit_generator():
                 
                 with col2: 
                     st.write("Your Top:")
-                    if "image_path" in base_top_item and os.path.exists(base_top_item["image_path"]): # Added check for image_path key
-                        st.image(base_top_item["image_path"], caption=base_top_item.get("description", "Top"))
+                    if "image_path" in base_top_item and path_index.exists(base_top_item["image_path"]): # Added check for image_path key
+                        st.image(thumbnail(base_top_item["image_path"]), caption=base_top_item.get("description", "Top"))
                     else:
                         st.write("Top image not available.")
 
@@ -270,6 +442,7 @@ def show_outfit_generator():
                             "prompt": current_prompt
                         }
                         save_outfit(outfit_to_save)
+                        st.session_state.pop('saved_outfits_page', None)
                         st.success(f"Outfit {idx + 1} saved!")
                     except Exception as e:
                         st.error(f"Failed to save outfit {idx + 1}: {str(e)}")
@@ -282,28 +455,40 @@ def show_outfit_generator():
             st.info("No matching bottoms found in the marketplace for your selected top to create potential outfits.")
 
 
+@metrics.traced("page.saved_outfits")
 def show_saved_outfits():
     st.header("Saved Outfits 💾")
     
-    saved_outfits = get_saved_outfits()
+    # Keyset-paginated: each "Load more" reads only the next page
+    if 'saved_outfits_page' not in st.session_state:
+        outfits, cursor = get_saved_outfits_page(GRID_PAGE_SIZE)
+        st.session_state.saved_outfits_page = {"outfits": outfits, "cursor": cursor}
+    saved_outfits = st.session_state.saved_outfits_page["outfits"]
     if not saved_outfits:
         st.info("No outfits saved yet.")
     else:
         # st.write(saved_outfits)
         for outfit in saved_outfits:
             st.markdown(f"### Outfit {outfit['id']}")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.image(outfit["top_image"], 
-                        caption=outfit["top_description"] or "Top")
-            with col2:
-                st.image(outfit["bottom_image"], 
-                        caption=outfit["bottom_description"] or "Bottom")
+            pieces = [(outfit["top_image"], outfit["top_description"] or "Top"),
+                      (outfit["bottom_image"], outfit["bottom_description"] or "Bottom")]
+            pieces += [(item["image_path"], item["product_name"] or slot.title())
+                       for slot, item in outfit["extra_items"].items()]
+            pieces = [(image_path, caption) for image_path, caption in pieces if image_path]
+            for column, (image_path, caption) in zip(st.columns(len(pieces) or 1), pieces):
+                with column:
+                    st.image(thumbnail(image_path), caption=caption)
             st.markdown(f"Prompt: {outfit['prompt']}")
             # st.markdown(f"Match Score: {outfit['score']:.2f}")
             st.markdown(f"Saved on: {outfit['created_at']}")
             st.markdown("---")
+        cursor = st.session_state.saved_outfits_page["cursor"]
+        if cursor is not None and st.button("Load more", key="saved_outfits_load_more"):
+            outfits, cursor = get_saved_outfits_page(GRID_PAGE_SIZE, cursor)
+            st.session_state.saved_outfits_page = {"outfits": saved_outfits + outfits, "cursor": cursor}
+            st.rerun()
 
+@metrics.traced("page.marketplace")
 def show_marketplace():
     st.header("Thrift Marketplace 🛍️")
 
@@ -311,16 +496,13 @@ def show_marketplace():
     if 'selected_marketplace_item' not in st.session_state:
         st.session_state.selected_marketplace_item = None
 
-    marketplace_items = marketplace_db.get_all_items(limit=50) # You can adjust the limit as needed
-
-
     if st.session_state.selected_marketplace_item:
         # --- Detailed Item View ---
         item = st.session_state.selected_marketplace_item
         
         col1, col2 = st.columns([1, 2]) # Adjust column ratios as needed
         with col1:
-            if os.path.exists(item.payload["image_path"]):
+            if path_index.exists(item.payload["image_path"]):
                 st.image(item.payload["image_path"], use_container_width=True)
             else:
                 st.warning("Image not found.")
@@ -347,7 +529,6 @@ def show_marketplace():
             st.warning("Cannot generate outfits: Marketplace item category is not defined.")
         else:
             item_category = item_payload["category"]
-            item_id = item.id 
 
             complementary_category = "bottom" if item_category.lower() == "top" else "top"
 
@@ -358,13 +539,18 @@ def show_marketplace():
                 # It will use the item_id from the marketplace_db.collection_name 
                 # to find its vector, and then search for complementary items 
                 # in the db.collection_name (wardrobe).
-                complementary_wardrobe_items = db.get_similar_items_in_collection(
-                    item_id=item_id,
-                    origin_collection_name=marketplace_db.collection_name, # Collection of the marketplace item
-                    target_collection_name=db.collection_name,             # Wardrobe collection to search in
-                    filter=complementary_category,
-                    limit=2 # Generate 2 outfits
-                )
+                # Served from the precomputed table; a missing or stale entry falls back to the live query
+                complementary_wardrobe_items = complements.get(item.id, limit=2) # Generate 2 outfits
+                if complementary_wardrobe_items is None:
+                    live_hits = db.get_similar_items_in_collection(
+                        item_id=item,  # the point itself, so its vector is reused when present
+                        origin_collection_name=marketplace_db.collection_name, # Collection of the marketplace item
+                        target_collection_name=db.collection_name,             # Wardrobe collection to search in
+                        filter=complementary_category,
+                        limit=COMPLEMENTS_TOP_K
+                    )
+                    complements.put(item, live_hits)
+                    complementary_wardrobe_items = live_hits[:2]
 
                 if not complementary_wardrobe_items:
                     st.info(f"Could not find any matching '{complementary_category}' items in your wardrobe to pair with this marketplace item.")
@@ -380,29 +566,29 @@ def show_marketplace():
                             # Marketplace item is TOP, Wardrobe item is BOTTOM
                             with cols_outfit[0]:
                                 st.write(f"**Marketplace Item (Top):** {item_payload.get('product_name', 'Top')}")
-                                if os.path.exists(item_payload["image_path"]):
-                                    st.image(item_payload["image_path"], use_container_width=True)
+                                if path_index.exists(item_payload["image_path"]):
+                                    st.image(thumbnail(item_payload["image_path"]), use_container_width=True)
                                 else:
                                     st.caption("Image not available")
 
                             with cols_outfit[1]:
                                 st.write(f"**Your Wardrobe (Bottom):** {wardrobe_item_payload.get('product_name', 'Bottom')}")
-                                if os.path.exists(wardrobe_item_payload["image_path"]):
-                                    st.image(wardrobe_item_payload["image_path"], use_container_width=True)
+                                if path_index.exists(wardrobe_item_payload["image_path"]):
+                                    st.image(thumbnail(wardrobe_item_payload["image_path"]), use_container_width=True)
                                 else:
                                     st.caption("Image not available")
                         else: # Marketplace item is BOTTOM, Wardrobe item is TOP
                             with cols_outfit[0]:
                                 st.write(f"**Your Wardrobe (Top):** {wardrobe_item_payload.get('product_name', 'Top')}")
-                                if os.path.exists(wardrobe_item_payload["image_path"]):
-                                    st.image(wardrobe_item_payload["image_path"], use_container_width=True)
+                                if path_index.exists(wardrobe_item_payload["image_path"]):
+                                    st.image(thumbnail(wardrobe_item_payload["image_path"]), use_container_width=True)
                                 else:
                                     st.caption("Image not available")
 
                             with cols_outfit[1]:
                                 st.write(f"**Marketplace Item (Bottom):** {item_payload.get('product_name', 'Bottom')}")
-                                if os.path.exists(item_payload["image_path"]):
-                                    st.image(item_payload["image_path"], use_container_width=True)
+                                if path_index.exists(item_payload["image_path"]):
+                                    st.image(thumbnail(item_payload["image_path"]), use_container_width=True)
                                 else:
                                     st.caption("Image not available")
             except Exception as e:
@@ -412,7 +598,10 @@ def show_marketplace():
     else:
         # --- Grid View of Marketplace Items ---
         st.subheader("Browse Items")
-        # st.write(marketplace_items)
+        # With COLLAPSE_DUPLICATES, re-posted listings marked by `python dedup.py build` show once
+        marketplace_filter = collapse_filter() if COLLAPSE_DUPLICATES else None
+        grid = grid_items("marketplace_grid", marketplace_db, marketplace_filter)
+        marketplace_items = grid["items"]
         num_items = len(marketplace_items)
         cols_per_row = 3 # Number of columns for the grid
 
@@ -423,15 +612,20 @@ def show_marketplace():
                     item = marketplace_items[i+j]
                     with cols[j]:
                         container = st.container()
-                        if os.path.exists(item.payload["image_path"]):
-                            container.image(item.payload["image_path"], use_container_width='auto')
+                        if path_index.exists(item.payload["image_path"]):
+                            container.image(thumbnail(item.payload["image_path"]), use_container_width='auto')
                         else:
                             container.caption("Image not available")
                         container.write(item.payload["product_name"])
                         container.write(f"RM {item.payload['price']}")
                         if container.button("View Details", key=f"details_{item.id}"):
-                            st.session_state.selected_marketplace_item = item
+                            # Grid points only carry the grid fields; fetch the full item for the detail view
+                            st.session_state.selected_marketplace_item = marketplace_db.get_item_by_id(item.id) or item
                             st.rerun() # Use st.rerun() for Streamlit v1.28.0+
 
+        if not grid["done"] and st.button("Load more", key="marketplace_load_more"):
+            load_more_items("marketplace_grid", marketplace_db, marketplace_filter)
+            st.rerun()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,118 @@
+"""
+Compare the full-decode, per-image processor path with draft decoding and
+NumPy preprocessing.
+
+    python benchmarks/image_decode.py --model ./model --images images/
+    python benchmarks/image_decode.py --sizes 1024x768 4000x3000
+
+Images are re-encoded as JPEGs at each --sizes resolution (random noise
+without --images) and kept as bytes, like an upload. Rows report:
+- decode: full decode versus draft mode,
+- preprocess: processor(images=...) versus ImagePreprocessor on the same
+  decoded batch, and the largest pixel-value difference between the two,
+- embed: embed_images end to end for both paths, and the minimum cosine
+  between their embeddings.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import embed_images, load_model, DEFAULT_MODEL_PATH  # noqa: E402
+from preprocess import ImagePreprocessor, decode_image, draft_size  # noqa: E402
+
+
+def _parse_size(size):
+    width, height = size.lower().split("x")
+    return int(width), int(height)
+
+
+def _sample_jpegs(image_dir, count, size, seed=0):
+    if image_dir:
+        paths = sorted(
+            path for pattern in ("*.jpg", "*.jpeg", "*.png", "*.webp")
+            for path in glob.glob(os.path.join(image_dir, "**", pattern), recursive=True)
+        )[:count]
+        images = [Image.open(path).convert("RGB").resize(size, Image.BICUBIC) for path in paths]
+    else:
+        rng = np.random.default_rng(seed)
+        images = [Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)) for _ in range(count)]
+    encoded = []
+    for image in images:
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=90)
+        encoded.append(buffer.getvalue())
+    return encoded
+
+
+def _median_ms(fn, repeats):
+    fn()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings) * 1000)
+
+
+def run(processor, model, fast_processor, fast_model, sources, size, repeats):
+    min_size = draft_size(processor)
+    full = [decode_image(data) for data in sources]
+    draft = [decode_image(data, min_size) for data in sources]
+    preprocessor = ImagePreprocessor(processor)
+    reference = processor(images=full, return_tensors="np")["pixel_values"]
+    label = f"{size[0]}x{size[1]}"
+    rows = [
+        {"case": "decode", "size": label, "images": len(sources), "draft_size": list(draft[0].size),
+         "baseline_ms": _median_ms(lambda: [decode_image(data) for data in sources], repeats),
+         "fast_ms": _median_ms(lambda: [decode_image(data, min_size) for data in sources], repeats)},
+        {"case": "preprocess", "size": label, "images": len(sources),
+         "baseline_ms": _median_ms(lambda: processor(images=full, return_tensors="np"), repeats),
+         "fast_ms": _median_ms(lambda: preprocessor(full), repeats),
+         "max_abs_diff": float(np.abs(reference - preprocessor(full)).max())},
+    ]
+    baseline = embed_images(sources, processor, model, batch_size=len(sources), draft=False)
+    fast = embed_images(sources, fast_processor, fast_model, batch_size=len(sources))
+    rows.append({
+        "case": "embed", "size": label, "images": len(sources),
+        "baseline_ms": _median_ms(lambda: embed_images(sources, processor, model, batch_size=len(sources),
+                                                       draft=False), repeats),
+        "fast_ms": _median_ms(lambda: embed_images(sources, fast_processor, fast_model,
+                                                   batch_size=len(sources)), repeats),
+        "min_cosine": float((baseline * fast).sum(axis=1).min()),
+    })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure draft JPEG decoding and NumPy preprocessing")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path to the CLIP model")
+    parser.add_argument("--images", help="Directory of sample images (random noise if unset)")
+    parser.add_argument("--count", type=int, default=16, help="Images per batch")
+    parser.add_argument("--sizes", nargs="+", default=["1024x768", "4000x3000"], help="JPEG resolutions, WxH")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    processor, model = load_model(args.model)
+    fast_processor, fast_model = load_model(args.model, preprocess="numpy")
+    report = []
+    for size in map(_parse_size, args.sizes):
+        sources = _sample_jpegs(args.images, args.count, size)
+        for row in run(processor, model, fast_processor, fast_model, sources, size, args.repeats):
+            row["speedup"] = row["baseline_ms"] / max(row["fast_ms"], 1e-9)
+            print(json.dumps(row))
+            report.append(row)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
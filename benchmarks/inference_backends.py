@@ -0,0 +1,116 @@
+"""
+Check each CLIP inference backend against the eager model and compare speed.
+
+    python benchmarks/inference_backends.py --model ./model --images images/
+    python benchmarks/inference_backends.py --backends int8 onnx --threads 2
+
+Parity is the cosine similarity between each backend's embeddings and the
+eager model's, per input; a backend passes when the minimum is at least
+--min-cosine. Without --images, random noise images are used.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import embed_images, embed_texts, load_model, DEFAULT_MODEL_PATH  # noqa: E402
+from inference import BACKENDS, load_backend, set_num_threads  # noqa: E402
+
+PROMPTS = [
+    "casual summer outfit", "black leather jacket", "floral midi dress", "white sneakers",
+    "office wear for a rainy day", "denim jeans", "oversized hoodie", "linen shirt",
+]
+
+
+def _sample_images(image_dir, count, seed=0):
+    if image_dir:
+        paths = sorted(
+            path for pattern in ("*.jpg", "*.jpeg", "*.png", "*.webp")
+            for path in glob.glob(os.path.join(image_dir, "**", pattern), recursive=True)
+        )[:count]
+        return [Image.open(path).convert("RGB") for path in paths]
+    rng = np.random.default_rng(seed)
+    return [Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)) for _ in range(count)]
+
+
+def _timed(fn, repeats):
+    fn()  # warm-up run, not timed
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return np.array(timings)
+
+
+def _stats(timings, items):
+    return {
+        "p50_ms": float(np.percentile(timings, 50) * 1000),
+        "p95_ms": float(np.percentile(timings, 95) * 1000),
+        "items_per_s": float(items / np.median(timings)),
+    }
+
+
+def run(model_path, backends, images, texts, batch_size, repeats, num_threads, min_cosine):
+    set_num_threads(num_threads)
+    processor, eager = load_model(model_path)
+    reference_images = embed_images(images, processor, eager, batch_size=batch_size)
+    reference_texts = embed_texts(texts, processor, eager, batch_size=batch_size)
+
+    report = []
+    for backend in backends:
+        model = load_backend(eager, processor, backend, num_threads) if backend != "torch" else eager
+        image_vectors = embed_images(images, processor, model, batch_size=batch_size)
+        text_vectors = embed_texts(texts, processor, model, batch_size=batch_size)
+        # Rows are L2-normalised, so the row-wise dot product is the cosine
+        image_cosine = np.sum(image_vectors * reference_images, axis=1)
+        text_cosine = np.sum(text_vectors * reference_texts, axis=1)
+        row = {
+            "backend": backend,
+            "threads": num_threads,
+            "batch_size": batch_size,
+            "image_min_cosine": float(image_cosine.min()),
+            "text_min_cosine": float(text_cosine.min()),
+            "parity": bool(min(image_cosine.min(), text_cosine.min()) >= min_cosine),
+            "image": _stats(_timed(lambda: embed_images(images, processor, model, batch_size=batch_size), repeats),
+                            len(images)),
+            "text": _stats(_timed(lambda: embed_texts(texts, processor, model, batch_size=batch_size), repeats),
+                           len(texts)),
+            "single_text": _stats(_timed(lambda: embed_texts(texts[:1], processor, model), repeats), 1),
+        }
+        print(json.dumps(row))
+        report.append(row)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CLIP inference backends for parity and speed")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path to the CLIP model")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--images", help="Directory of sample images (default: random noise)")
+    parser.add_argument("--num-images", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, help="Intra-op threads per backend")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    images = _sample_images(args.images, args.num_images)
+    texts = (PROMPTS * (args.num_images // len(PROMPTS) + 1))[:args.num_images]
+    report = run(args.model, args.backends, images, texts, args.batch_size, args.repeats, args.threads,
+                 args.min_cosine)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if not all(row["parity"] for row in report):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compare the NumPy LocalVectorStore against Qdrant on synthetic catalogues.
+
+    python benchmarks/local_index_vs_qdrant.py --sizes 1000 10000 100000 1000000
+    python benchmarks/local_index_vs_qdrant.py --qdrant-url http://localhost:6333
+
+Without --qdrant-url the comparison runs against qdrant-client's local
+in-memory mode, which is itself a pure-Python brute-force search, so it is
+skipped above --qdrant-max items.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_index import LocalVectorStore  # noqa: E402
+from vector_db import VectorDatabase  # noqa: E402
+
+COLLECTION = "bench"
+CATEGORIES = ["top", "bottom", "outerwear", "shoes"]
+
+
+def _load(client, vectors, batch_size=2048):
+    client.create_collection(COLLECTION, vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE))
+    started = time.perf_counter()
+    for start in range(0, len(vectors), batch_size):
+        client.upsert(COLLECTION, [
+            PointStruct(id=i, vector=vectors[i].tolist(), payload={"category": CATEGORIES[i % len(CATEGORIES)]})
+            for i in range(start, min(start + batch_size, len(vectors)))
+        ])
+    return time.perf_counter() - started
+
+
+def _latencies(vector_db, queries, limit):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        vector_db.get_items_by_category("top", query, limit)
+        timings.append(time.perf_counter() - started)
+    timings = np.array(timings) * 1000
+    return {"p50_ms": float(np.percentile(timings, 50)), "p95_ms": float(np.percentile(timings, 95))}
+
+
+def run(sizes, dim, dtype, queries, limit, qdrant_url, qdrant_max, seed=0):
+    rng = np.random.default_rng(seed)
+    report = []
+    for size in sizes:
+        vectors = rng.standard_normal((size, dim), dtype=np.float32)
+        query_vectors = rng.standard_normal((queries, dim), dtype=np.float32)
+        row = {"items": size, "dim": dim}
+
+        local = LocalVectorStore(dtype=dtype)
+        row["local_load_s"] = _load(local, vectors)
+        row["local"] = _latencies(VectorDatabase(None, None, COLLECTION, client=local), query_vectors, limit)
+
+        if qdrant_url or size <= qdrant_max:
+            qdrant = QdrantClient(url=qdrant_url) if qdrant_url else QdrantClient(location=":memory:")
+            if qdrant.collection_exists(COLLECTION):
+                qdrant.delete_collection(COLLECTION)
+            row["qdrant_load_s"] = _load(qdrant, vectors)
+            row["qdrant"] = _latencies(VectorDatabase(None, None, COLLECTION, client=qdrant), query_vectors, limit)
+            if qdrant_url:
+                qdrant.delete_collection(COLLECTION)
+        print(json.dumps(row))
+        report.append(row)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local NumPy index against Qdrant")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--qdrant-url", help="Real Qdrant server to compare against")
+    parser.add_argument("--qdrant-max", type=int, default=10_000,
+                        help="Largest size to run against in-memory qdrant-client")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.dim, args.dtype, args.queries, args.limit, args.qdrant_url, args.qdrant_max)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
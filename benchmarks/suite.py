@@ -0,0 +1,274 @@
+"""
+End-to-end benchmarks of the app's hot paths on synthetic catalogues.
+
+    python benchmarks/suite.py --sizes 1000 10000 --output bench.json
+    python benchmarks/suite.py --sizes 1000 10000 --baseline bench.json
+
+Each catalogue is random L2-normalised vectors with fake payloads, loaded
+into in-memory qdrant-client up to --qdrant-max items and into the local
+NumPy index (local_index.py) above that, since in-memory qdrant-client is a
+pure-Python brute-force search. Every case reports p50/p95/p99 in ms.
+
+Embedding throughput uses --model if it exists, otherwise a tiny randomly
+initialised CLIP built on the fly, so numbers are only comparable between
+runs on the same model. With --baseline, any case whose p50 is more than
+--tolerance slower than the baseline is reported and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database  # noqa: E402
+from embeddings import embed_images, embed_texts, load_model, DEFAULT_MODEL_PATH  # noqa: E402
+from local_index import LocalVectorStore  # noqa: E402
+from vector_db import (  # noqa: E402
+    VectorDatabase, GRID_PAYLOAD_FIELDS, beam_search_outfits, point_cache, score_outfit_combinations,
+)
+
+COLLECTION = "bench"
+CATEGORIES = ["top", "bottom", "outerwear", "shoes"]
+TAGS = ["casual", "formal", "denim", "cotton", "black", "white", "floral", "summer", "winter", "oversized"]
+
+
+def tiny_model(path):
+    """A randomly initialised CLIP with a toy tokenizer, saved under `path`, for when real weights are absent"""
+    from transformers import CLIPConfig, CLIPImageProcessor, CLIPModel, CLIPProcessor, CLIPTokenizer
+
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    os.makedirs(path, exist_ok=True)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocab = {letter: i for i, letter in enumerate(letters)}
+    vocab.update({f"{letter}</w>": len(letters) + i for i, letter in enumerate(letters)})
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+    with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(path, "merges.txt"), "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+
+    tokenizer = CLIPTokenizer(os.path.join(path, "vocab.json"), os.path.join(path, "merges.txt"))
+    image_processor = CLIPImageProcessor(size={"shortest_edge": 64}, crop_size={"height": 64, "width": 64})
+    config = CLIPConfig(
+        text_config=dict(vocab_size=len(vocab), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                         num_attention_heads=2, max_position_embeddings=77, bos_token_id=vocab["<|startoftext|>"],
+                         eos_token_id=vocab["<|endoftext|>"], pad_token_id=vocab["<|endoftext|>"]),
+        vision_config=dict(hidden_size=64, intermediate_size=128, num_hidden_layers=2, num_attention_heads=2,
+                           image_size=64, patch_size=16),
+        projection_dim=64,
+    )
+    CLIPModel(config).save_pretrained(path)
+    CLIPProcessor(image_processor=image_processor, tokenizer=tokenizer).save_pretrained(path)
+    return path
+
+
+def synthetic_catalogue(size, dim, rng):
+    """Random unit vectors with fake marketplace-style payloads"""
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    payloads = [
+        {
+            "image_path": f"images/synthetic/{i}.jpg",
+            "product_name": f"Item {i}",
+            "price": float(rng.integers(5, 200)),
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "tags": [TAGS[j] for j in rng.choice(len(TAGS), 3, replace=False)],
+            "description": f"Synthetic item {i}",
+        }
+        for i in range(size)
+    ]
+    return vectors, payloads
+
+
+def _percentiles(timings):
+    timings = np.asarray(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "runs": len(timings),
+    }
+
+
+def _measure(fn, repeats, setup=None):
+    """Time `fn` over `repeats` runs after one untimed warm-up run; `setup` runs untimed before each"""
+    if setup:
+        setup()
+    fn()
+    timings = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_embeddings(model_path, repeats, batch_size=16):
+    processor, model = load_model(model_path)
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)) for _ in range(batch_size)]
+    texts = ["casual summer outfit"] * batch_size
+    rows = []
+    for case, fn, items in [
+        ("embed_text", lambda: embed_texts(texts[:1], processor, model), 1),
+        ("embed_texts_batch", lambda: embed_texts(texts, processor, model, batch_size=batch_size), batch_size),
+        ("embed_image", lambda: embed_images(images[:1], processor, model, batch_size=1, num_workers=1), 1),
+        ("embed_images_batch", lambda: embed_images(images, processor, model, batch_size=batch_size), batch_size),
+    ]:
+        stats = _percentiles(_measure(fn, repeats))
+        stats["items_per_s"] = items / (stats["p50_ms"] / 1000)
+        rows.append({"case": case, "items": None, **stats})
+    return rows
+
+
+def bench_catalogue(size, dim, repeats, qdrant_max, candidate_limit, rng):
+    vectors, payloads = synthetic_catalogue(size, dim, rng)
+    client = QdrantClient(location=":memory:") if size <= qdrant_max else LocalVectorStore()
+    backend = "qdrant" if isinstance(client, QdrantClient) else "local"
+    client.create_collection(COLLECTION, vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
+    vector_db = VectorDatabase(None, None, COLLECTION, client=client)
+
+    started = time.perf_counter()
+    vector_db.add_items(list(range(size)), vectors, payloads, batch_size=2048)
+    load_s = time.perf_counter() - started
+
+    queries = iter(rng.standard_normal((repeats + 1, dim), dtype=np.float32))
+    tops = vector_db.get_items_by_category("top", vectors[0], candidate_limit)
+    bottoms = vector_db.get_items_by_category("bottom", vectors[0], candidate_limit)
+    pools = {category: vector_db.get_items_by_category(category, vectors[0], candidate_limit) for category in CATEGORIES}
+    item_ids = iter(rng.integers(0, size, repeats + 1).tolist())
+    offsets = iter(rng.integers(0, max(size - 30, 1), repeats + 1).tolist())
+
+    cases = [
+        ("get_items_by_category", lambda: vector_db.get_items_by_category("top", next(queries), 5), None),
+        ("_score_outfit_combinations",
+         lambda: score_outfit_combinations(vectors[0], tops, bottoms, limit=3), None),
+        ("get_outfit_recommendations",
+         lambda: vector_db.get_outfit_recommendations(vectors[1], limit=3, candidate_limit=candidate_limit), None),
+        ("beam_search_outfits", lambda: beam_search_outfits(vectors[0], pools, CATEGORIES, limit=3), None),
+        ("get_outfits",
+         lambda: vector_db.get_outfits(vectors[1], CATEGORIES, limit=3, candidate_limit=candidate_limit), None),
+        # Cold point cache, so this includes fetching the origin item's vector
+        ("get_similar_items_in_collection",
+         lambda: vector_db.get_similar_items_in_collection(next(item_ids), COLLECTION, COLLECTION, "bottom"),
+         lambda: point_cache.invalidate(COLLECTION)),
+        ("scroll_grid_page", lambda: vector_db.get_page(next(offsets), 30, GRID_PAYLOAD_FIELDS), None),
+    ]
+    rows = []
+    for case, fn, setup in cases:
+        rows.append({"case": case, "items": size, "backend": backend, **_percentiles(_measure(fn, repeats, setup))})
+    rows.append({"case": "load", "items": size, "backend": backend, "seconds": load_s})
+    return rows
+
+
+def bench_sqlite(repeats, page_size=20, batch_size=50):
+    original_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, "bench.db"))
+        database.init_db()
+        outfit = {
+            "top": {"image_path": "images/top.jpg", "product_name": "Top"},
+            "bottom": {"image_path": "images/bottom.jpg", "product_name": "Bottom"},
+            "prompt": "casual summer outfit",
+        }
+        rows = [
+            {"case": "save_outfit", "items": None,
+             **_percentiles(_measure(lambda: database.save_outfit(outfit), repeats))},
+            {"case": "save_outfits_batch", "items": batch_size,
+             **_percentiles(_measure(lambda: database.save_outfits([outfit] * batch_size), repeats))},
+        ]
+        saved = len(database.get_saved_outfits())
+        cursor = database.get_saved_outfits_page(page_size)[1]
+        rows.append({"case": "get_saved_outfits_page", "items": saved,
+                     **_percentiles(_measure(lambda: database.get_saved_outfits_page(page_size), repeats))})
+        rows.append({"case": "get_saved_outfits_next_page", "items": saved,
+                     **_percentiles(_measure(lambda: database.get_saved_outfits_page(page_size, cursor), repeats))})
+        database.configure(original_path)
+    return rows
+
+
+def compare(results, baseline, tolerance):
+    """Cases whose p50 regressed by more than `tolerance` (a fraction) against the baseline"""
+    previous = {(row["case"], row.get("items")): row for row in baseline["results"] if "p50_ms" in row}
+    regressions = []
+    for row in results:
+        before = previous.get((row["case"], row.get("items")))
+        if before is None or "p50_ms" not in row:
+            continue
+        ratio = row["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1.0
+        if ratio > 1 + tolerance:
+            regressions.append({"case": row["case"], "items": row.get("items"), "baseline_p50_ms": before["p50_ms"],
+                                "p50_ms": row["p50_ms"], "ratio": ratio})
+    return regressions
+
+
+def run(sizes, dim, repeats, qdrant_max, candidate_limit, model_path, skip_embeddings=False, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    if not skip_embeddings:
+        if not os.path.exists(os.path.join(model_path, "config.json")):
+            model_path = tiny_model(os.path.join(".cache", "bench_tiny_clip"))
+        results.extend(bench_embeddings(model_path, repeats))
+    for size in sizes:
+        rows = bench_catalogue(size, dim, repeats, qdrant_max, candidate_limit, rng)
+        for row in rows:
+            print(json.dumps(row))
+        results.extend(rows)
+    results.extend(bench_sqlite(repeats))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "model": model_path if not skip_embeddings else None,
+            "dim": dim,
+            "repeats": repeats,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's hot paths on synthetic catalogues")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--candidate-limit", type=int, default=100)
+    parser.add_argument("--qdrant-max", type=int, default=10_000,
+                        help="Largest catalogue loaded into in-memory qdrant-client; larger ones use the local index")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH,
+                        help="CLIP model for the embedding cases (a tiny stand-in is used if it is missing)")
+    parser.add_argument("--skip-embeddings", action="store_true")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown, as a fraction")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.dim, args.repeats, args.qdrant_max, args.candidate_limit, args.model,
+                 args.skip_embeddings)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report["results"], json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']} ({regression['items']} items): "
+                  f"{regression['baseline_p50_ms']:.2f} ms -> {regression['p50_ms']:.2f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Bytes and time spent moving vectors between the app and the vector store.
+
+    python benchmarks/vector_transport.py --sizes 100 1000 10000 --dim 512
+
+For N random vectors, `bytes` rows compare:
+- the JSON body a REST upsert or search response carries,
+- the packed float32 a gRPC client (QDRANT_PREFER_GRPC=1) sends,
+- float32 and float16 storage.
+
+`time` rows compare the list-based path with the array-based one:
+- upserts into the local index: PointStructs of Python floats versus
+  upload_collection with the matrix,
+- stacking search hits into a matrix: list vectors versus array vectors,
+- outfit scoring on pools of list-vector points versus PointMatrix pools,
+- local index searches returning list vectors versus array rows.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from qdrant_client.conversions.conversion import RestToGrpc
+from qdrant_client.models import Distance, PointStruct, ScoredPoint, VectorParams
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_index import LocalVectorStore  # noqa: E402
+from vector_db import beam_search_outfits  # noqa: E402
+from vectors import PointMatrix, as_matrix, stack_vectors  # noqa: E402
+
+COLLECTION = "bench"
+SLOTS = ["top", "bottom", "outerwear", "shoes"]
+
+
+def _best_ms(fn, repeats):
+    fn()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings) * 1000)
+
+
+def measure_bytes(vectors):
+    payload = {"category": "top"}
+    points = [PointStruct(id=i, vector=vector.tolist(), payload=payload) for i, vector in enumerate(vectors)]
+    return {
+        "case": "bytes", "items": len(vectors), "dim": vectors.shape[1],
+        "rest_json": sum(len(point.model_dump_json()) for point in points),
+        "grpc": sum(RestToGrpc.convert_point_struct(point).ByteSize() for point in points),
+        "float32_storage": vectors.astype(np.float32).nbytes,
+        "float16_storage": vectors.astype(np.float16).nbytes,
+    }
+
+
+def measure_time(vectors, repeats, pool_size):
+    size, dim = vectors.shape
+    ids = list(range(size))
+    payloads = [{"category": SLOTS[i % len(SLOTS)]} for i in ids]
+    list_points = [ScoredPoint(id=i, version=0, score=0.0, vector=vectors[i].tolist(), payload=payloads[i]) for i in ids]
+    array_points = [ScoredPoint.model_construct(id=i, version=0, score=0.0, vector=vectors[i], payload=payloads[i])
+                    for i in ids]
+    store = LocalVectorStore()
+    store.create_collection(COLLECTION, VectorParams(size=dim, distance=Distance.COSINE))
+
+    def upsert_as_lists():
+        store.upsert(COLLECTION, [PointStruct(id=i, vector=vectors[i].tolist(), payload=payloads[i]) for i in ids])
+
+    rows = [
+        {"case": "local_upsert", "items": size,
+         "lists_ms": _best_ms(upsert_as_lists, repeats),
+         "arrays_ms": _best_ms(lambda: store.upload_collection(COLLECTION, as_matrix(vectors), payloads, ids), repeats)},
+        {"case": "stack_hits", "items": size,
+         "lists_ms": _best_ms(lambda: stack_vectors(list_points), repeats),
+         "arrays_ms": _best_ms(lambda: stack_vectors(array_points), repeats)},
+    ]
+
+    query = vectors[0]
+    pool_size = min(pool_size, size // len(SLOTS))
+    list_pools = {slot: list_points[i::len(SLOTS)][:pool_size] for i, slot in enumerate(SLOTS)}
+    matrix_pools = {slot: PointMatrix.from_points(array_points[i::len(SLOTS)][:pool_size])
+                    for i, slot in enumerate(SLOTS)}
+    rows.append({"case": "beam_search_outfits", "items": pool_size * len(SLOTS),
+                 "lists_ms": _best_ms(lambda: beam_search_outfits(query, list_pools, SLOTS), repeats),
+                 "arrays_ms": _best_ms(lambda: beam_search_outfits(query, matrix_pools, SLOTS), repeats)})
+
+    def search_as_lists():
+        # What the local index returned before: validated points with list vectors
+        points = store.query_points(COLLECTION, query=query, limit=pool_size, with_vectors=True).points
+        return [ScoredPoint(id=p.id, version=0, score=p.score, payload=p.payload, vector=p.vector.tolist())
+                for p in points]
+
+    rows.append({"case": "local_search_with_vectors", "items": size,
+                 "lists_ms": _best_ms(search_as_lists, repeats),
+                 "arrays_ms": _best_ms(lambda: store.query_points(COLLECTION, query=query, limit=pool_size,
+                                                                  with_vectors=True), repeats)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure vector transport bytes and list-versus-array timings")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--pool-size", type=int, default=100, help="Candidates per outfit slot")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    report = []
+    for size in args.sizes:
+        vectors = rng.standard_normal((size, args.dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for row in [measure_bytes(vectors), *measure_time(vectors, args.repeats, args.pool_size)]:
+            if "lists_ms" in row:
+                row["speedup"] = row["lists_ms"] / max(row["arrays_ms"], 1e-9)
+            print(json.dumps(row))
+            report.append(row)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Create, migrate and tune the Qdrant collections.
+
+ensure_collection() creates a collection with the right dimension and
+distance, or migrates an existing one in place. It applies HNSW settings and
+optional int8 scalar quantisation, and adds keyword payload indexes on
+`category` and `tags`, so filtered searches don't scan payloads. Only a
+change of dimension, distance or stored vector datatype (float32 or
+float16; for a local store, its own dtype) needs a rebuild (recreate=True,
+then re-ingest). Local stores are checked the same way as Qdrant.
+
+    python collection_setup.py create --dimension 512
+    python collection_setup.py report --items 1000000 --m 16 32 --ef 64 128 256 --quantization none int8
+
+`report` loads a synthetic catalogue into a scratch collection per
+(m, ef_construct, quantisation) setting and prints recall@k against exact
+search next to query latency, for each per-query `ef`. It needs a real
+Qdrant server: in-memory qdrant-client has no HNSW, so its recall is
+always 1.
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Datatype, Disabled, Distance, FieldCondition, Filter, HnswConfigDiff, MatchValue, PayloadSchemaType, PointStruct,
+    QuantizationSearchParams, ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams, VectorParams,
+)
+from local_index import LocalVectorStore
+
+DEFAULT_DIMENSION = 512
+DEFAULT_HNSW_M = 16
+DEFAULT_EF_CONSTRUCT = 100
+KEYWORD_FIELDS = ("category", "tags")
+
+
+def quantization_config(quantization: str = None, quantile: float = 0.99, always_ram: bool = True):
+    """ScalarQuantization for quantization='int8', None for no quantisation"""
+    if not quantization or quantization == "none":
+        return None
+    if quantization != "int8":
+        raise ValueError(f"Unsupported quantization '{quantization}', expected 'int8' or 'none'")
+    return ScalarQuantization(
+        scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=quantile, always_ram=always_ram)
+    )
+
+
+def search_params(ef: int = None, quantized: bool = False, rescore: bool = True, oversampling: float = None):
+    """
+    Per-query search settings: HNSW `ef`, and for quantised collections
+    whether to re-rank the candidates with the original vectors.
+    """
+    if ef is None and not quantized:
+        return None
+    quantization = QuantizationSearchParams(rescore=rescore, oversampling=oversampling) if quantized else None
+    return SearchParams(hnsw_ef=ef, quantization=quantization)
+
+
+def ensure_collection(client, collection_name: str, dimension: int = DEFAULT_DIMENSION,
+                      distance: Distance = Distance.COSINE, hnsw_m: int = DEFAULT_HNSW_M,
+                      ef_construct: int = DEFAULT_EF_CONSTRUCT, quantization: str = None,
+                      keyword_fields=KEYWORD_FIELDS, recreate: bool = False, datatype: str = "float32"):
+    """
+    Create `collection_name`, or bring an existing one up to these settings.
+    Returns a list of what was changed.
+    """
+    changes = []
+    wanted_datatype = Datatype(datatype or "float32")
+    local = isinstance(client, LocalVectorStore)
+    if local:
+        # A local store keeps every collection in its own dtype (LOCAL_INDEX_DTYPE)
+        wanted_datatype = Datatype(np.dtype(client.dtype).name)
+    exists = client.collection_exists(collection_name)
+    if exists:
+        if local:
+            vectors = client.vector_params(collection_name)
+        else:
+            vectors = client.get_collection(collection_name).config.params.vectors
+        current_datatype = vectors.datatype or Datatype.FLOAT32
+        if vectors.size != dimension or vectors.distance != distance or current_datatype != wanted_datatype:
+            if not recreate:
+                raise Exception(
+                    f"Collection '{collection_name}' has {vectors.size}-d {current_datatype.value} "
+                    f"{vectors.distance} vectors, expected {dimension}-d {wanted_datatype.value} {distance}; "
+                    f"rerun with recreate=True and re-ingest"
+                )
+            client.delete_collection(collection_name)
+            changes.append("deleted (dimension/distance/datatype changed)")
+            exists = False
+
+    if not exists:
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=dimension, distance=distance, datatype=wanted_datatype),
+            hnsw_config=HnswConfigDiff(m=hnsw_m, ef_construct=ef_construct),
+            quantization_config=quantization_config(quantization),
+        )
+        changes.append("created")
+    elif not local:
+        info = client.get_collection(collection_name)
+        hnsw = info.config.hnsw_config
+        if hnsw.m != hnsw_m or hnsw.ef_construct != ef_construct:
+            client.update_collection(collection_name, hnsw_config=HnswConfigDiff(m=hnsw_m, ef_construct=ef_construct))
+            changes.append(f"hnsw m={hnsw_m} ef_construct={ef_construct}")
+        wanted = quantization_config(quantization)
+        if (info.config.quantization_config is None) != (wanted is None):
+            client.update_collection(collection_name, quantization_config=wanted or Disabled.DISABLED)
+            changes.append(f"quantization {quantization or 'none'}")
+
+    return changes + ensure_payload_indexes(client, collection_name, keyword_fields)
+
+
+def ensure_payload_indexes(client, collection_name: str, keyword_fields=(), bool_fields=()):
+    """Add whichever keyword and bool payload indexes are missing; returns what was added"""
+    changes = []
+    indexed = {} if isinstance(client, LocalVectorStore) else client.get_collection(collection_name).payload_schema
+    wanted = [(field, PayloadSchemaType.KEYWORD) for field in keyword_fields]
+    wanted += [(field, PayloadSchemaType.BOOL) for field in bool_fields]
+    for field, schema in wanted:
+        if field not in indexed:
+            client.create_payload_index(collection_name, field_name=field, field_schema=schema)
+            changes.append(f"{schema.value} index on {field}")
+    return changes
+
+
+def settings_from_env() -> dict:
+    """Collection settings from QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT, QDRANT_QUANTIZATION and QDRANT_VECTOR_DATATYPE"""
+    return {
+        "hnsw_m": int(os.getenv("QDRANT_HNSW_M", DEFAULT_HNSW_M)),
+        "ef_construct": int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", DEFAULT_EF_CONSTRUCT)),
+        "quantization": os.getenv("QDRANT_QUANTIZATION", "none"),
+        "datatype": os.getenv("QDRANT_VECTOR_DATATYPE", "float32"),
+    }
+
+
+def search_params_from_env():
+    """Per-query settings from QDRANT_SEARCH_EF, QDRANT_QUANTIZATION, QDRANT_RESCORE and QDRANT_OVERSAMPLING"""
+    ef = os.getenv("QDRANT_SEARCH_EF")
+    oversampling = os.getenv("QDRANT_OVERSAMPLING")
+    return search_params(
+        ef=int(ef) if ef else None,
+        quantized=os.getenv("QDRANT_QUANTIZATION", "none") == "int8",
+        rescore=os.getenv("QDRANT_RESCORE", "1") == "1",
+        oversampling=float(oversampling) if oversampling else None,
+    )
+
+
+def _percentile_ms(timings, q):
+    return float(np.percentile(np.asarray(timings) * 1000, q))
+
+
+def recall_report(client: QdrantClient, items: int, dimension: int, hnsw_ms, ef_constructs, efs, quantizations,
+                  queries: int = 100, k: int = 10, category: str = "bottom", seed: int = 0):
+    """
+    Recall@k (against exact search) and latency for every combination of
+    build settings and per-query ef, on a synthetic catalogue.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((items, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    categories = np.array(["top", "bottom"])[np.arange(items) % 2]
+    query_vectors = rng.standard_normal((queries, dimension), dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    query_filter = Filter(must=[FieldCondition(key="category", match=MatchValue(value=category))])
+
+    # Exact filtered top-k by brute force
+    candidate_rows = np.flatnonzero(categories == category)
+    scores = query_vectors @ vectors[candidate_rows].T
+    exact = [set(candidate_rows[np.argsort(-row)[:k]].tolist()) for row in scores]
+
+    report = []
+    collection_name = "recall_report"
+    for quantization in quantizations:
+        for hnsw_m in hnsw_ms:
+            for ef_construct in ef_constructs:
+                if client.collection_exists(collection_name):
+                    client.delete_collection(collection_name)
+                ensure_collection(client, collection_name, dimension, hnsw_m=hnsw_m, ef_construct=ef_construct,
+                                  quantization=quantization)
+                started = time.perf_counter()
+                for start in range(0, items, 1024):
+                    client.upsert(collection_name, [
+                        PointStruct(id=i, vector=vectors[i].tolist(), payload={"category": str(categories[i])})
+                        for i in range(start, min(start + 1024, items))
+                    ], wait=False)
+                # Wait until the optimiser has built the index before timing searches
+                while client.get_collection(collection_name).status.value != "green":
+                    time.sleep(1)
+                build_s = time.perf_counter() - started
+
+                for ef in efs:
+                    params = search_params(ef, quantized=quantization == "int8")
+                    timings, hits = [], 0
+                    for query, expected in zip(query_vectors, exact):
+                        query_started = time.perf_counter()
+                        points = client.query_points(collection_name, query=query.tolist(), query_filter=query_filter,
+                                                     limit=k, search_params=params).points
+                        timings.append(time.perf_counter() - query_started)
+                        hits += len(expected & {point.id for point in points})
+                    row = {
+                        "items": items, "m": hnsw_m, "ef_construct": ef_construct, "quantization": quantization,
+                        "ef": ef, f"recall@{k}": hits / (k * len(exact)), "build_s": build_s,
+                        "p50_ms": _percentile_ms(timings, 50), "p95_ms": _percentile_ms(timings, 95),
+                    }
+                    print(json.dumps(row))
+                    report.append(row)
+    client.delete_collection(collection_name)
+    return report
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Create, migrate and tune the Qdrant collections")
+    parser.add_argument("--url", default=os.getenv("QDRANT_HOST"), help="Qdrant URL")
+    parser.add_argument("--api-key", default=os.getenv("QDRANT_THRIFT_API_KEY"))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    settings = settings_from_env()
+    create = subparsers.add_parser("create", help="Create or migrate the wardrobe and marketplace collections")
+    create.add_argument("--collections", nargs="+", default=[
+        name for name in (os.getenv("QDRANT_WARDROBE_COLLECTION"), os.getenv("QDRANT_MARKETPLACE_COLLECTION")) if name
+    ])
+    create.add_argument("--dimension", type=int, default=DEFAULT_DIMENSION, help="Embedding size of the CLIP model")
+    create.add_argument("--m", type=int, default=settings["hnsw_m"])
+    create.add_argument("--ef-construct", type=int, default=settings["ef_construct"])
+    create.add_argument("--quantization", default=settings["quantization"], choices=["none", "int8"])
+    create.add_argument("--datatype", default=settings["datatype"], choices=["float32", "float16"],
+                        help="Stored vector type; float16 halves vector memory")
+    create.add_argument("--recreate", action="store_true", help="Drop collections whose dimension/distance differ")
+
+    report = subparsers.add_parser("report", help="Recall versus latency for HNSW and quantisation settings")
+    report.add_argument("--items", type=int, default=100_000)
+    report.add_argument("--dimension", type=int, default=DEFAULT_DIMENSION)
+    report.add_argument("--m", type=int, nargs="+", default=[16])
+    report.add_argument("--ef-construct", type=int, nargs="+", default=[100])
+    report.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128, 256])
+    report.add_argument("--quantization", nargs="+", default=["none", "int8"], choices=["none", "int8"])
+    report.add_argument("--queries", type=int, default=100)
+    report.add_argument("--k", type=int, default=10)
+    report.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.url, api_key=args.api_key) if args.url else QdrantClient(location=":memory:")
+    if args.command == "create":
+        for collection_name in args.collections:
+            changes = ensure_collection(client, collection_name, args.dimension, hnsw_m=args.m,
+                                        ef_construct=args.ef_construct, quantization=args.quantization,
+                                        recreate=args.recreate, datatype=args.datatype)
+            print(f"{collection_name}: {', '.join(changes) or 'up to date'}")
+    elif args.command == "report":
+        if not args.url:
+            print("No --url given: in-memory qdrant-client has no HNSW index, so recall will always be 1")
+        rows = recall_report(client, args.items, args.dimension, args.m, args.ef_construct, args.ef,
+                             args.quantization, args.queries, args.k)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Precomputed marketplace -> wardrobe complement table.
+
+For every marketplace item, the top-k wardrobe items of the complementary
+category (top <-> bottom), by cosine similarity, are kept in SQLite with
+the wardrobe payloads they need for display. The marketplace detail page
+then reads its outfit ideas with one indexed lookup instead of a retrieve
+plus a filtered search on every rerun.
+
+    python complements.py build            # full rebuild from both collections
+
+The full build streams both collections and scores them with blocked
+matrix products. After that the table is kept current incrementally:
+add_wardrobe_items() rescores only the marketplace rows of the affected
+category and rewrites just the rows whose top-k changed, and
+add_marketplace_items() fills rows for new marketplace items with one
+batched search. invalidate() (or max_age) marks entries stale; get()
+returns None for those, and callers fall back to the live query.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client.models import ScoredPoint
+from vector_db import VectorDatabase, create_client
+from vectors import normalize_rows, stack_vectors
+
+DEFAULT_COMPLEMENTS_PATH = os.path.join(".cache", "complements.sqlite")
+DEFAULT_TOP_K = 5
+# Payload keys kept for the wardrobe items shown on the detail page
+DISPLAY_FIELDS = ("image_path", "product_name", "category", "description", "tags")
+
+
+def complement_category(category: str) -> str:
+    """The category an item is paired with (the app pairs tops with bottoms)"""
+    return "bottom" if (category or "").lower() == "top" else "top"
+
+
+def _display_payload(payload: dict) -> dict:
+    return {key: payload[key] for key in DISPLAY_FIELDS if key in payload}
+
+
+class ComplementTable:
+    def __init__(self, path: str = DEFAULT_COMPLEMENTS_PATH, k: int = DEFAULT_TOP_K, max_age: float = None):
+        """
+        Top-`k` complements per marketplace item. Entries older than
+        `max_age` seconds (if set) count as stale.
+        """
+        self.path = path
+        self.k = k
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript('''
+        CREATE TABLE IF NOT EXISTS complements (
+            marketplace_id TEXT PRIMARY KEY,
+            complement_category TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            wardrobe_ids TEXT NOT NULL,
+            scores TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_complements_category ON complements (complement_category);
+        CREATE TABLE IF NOT EXISTS wardrobe_items (
+            wardrobe_id TEXT PRIMARY KEY,
+            payload TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+        ''')
+        self._conn.commit()
+
+    def _version(self) -> int:
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def invalidate(self):
+        """Mark every entry stale, e.g. after wardrobe items were deleted or changed outside this table"""
+        with self._lock:
+            self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            self._conn.commit()
+
+    def get(self, marketplace_id, limit: int = None):
+        """
+        The stored complements as ScoredPoints (best first), or None if the
+        item has no entry or its entry is stale.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT wardrobe_ids, scores, version, updated_at FROM complements WHERE marketplace_id = ?',
+                (str(marketplace_id),)
+            ).fetchone()
+            if row is None or row[2] < self._version():
+                return None
+            if self.max_age is not None and time.time() - row[3] > self.max_age:
+                return None
+            ids = json.loads(row[0])[:limit or self.k]
+            scores = json.loads(row[1])
+            payloads = dict(self._conn.execute(
+                f'SELECT wardrobe_id, payload FROM wardrobe_items WHERE wardrobe_id IN ({",".join("?" * len(ids))})',
+                ids
+            ).fetchall()) if ids else {}
+        return [
+            ScoredPoint(id=wardrobe_id, version=0, score=score, payload=json.loads(payloads[wardrobe_id]))
+            for wardrobe_id, score in zip(ids, scores)
+            if wardrobe_id in payloads
+        ]
+
+    def _write(self, rows, wardrobe_payloads):
+        """rows: (marketplace_id, complement category, vector, wardrobe ids, scores)"""
+        now = time.time()
+        version = self._version()
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO wardrobe_items (wardrobe_id, payload) VALUES (?, ?)',
+            [(str(wardrobe_id), json.dumps(_display_payload(payload))) for wardrobe_id, payload in wardrobe_payloads]
+        )
+        self._conn.executemany('''
+        INSERT OR REPLACE INTO complements
+        (marketplace_id, complement_category, vector, wardrobe_ids, scores, version, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (str(marketplace_id), category, np.asarray(vector, dtype=np.float32).tobytes(),
+             json.dumps([str(i) for i in ids]), json.dumps([float(s) for s in scores]), version, now)
+            for marketplace_id, category, vector, ids, scores in rows
+        ])
+        self._conn.commit()
+
+    def put(self, marketplace_point, hits):
+        """Store live search results (e.g. from the fallback path) for one marketplace item"""
+        if marketplace_point.vector is None:
+            return
+        category = complement_category(marketplace_point.payload.get("category"))
+        hits = sorted(hits, key=lambda hit: -hit.score)[:self.k]
+        with self._lock:
+            self._write(
+                [(marketplace_point.id, category, marketplace_point.vector, [hit.id for hit in hits],
+                  [hit.score for hit in hits])],
+                [(hit.id, hit.payload) for hit in hits],
+            )
+
+    def rebuild(self, marketplace_db: VectorDatabase, wardrobe_db: VectorDatabase, block_size: int = 4096,
+                page_size: int = 1024):
+        """Recompute every entry from both collections; returns the number of marketplace items scored"""
+        wardrobe = {}  # category -> (ids, vectors, payloads)
+        for point in wardrobe_db.iter_items(page_size=page_size, with_vectors=True):
+            ids, vectors, payloads = wardrobe.setdefault(point.payload.get("category"), ([], [], []))
+            ids.append(point.id)
+            vectors.append(point.vector)
+            payloads.append(point.payload)
+        matrices = {category: normalize_rows(np.asarray(vectors, dtype=np.float32))
+                    for category, (_, vectors, _) in wardrobe.items()}
+
+        with self._lock:
+            self._conn.execute('DELETE FROM complements')
+            self._conn.execute('DELETE FROM wardrobe_items')
+            self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            self._conn.commit()
+
+        scored = 0
+        pending = []
+        marketplace_points = marketplace_db.iter_items(page_size=page_size, payload_fields=["category"],
+                                                       with_vectors=True)
+        for point in marketplace_points:
+            pending.append(point)
+            if len(pending) >= block_size:
+                self._score_block(pending, wardrobe, matrices)
+                scored += len(pending)
+                pending = []
+        if pending:
+            self._score_block(pending, wardrobe, matrices)
+            scored += len(pending)
+        return scored
+
+    def _score_block(self, points, wardrobe, matrices):
+        rows = []
+        used = {}
+        by_category = {}
+        for point in points:
+            by_category.setdefault(complement_category(point.payload.get("category")), []).append(point)
+        for category, group in by_category.items():
+            vectors = normalize_rows(stack_vectors(group))
+            if category not in matrices:
+                rows.extend((point.id, category, vector, [], []) for point, vector in zip(group, vectors))
+                continue
+            ids, _, payloads = wardrobe[category]
+            scores = vectors @ matrices[category].T
+            k = min(self.k, scores.shape[1])
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for point, vector, row_scores, row_best in zip(group, vectors, scores, best):
+                row_best = row_best[np.argsort(-row_scores[row_best], kind="stable")]
+                rows.append((point.id, category, vector, [ids[i] for i in row_best], row_scores[row_best].tolist()))
+                for i in row_best:
+                    used[ids[i]] = payloads[i]
+        with self._lock:
+            self._write(rows, used.items())
+
+    def add_wardrobe_items(self, ids, vectors, payloads, block_size: int = 4096):
+        """
+        Fold new (or re-embedded) wardrobe items into the table. Only rows
+        whose complement category matches are scored, `block_size` rows at a
+        time, and only rows whose top-k actually changes are rewritten.
+        A row where a re-embedded item falls below its old k-th score is
+        dropped instead, since the item that should replace it was never
+        stored; get() then misses and the caller falls back to a live query.
+        Returns the number of rows rewritten or dropped.
+        """
+        changed = 0
+        by_category = {}
+        for wardrobe_id, vector, payload in zip(ids, vectors, payloads):
+            by_category.setdefault(payload.get("category"), []).append((str(wardrobe_id), vector, payload))
+        for category, items in by_category.items():
+            new_ids = [wardrobe_id for wardrobe_id, _, _ in items]
+            new_matrix = normalize_rows(np.asarray([vector for _, vector, _ in items], dtype=np.float32))
+            wardrobe_payloads = [(wardrobe_id, payload) for wardrobe_id, _, payload in items]
+            last_rowid = 0
+            while True:
+                with self._lock:
+                    # Keyset pagination on the category index, which is ordered by rowid within a category
+                    rows = self._conn.execute(
+                        'SELECT rowid, marketplace_id, vector, wardrobe_ids, scores FROM complements '
+                        'WHERE complement_category = ? AND rowid > ? ORDER BY rowid LIMIT ?',
+                        (category, last_rowid, block_size)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    last_rowid = rows[-1][0]
+                    marketplace_matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+                    new_scores = marketplace_matrix @ new_matrix.T
+                    updates, dropped = [], []
+                    for (_, marketplace_id, vector, ids_json, scores_json), row_scores in zip(rows, new_scores):
+                        current = dict(zip(json.loads(ids_json), json.loads(scores_json)))
+                        floor = min(current.values()) if len(current) >= self.k else -np.inf
+                        if not any(score > floor or wardrobe_id in current
+                                   for wardrobe_id, score in zip(new_ids, row_scores)):
+                            continue
+                        if any(wardrobe_id in current and score < floor
+                               for wardrobe_id, score in zip(new_ids, row_scores)):
+                            dropped.append((marketplace_id,))
+                            continue
+                        current.update(zip(new_ids, row_scores.tolist()))
+                        best = sorted(current.items(), key=lambda item: -item[1])[:self.k]
+                        updates.append((marketplace_id, category, np.frombuffer(vector, dtype=np.float32),
+                                        [wardrobe_id for wardrobe_id, _ in best], [score for _, score in best]))
+                    if dropped:
+                        self._conn.executemany('DELETE FROM complements WHERE marketplace_id = ?', dropped)
+                        self._conn.commit()
+                    if updates:
+                        self._write_updates(updates, wardrobe_payloads)
+                    changed += len(updates) + len(dropped)
+        return changed
+
+    def _write_updates(self, updates, wardrobe_payloads):
+        # Updated rows keep their original version, so a pending invalidate() still applies to them
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO wardrobe_items (wardrobe_id, payload) VALUES (?, ?)',
+            [(wardrobe_id, json.dumps(_display_payload(payload))) for wardrobe_id, payload in wardrobe_payloads]
+        )
+        self._conn.executemany(
+            'UPDATE complements SET wardrobe_ids = ?, scores = ?, updated_at = ? WHERE marketplace_id = ?',
+            [(json.dumps(ids), json.dumps([float(s) for s in scores]), time.time(), marketplace_id)
+             for marketplace_id, _, _, ids, scores in updates]
+        )
+        self._conn.commit()
+
+    def add_marketplace_items(self, ids, vectors, payloads, wardrobe_db: VectorDatabase):
+        """Fill entries for new marketplace items with one batched search of the wardrobe"""
+        categories = [complement_category(payload.get("category")) for payload in payloads]
+        results = wardrobe_db.search_batch([(vector, category, self.k) for vector, category in zip(vectors, categories)])
+        rows = []
+        used = {}
+        for marketplace_id, vector, category, hits in zip(ids, vectors, categories, results):
+            rows.append((marketplace_id, category, normalize_rows(np.asarray([vector], dtype=np.float32))[0],
+                         [hit.id for hit in hits], [hit.score for hit in hits]))
+            used.update((hit.id, hit.payload) for hit in hits)
+        with self._lock:
+            self._write(rows, used.items())
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Build the marketplace -> wardrobe complement table")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Recompute every entry from both collections")
+    build.add_argument("--path", default=os.getenv("COMPLEMENTS_PATH", DEFAULT_COMPLEMENTS_PATH))
+    build.add_argument("--k", type=int, default=int(os.getenv("COMPLEMENTS_TOP_K", DEFAULT_TOP_K)))
+    build.add_argument("--location", help="Local Qdrant location instead of QDRANT_HOST, e.g. a path")
+    subparsers.add_parser("invalidate", help="Mark every entry stale").add_argument(
+        "--path", default=os.getenv("COMPLEMENTS_PATH", DEFAULT_COMPLEMENTS_PATH))
+    args = parser.parse_args()
+
+    if args.command == "invalidate":
+        ComplementTable(args.path).invalidate()
+        return
+    client = create_client(os.getenv("QDRANT_HOST"), os.getenv("QDRANT_THRIFT_API_KEY"), args.location)
+    wardrobe_db = VectorDatabase(None, None, os.getenv("QDRANT_WARDROBE_COLLECTION"), client=client)
+    marketplace_db = VectorDatabase(None, None, os.getenv("QDRANT_MARKETPLACE_COLLECTION"), client=client)
+    table = ComplementTable(args.path, k=args.k)
+    started = time.perf_counter()
+    scored = table.rebuild(marketplace_db, wardrobe_db)
+    print(f"Scored {scored} marketplace items in {time.perf_counter() - started:.1f}s")
+    table.close()
+
+
+if __name__ == "__main__":
+    main()
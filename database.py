@@ -1,15 +1,99 @@
 import sqlite3
 import json
+import os
+import queue
+import threading
 from contextlib import contextmanager
+from metrics import traced
+
+DB_PATH = os.getenv("FASHION_DB_PATH", "fashion.db")
+
+INSERT_OUTFIT = '''
+INSERT INTO saved_outfits
+(top_image, top_description, bottom_image, bottom_description, score, prompt, extra_items)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+SELECT_OUTFITS = 'SELECT * FROM saved_outfits ORDER BY created_at DESC, id DESC LIMIT ?'
+SELECT_OUTFITS_AFTER = '''
+SELECT * FROM saved_outfits
+WHERE created_at < ? OR (created_at = ? AND id < ?)
+ORDER BY created_at DESC, id DESC LIMIT ?
+'''
+
+
+class ConnectionPool:
+    def __init__(self, path: str = DB_PATH, size: int = 4):
+        """
+        A few long-lived connections shared by all Streamlit sessions. Each
+        get_db() borrows one exclusively, so no connection is used by two
+        threads at once.
+        """
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._idle.put(None)  # connections are opened on first use
+
+    def _connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # sqlite3 keeps prepared statements per connection, keyed by SQL text
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-8000")  # 8 MB page cache
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get()
+        try:
+            if conn is None:
+                conn = self._connect()
+            yield conn
+        except Exception:
+            if conn is not None:
+                conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """Close every idle connection; the pool reopens them on demand"""
+        for _ in range(self._idle.maxsize):
+            conn = self._idle.get()
+            if conn is not None:
+                conn.close()
+        for _ in range(self._idle.maxsize):
+            self._idle.put(None)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(path: str = None, pool_size: int = 4):
+    """Point the module at a different database file (closing the current pool)"""
+    global _pool, DB_PATH
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        DB_PATH = path or DB_PATH
+        _pool = ConnectionPool(DB_PATH, pool_size)
+
 
 @contextmanager
 def get_db():
-    conn = sqlite3.connect('fashion.db')
-    try:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DB_PATH)
+        pool = _pool
+    with pool.connection() as conn:
         yield conn
-    finally:
-        conn.close()
 
+@traced("sqlite.init_db")
 def init_db():
     with get_db() as conn:
         cursor = conn.cursor()
@@ -22,43 +106,88 @@ def init_db():
             bottom_description TEXT,
             score REAL,
             prompt TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            extra_items TEXT
         )
         ''')
+        # Outfits can have more slots than top and bottom; older databases lack the column
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(saved_outfits)')}
+        if 'extra_items' not in columns:
+            cursor.execute('ALTER TABLE saved_outfits ADD COLUMN extra_items TEXT')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_saved_outfits_created_at ON saved_outfits (created_at, id)'
+        )
         conn.commit()
 
+def _outfit_row(outfit):
+    # Use .get() for safer access, providing None as default
+    top_item = outfit.get("top", {})
+    bottom_item = outfit.get("bottom", {})
+    # Any other slots (outerwear, shoes, ...) are stored as JSON
+    extra_items = {
+        slot: {"image_path": item.get("image_path"), "product_name": item.get("product_name")}
+        for slot, item in outfit.items()
+        if slot not in ("top", "bottom") and isinstance(item, dict)
+    }
+    return (
+        top_item.get("image_path"),
+        top_item.get("product_name"),
+        bottom_item.get("image_path"),
+        bottom_item.get("product_name"),
+        outfit.get("score"),
+        outfit.get("prompt"),
+        json.dumps(extra_items) if extra_items else None
+    )
+
+@traced("sqlite.save_outfit")
 def save_outfit(outfit):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        # Use .get() for safer access, providing None or an empty string as default
-        top_item = outfit.get("top", {})
-        bottom_item = outfit.get("bottom", {})
+    save_outfits([outfit])
 
-        cursor.execute('''
-        INSERT INTO saved_outfits 
-        (top_image, top_description, bottom_image, bottom_description, score, prompt)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            top_item.get("image_path"),  # Default to None if key missing
-            top_item.get("product_name"), # Default to None if key missing
-            bottom_item.get("image_path"), # Default to None if key missing
-            bottom_item.get("product_name"),# Default to None if key missing
-            outfit.get("score"),          # Default to None if key missing
-            outfit.get("prompt")          # Default to None if key missing
-        ))
+@traced("sqlite.save_outfits")
+def save_outfits(outfits):
+    """Insert several outfits in a single transaction"""
+    rows = [_outfit_row(outfit) for outfit in outfits]
+    if not rows:
+        return
+    with get_db() as conn:
+        conn.executemany(INSERT_OUTFIT, rows)
         conn.commit()
 
-def get_saved_outfits():
+@traced("sqlite.get_saved_outfits_page")
+def get_saved_outfits_page(limit: int = 20, cursor=None):
+    """
+    Newest saved outfits first, `limit` at a time. Pass the returned cursor
+    back in to get the next page; it is None once there are no more rows.
+    """
     with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM saved_outfits ORDER BY created_at DESC')
-        columns = [description[0] for description in cursor.description]
-        results = cursor.fetchall()
-        return [dict(zip(columns, row)) for row in results]
-    
+        if cursor is None:
+            result = conn.execute(SELECT_OUTFITS, (limit,))
+        else:
+            created_at, outfit_id = cursor
+            result = conn.execute(SELECT_OUTFITS_AFTER, (created_at, created_at, outfit_id, limit))
+        columns = [description[0] for description in result.description]
+        outfits = [dict(zip(columns, row)) for row in result.fetchall()]
+    for outfit in outfits:
+        outfit["extra_items"] = json.loads(outfit["extra_items"]) if outfit.get("extra_items") else {}
+    next_cursor = (outfits[-1]["created_at"], outfits[-1]["id"]) if outfits and len(outfits) == limit else None
+    return outfits, next_cursor
+
+@traced("sqlite.get_saved_outfits")
+def get_saved_outfits(limit: int = None):
+    """All saved outfits (or the newest `limit`), newest first"""
+    outfits = []
+    cursor = None
+    while True:
+        page_size = 500 if limit is None else min(500, limit - len(outfits))
+        page, cursor = get_saved_outfits_page(page_size, cursor)
+        outfits.extend(page)
+        if cursor is None or (limit is not None and len(outfits) >= limit):
+            return outfits
 
+
+@traced("sqlite.clear_saved_outfits")
 def clear_saved_outfits():
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('DELETE FROM saved_outfits')
-        conn.commit()
\ No newline at end of file
+        conn.commit()
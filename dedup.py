@@ -0,0 +1,269 @@
+"""
+Near-duplicate clustering for a collection (re-posted marketplace listings).
+
+    python dedup.py build --threshold 0.95     # cluster the whole collection
+    python dedup.py update                     # place items added since the last run
+
+`build` streams every stored vector and links pairs whose cosine is at
+least the threshold. Collections up to EXACT_LIMIT points get blocked
+all-pairs matrix products. Larger ones are first bucketed by random-
+projection LSH, and pairs are only compared within a bucket. The number of
+hyperplanes and tables is chosen so that a pair right at the threshold
+lands in a shared bucket with probability LSH_RECALL. Linked points form a
+cluster (single linkage). The member closest to the cluster's centroid
+becomes its canonical item.
+
+Every point gets a `cluster_id` (the canonical item's id) and a `canonical`
+flag in its payload. Only payloads that changed are rewritten.
+vector_db.collapse_filter() then hides the non-canonical members, so
+queries return one item per cluster.
+
+`update` only looks at points without a `cluster_id`. Each one is searched
+against the canonical items alone. If it finds one above the threshold, it
+joins that cluster. The rest are clustered among themselves and become new
+canonical items.
+"""
+import argparse
+import math
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client.models import (
+    FieldCondition, Filter, IsEmptyCondition, MatchValue, PayloadField, QueryRequest, SetPayload, SetPayloadOperation,
+)
+from collection_setup import ensure_payload_indexes
+from embeddings import _chunked
+from vector_db import VectorDatabase, create_client
+from vectors import as_matrix, normalize_rows, stack_vectors
+
+CLUSTER_FIELD = "cluster_id"
+CANONICAL_FIELD = "canonical"
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_BLOCK_SIZE = 4096
+EXACT_LIMIT = 50_000
+LSH_BUCKET_SIZE = 1024
+LSH_RECALL = 0.99
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union_pairs(self, left, right):
+        for i, j in zip(left.tolist(), right.tolist()):
+            root_i, root_j = self.find(i), self.find(j)
+            if root_i != root_j:
+                self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    def labels(self) -> np.ndarray:
+        """The root of every element"""
+        return np.array([self.find(i) for i in range(len(self.parent))], dtype=np.int64)
+
+
+def blocked_pairs(vectors: np.ndarray, threshold: float, block_size: int = DEFAULT_BLOCK_SIZE):
+    """Yield (rows, cols) index arrays of pairs i < j with cosine >= threshold; rows must be L2-normalised"""
+    count = len(vectors)
+    for start in range(0, count, block_size):
+        block = vectors[start:start + block_size]
+        for other in range(start, count, block_size):
+            rows, cols = np.nonzero(block @ vectors[other:other + block_size].T >= threshold)
+            rows, cols = rows + start, cols + other
+            keep = rows < cols
+            if keep.any():
+                yield rows[keep], cols[keep]
+
+
+def lsh_parameters(count: int, threshold: float, bucket_size: int = LSH_BUCKET_SIZE, recall: float = LSH_RECALL):
+    """
+    (hyperplanes per table, tables): enough hyperplanes for buckets of about
+    `bucket_size` points, and enough tables that a pair at `threshold`
+    shares a bucket in at least one of them with probability `recall`
+    """
+    bits = max(1, math.ceil(math.log2(max(count / bucket_size, 2))))
+    same_side = 1 - math.acos(min(max(threshold, -1.0), 1.0)) / math.pi
+    collide = same_side ** bits
+    tables = 1 if collide >= recall else math.ceil(math.log(1 - recall) / math.log(1 - collide))
+    return bits, tables
+
+
+def lsh_pairs(vectors: np.ndarray, threshold: float, block_size: int = DEFAULT_BLOCK_SIZE, seed: int = 0):
+    """Like blocked_pairs, but only pairs that share a random-projection bucket are compared"""
+    bits, tables = lsh_parameters(len(vectors), threshold)
+    rng = np.random.default_rng(seed)
+    weights = 1 << np.arange(bits, dtype=np.int64)
+    for _ in range(tables):
+        planes = rng.standard_normal((vectors.shape[1], bits)).astype(np.float32)
+        codes = ((vectors @ planes) > 0).astype(np.int64) @ weights
+        order = np.argsort(codes, kind="stable")
+        for members in np.split(order, np.flatnonzero(np.diff(codes[order])) + 1):
+            if len(members) < 2:
+                continue
+            for rows, cols in blocked_pairs(vectors[members], threshold, block_size):
+                yield members[rows], members[cols]
+
+
+def cluster(vectors: np.ndarray, threshold: float = DEFAULT_THRESHOLD, method: str = "auto",
+            block_size: int = DEFAULT_BLOCK_SIZE):
+    """
+    Cluster L2-normalised rows. Returns (labels, canonical): each row's
+    cluster label, and a boolean mask of the one canonical row per cluster.
+    method is 'exact', 'lsh' or 'auto' (exact up to EXACT_LIMIT rows).
+    """
+    count = len(vectors)
+    if method == "auto":
+        method = "exact" if count <= EXACT_LIMIT else "lsh"
+    if method not in ("exact", "lsh"):
+        raise ValueError(f"Unknown clustering method: {method}")
+    pairs = blocked_pairs if method == "exact" else lsh_pairs
+    union_find = UnionFind(count)
+    for rows, cols in pairs(vectors, threshold, block_size):
+        union_find.union_pairs(rows, cols)
+    labels = union_find.labels()
+
+    canonical = np.ones(count, dtype=bool)
+    sizes = np.bincount(labels, minlength=count)
+    grouped = np.flatnonzero(sizes[labels] > 1)
+    if len(grouped):
+        canonical[grouped] = False
+        order = grouped[np.argsort(labels[grouped], kind="stable")]
+        for members in np.split(order, np.flatnonzero(np.diff(labels[order])) + 1):
+            # The member with the highest summed similarity to the others (v . sum of the cluster)
+            member_vectors = vectors[members]
+            canonical[members[np.argmax(member_vectors @ member_vectors.sum(axis=0))]] = True
+    return labels, canonical
+
+
+def _write_clusters(vector_db: VectorDatabase, ids, labels, canonical, current=None, batch_size: int = 256):
+    """Set cluster_id/canonical on every point whose stored values differ; returns the number updated"""
+    cluster_ids = {}
+    for row in np.flatnonzero(canonical):
+        cluster_ids[labels[row]] = str(ids[row])
+    # Points sharing a payload go into one operation
+    updates = {}
+    for row, point_id in enumerate(ids):
+        payload = (cluster_ids[labels[row]], bool(canonical[row]))
+        if current is not None and current[row] == payload:
+            continue
+        updates.setdefault(payload, []).append(point_id)
+    operations = [
+        SetPayloadOperation(set_payload=SetPayload(payload={CLUSTER_FIELD: cluster_id, CANONICAL_FIELD: is_canonical},
+                                                   points=point_ids))
+        for (cluster_id, is_canonical), point_ids in updates.items()
+    ]
+    for chunk in _chunked(operations, batch_size):
+        vector_db.client.batch_update_points(collection_name=vector_db.collection_name, update_operations=chunk)
+    return sum(len(point_ids) for point_ids in updates.values())
+
+
+def _ensure_indexes(vector_db: VectorDatabase):
+    ensure_payload_indexes(vector_db.client, vector_db.collection_name, keyword_fields=(CLUSTER_FIELD,),
+                           bool_fields=(CANONICAL_FIELD,))
+
+
+def build(vector_db: VectorDatabase, threshold: float = DEFAULT_THRESHOLD, method: str = "auto",
+          block_size: int = DEFAULT_BLOCK_SIZE, page_size: int = 1024, batch_size: int = 256) -> dict:
+    """Cluster the whole collection and write cluster_id/canonical; returns counts"""
+    _ensure_indexes(vector_db)
+    ids, blocks, current = [], [], []
+    points = vector_db.iter_items(page_size=page_size, payload_fields=[CLUSTER_FIELD, CANONICAL_FIELD],
+                                  with_vectors=True)
+    # Each page becomes one normalised float32 block, so no per-point vector lists pile up
+    for page in _chunked(points, page_size):
+        ids.extend(point.id for point in page)
+        blocks.append(normalize_rows(stack_vectors(page)))
+        current.extend(((point.payload or {}).get(CLUSTER_FIELD), (point.payload or {}).get(CANONICAL_FIELD))
+                       for point in page)
+    if not ids:
+        return {"points": 0, "clusters": 0, "duplicates": 0, "updated": 0}
+    vectors = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+    blocks.clear()
+    labels, canonical = cluster(vectors, threshold, method, block_size)
+    updated = _write_clusters(vector_db, ids, labels, canonical, current, batch_size)
+    return {"points": len(ids), "clusters": int(canonical.sum()), "duplicates": int(len(ids) - canonical.sum()),
+            "updated": updated}
+
+
+def update(vector_db: VectorDatabase, threshold: float = DEFAULT_THRESHOLD, block_size: int = DEFAULT_BLOCK_SIZE,
+           page_size: int = 1024, batch_size: int = 256) -> dict:
+    """Assign points without a cluster_id, comparing them only with canonical items; returns counts"""
+    _ensure_indexes(vector_db)
+    unclustered = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key=CLUSTER_FIELD))])
+    points = list(vector_db.iter_items(page_size=page_size, with_vectors=True, scroll_filter=unclustered))
+    if not points:
+        return {"points": 0, "joined": 0, "clusters": 0, "duplicates": 0}
+    ids = [point.id for point in points]
+    vectors = normalize_rows(as_matrix([point.vector for point in points]))
+
+    # Existing clusters first: one filtered top-1 search per new point, batched
+    representatives = Filter(must=[FieldCondition(key=CANONICAL_FIELD, match=MatchValue(value=True))])
+    joined = {}
+    for start in range(0, len(ids), batch_size):
+        responses = vector_db.client.query_batch_points(
+            collection_name=vector_db.collection_name,
+            requests=[
+                QueryRequest(query=vector, filter=representatives, limit=1, score_threshold=threshold,
+                             with_payload=[CLUSTER_FIELD], with_vector=False, params=vector_db.search_params)
+                for vector in vectors[start:start + batch_size]
+            ],
+        )
+        for row, response in enumerate(responses, start):
+            if response.points:
+                hit = response.points[0]
+                joined[row] = (hit.payload or {}).get(CLUSTER_FIELD) or str(hit.id)
+
+    operations = {}
+    for row, cluster_id in joined.items():
+        operations.setdefault(cluster_id, []).append(ids[row])
+    for chunk in _chunked(operations.items(), batch_size):
+        vector_db.client.batch_update_points(collection_name=vector_db.collection_name, update_operations=[
+            SetPayloadOperation(set_payload=SetPayload(payload={CLUSTER_FIELD: cluster_id, CANONICAL_FIELD: False},
+                                                       points=point_ids))
+            for cluster_id, point_ids in chunk
+        ])
+
+    # The rest may still duplicate each other; they start new clusters
+    rest = np.array([row for row in range(len(ids)) if row not in joined], dtype=np.int64)
+    clusters = duplicates = 0
+    if len(rest):
+        labels, canonical = cluster(vectors[rest], threshold, "auto", block_size)
+        _write_clusters(vector_db, [ids[row] for row in rest], labels, canonical, batch_size=batch_size)
+        clusters, duplicates = int(canonical.sum()), int(len(rest) - canonical.sum())
+    return {"points": len(ids), "joined": len(joined), "clusters": clusters, "duplicates": duplicates}
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Find and mark near-duplicate items in a collection")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("build", "Cluster the whole collection"),
+                            ("update", "Place items without a cluster_id into existing or new clusters")):
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument("--collection", default=os.getenv("QDRANT_MARKETPLACE_COLLECTION"))
+        command.add_argument("--threshold", type=float, default=float(os.getenv("DEDUP_THRESHOLD", DEFAULT_THRESHOLD)),
+                             help="Minimum cosine similarity for two items to be duplicates")
+        command.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="Rows per similarity block")
+        command.add_argument("--location", help="Local Qdrant location instead of QDRANT_HOST, e.g. a path")
+    subparsers.choices["build"].add_argument("--method", default="auto", choices=["auto", "exact", "lsh"],
+                                             help=f"exact all-pairs, LSH buckets, or exact up to {EXACT_LIMIT} points")
+    args = parser.parse_args()
+
+    client = create_client(os.getenv("QDRANT_HOST"), os.getenv("QDRANT_THRIFT_API_KEY"), args.location)
+    vector_db = VectorDatabase(None, None, args.collection, client=client)
+    started = time.perf_counter()
+    if args.command == "build":
+        stats = build(vector_db, args.threshold, args.method, args.block_size)
+    else:
+        stats = update(vector_db, args.threshold, args.block_size)
+    print(f"{stats} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Two-tier embedding cache: an in-memory LRU in front of a SQLite table on disk.
+
+Keys are namespaced by a model fingerprint so switching models never serves
+stale vectors. TextEmbeddingCache sits in front of embed_text for the outfit
+generator, where most traffic is a small set of repeated prompts.
+ImageEmbeddingCache is keyed by a BLAKE2 hash of the image bytes, so the same
+photo is only ever run through the vision tower once.
+
+Pre-fill the cache from a prompt list (one prompt per line):
+    python embedding_cache.py warm prompts.txt
+"""
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+import metrics
+from embeddings import add_model_arguments, embed_images, embed_texts, load_model, model_fingerprint
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "embeddings.sqlite")
+
+
+def content_hash(data: bytes) -> str:
+    """128-bit BLAKE2 hash of a blob of image bytes, as hex"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def content_id(data: bytes) -> str:
+    """Deterministic point id (a UUID string) for a blob of image bytes"""
+    return str(uuid.UUID(hex=content_hash(data)))
+
+
+class EmbeddingCache:
+    def __init__(self, namespace: str, path: str = DEFAULT_CACHE_PATH, max_memory_items: int = 1024,
+                 max_disk_items: int = 100_000):
+        """
+        Cache float32 vectors under string keys within `namespace`.
+        Pass path=None for a memory-only cache.
+        """
+        self.namespace = namespace
+        self.kind = namespace.split(":", 1)[0]  # "text" / "image", for metrics labels
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Streamlit serves sessions from several threads; all access goes through self._lock
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (namespace, last_used)')
+            self._conn.commit()
+
+    def get(self, key: str):
+        """Return the cached vector for `key`, or None"""
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                metrics.increment("embedding_cache_lookups_total", cache=self.kind, result="memory_hit")
+                return vector
+            if self._conn is not None:
+                row = self._conn.execute(
+                    'SELECT vector FROM embeddings WHERE namespace = ? AND key = ?', (self.namespace, key)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._conn.execute(
+                        'UPDATE embeddings SET last_used = ? WHERE namespace = ? AND key = ?',
+                        (time.time(), self.namespace, key)
+                    )
+                    self._conn.commit()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    metrics.increment("embedding_cache_lookups_total", cache=self.kind, result="disk_hit")
+                    return vector
+            self.misses += 1
+            metrics.increment("embedding_cache_lookups_total", cache=self.kind, result="miss")
+            return None
+
+    def put(self, key: str, vector: np.ndarray):
+        self.put_many([key], [vector])
+
+    def put_many(self, keys, vectors):
+        """Store several vectors in one transaction"""
+        with self._lock:
+            rows = []
+            now = time.time()
+            for key, vector in zip(keys, vectors):
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                vector.flags.writeable = False
+                self._remember(key, vector)
+                rows.append((self.namespace, key, vector.tobytes(), now))
+            if self._conn is not None and rows:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO embeddings (namespace, key, vector, last_used) VALUES (?, ?, ?, ?)', rows
+                )
+                self._evict_disk()
+                self._conn.commit()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        count = self._conn.execute(
+            'SELECT COUNT(*) FROM embeddings WHERE namespace = ?', (self.namespace,)
+        ).fetchone()[0]
+        excess = count - self.max_disk_items
+        if excess > 0:
+            self._conn.execute('''
+            DELETE FROM embeddings WHERE namespace = ? AND key IN (
+                SELECT key FROM embeddings WHERE namespace = ? ORDER BY last_used LIMIT ?
+            )
+            ''', (self.namespace, self.namespace, excess))
+
+    def stats(self) -> dict:
+        """Hit/miss counters and the current hit rate"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def normalize_prompt(text: str) -> str:
+    """Case-fold and collapse whitespace so trivially different prompts share an entry"""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class TextEmbeddingCache(EmbeddingCache):
+    def __init__(self, model, path: str = DEFAULT_CACHE_PATH, max_memory_items: int = 1024,
+                 max_disk_items: int = 100_000):
+        """Prompt-embedding cache for one model"""
+        super().__init__(f"text:{model_fingerprint(model)}", path, max_memory_items, max_disk_items)
+
+    def embed_texts(self, texts, processor, model) -> np.ndarray:
+        """Like embeddings.embed_texts, but only runs the text encoder for prompts not cached yet"""
+        keys = [normalize_prompt(text) for text in texts]
+        found = {key: self.get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, vector in found.items() if vector is None]
+        if missing:
+            vectors = embed_texts(missing, processor, model)
+            self.put_many(missing, vectors)
+            found.update(zip(missing, vectors))
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def embed_text(self, text, processor, model) -> np.ndarray:
+        return self.embed_texts([text], processor, model)[0]
+
+    def warm_up(self, prompts, processor, model) -> int:
+        """Pre-fill the cache; returns how many prompts had to be embedded"""
+        misses_before = self.misses
+        self.embed_texts(list(prompts), processor, model)
+        return self.misses - misses_before
+
+
+class ImageEmbeddingCache(EmbeddingCache):
+    def __init__(self, model, path: str = DEFAULT_CACHE_PATH, max_memory_items: int = 4096,
+                 max_disk_items: int = 1_000_000):
+        """Image-embedding cache for one model, keyed by content_hash of the image bytes"""
+        super().__init__(f"image:{model_fingerprint(model)}", path, max_memory_items, max_disk_items)
+
+    def embed_image_bytes(self, data: bytes, processor, model):
+        """
+        Embed an image straight from its bytes (no write-then-reread round trip).
+        Returns (content hash, embedding, whether it came from the cache).
+        """
+        key = content_hash(data)
+        vector = self.get(key)
+        if vector is not None:
+            return key, vector, True
+        vector = embed_images([data], processor, model, batch_size=1, num_workers=1)[0]
+        self.put(key, vector)
+        return key, vector, False
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Manage the embedding cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    warm = subparsers.add_parser("warm", help="Pre-fill the prompt cache from a file with one prompt per line")
+    warm.add_argument("prompts", help="Prompt list file")
+    add_model_arguments(warm)
+    warm.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Cache database path")
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        with open(args.prompts, encoding="utf-8") as f:
+            prompts = [line.strip() for line in f if line.strip()]
+        processor, model = load_model(args.model, args.backend, args.threads, args.preprocess)
+        cache = TextEmbeddingCache(model, path=args.cache)
+        embedded = cache.warm_up(prompts, processor, model)
+        print(f"Warmed {len(prompts)} prompts ({embedded} newly embedded)")
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Background job queue for wardrobe uploads.
+
+The Streamlit script only submits an upload and polls its status. A small
+pool of worker threads shares the model, coalesces queued uploads into
+micro-batches, and runs them through one pass each:
+    save image -> embed (cache misses only) -> tag -> bulk upsert
+Each micro-batch is collected for up to `batch_window` seconds or
+`max_batch` jobs.
+
+A job that fails (e.g. an undecodable image) is marked failed with its
+error. If a whole batch raises, its jobs are retried one at a time so one
+bad upload can't fail the others; a batch whose upsert fails removes the
+points and files it wrote first. Once the points are stored, the jobs are
+done: a failed complement update only invalidates the complement table.
+Nothing a job does can take the worker threads, or the app, down.
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+import numpy as np
+from embedding_cache import content_hash, content_id
+from embeddings import embed_images
+from preprocess import decode_image, draft_size
+
+QUEUED, RUNNING, DONE, DUPLICATE, FAILED = "queued", "running", "done", "duplicate", "failed"
+FINISHED = (DONE, DUPLICATE, FAILED)
+
+
+class UploadJob:
+    def __init__(self, job_id: int, image_bytes: bytes, filename: str, category: str, description: str = ""):
+        self.id = job_id
+        self.image_bytes = image_bytes
+        self.filename = filename
+        self.category = category
+        self.description = description
+        self.status = QUEUED
+        self.error = None
+        self.item_id = None
+        self.tags = []
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    def finish(self, status: str, error: str = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self.image_bytes = None  # the bytes are on disk (or rejected) by now
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "filename": self.filename,
+            "category": self.category,
+            "item_id": self.item_id,
+            "tags": list(self.tags),
+            "error": self.error,
+        }
+
+
+class EmbeddingWorker:
+    def __init__(self, process_batch, workers: int = 1, batch_window: float = 0.05, max_batch: int = 16,
+                 keep_finished: float = 600.0):
+        """
+        Run `process_batch(jobs)` on micro-batches of submitted jobs from
+        `workers` daemon threads. process_batch sets each job's outcome;
+        finished jobs are kept for `keep_finished` seconds for polling.
+        """
+        self.process_batch = process_batch
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.keep_finished = keep_finished
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"embedding-worker-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, image_bytes: bytes, filename: str, category: str, description: str = "") -> int:
+        """Queue an upload from any session; returns a job id to poll"""
+        with self._lock:
+            self._prune()
+            job = UploadJob(next(self._ids), image_bytes, filename, category, description)
+            self._jobs[job.id] = job
+        self._queue.put(job)
+        return job.id
+
+    def status(self, job_id: int):
+        """The job as a dict, or None once it has been pruned"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.as_dict() if job is not None else None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_finished
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            for job in batch:
+                job.status = RUNNING
+            try:
+                self.process_batch(batch)
+            except Exception:
+                # Retry one by one so a single bad upload only fails itself
+                for job in batch:
+                    if job.status in FINISHED:
+                        continue
+                    try:
+                        self.process_batch([job])
+                    except Exception as e:
+                        job.finish(FAILED, str(e))
+            for job in batch:
+                if job.status not in FINISHED:
+                    job.finish(FAILED, "Job was not processed")
+
+
+class WardrobeUploadPipeline:
+    def __init__(self, vector_db, resources, image_dir: str = "images", complements=None, path_index=None):
+        """
+        process_batch for EmbeddingWorker. `resources()` returns
+        (processor, model, image_cache, tagger); it is called per batch
+        and may block until the model is loaded.
+        """
+        self.vector_db = vector_db
+        self.resources = resources
+        self.image_dir = image_dir
+        self.complements = complements
+        self.path_index = path_index
+
+    def _save_path(self, filename: str, key: str, claimed) -> str:
+        """
+        Where to write an upload: its own name, unless another image already
+        has it, in which case the name gets a content-hash suffix. Points
+        would otherwise be left naming a file that was overwritten.
+        """
+        filename = os.path.basename(filename)
+        save_path = os.path.join(self.image_dir, filename)
+        if save_path in claimed or os.path.exists(save_path):
+            stem, extension = os.path.splitext(filename)
+            save_path = os.path.join(self.image_dir, f"{stem}-{key[:12]}{extension}")
+        return save_path
+
+    def __call__(self, jobs):
+        processor, model, image_cache, tagger = self.resources()
+        min_size = draft_size(processor)
+        accepted, repeats, seen = [], [], set()
+        for job in jobs:
+            try:
+                # The point id comes from the image bytes, so a re-upload maps to the existing point
+                job.item_id = content_id(job.image_bytes)
+                if job.item_id in seen:
+                    # Only a duplicate once the first copy is stored; retried with it otherwise
+                    repeats.append(job)
+                    continue
+                if self.vector_db.get_item_by_id(job.item_id) is not None:
+                    job.finish(DUPLICATE)
+                    continue
+                image = decode_image(job.image_bytes, min_size)
+                accepted.append((job, image))
+                seen.add(job.item_id)
+            except Exception as e:
+                job.finish(FAILED, f"Error reading image: {str(e)}")
+        if not accepted:
+            return
+
+        # Embed only the images the cache hasn't seen, in one forward pass
+        keys = [content_hash(job.image_bytes) for job, _ in accepted]
+        vectors = [image_cache.get(key) if image_cache is not None else None for key in keys]
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        if misses:
+            new_vectors = embed_images([accepted[i][1] for i in misses], processor, model, batch_size=len(misses),
+                                       num_workers=1)
+            for i, vector in zip(misses, new_vectors):
+                vectors[i] = vector
+            if image_cache is not None:
+                image_cache.put_many([keys[i] for i in misses], new_vectors)
+        embeddings = np.stack(vectors)
+        all_tags = tagger.tag(embeddings) if tagger else [[] for _ in accepted]
+
+        ids, payloads, claimed, written = [], [], set(), []
+        try:
+            for (job, _), tags, key in zip(accepted, all_tags, keys):
+                # Save the original bytes as-is instead of re-encoding the image
+                save_path = self._save_path(job.filename, key, claimed)
+                claimed.add(save_path)
+                existed = os.path.exists(save_path)
+                with open(save_path, "wb") as f:
+                    f.write(job.image_bytes)
+                if not existed:
+                    written.append(save_path)
+                if self.path_index is not None:
+                    self.path_index.invalidate(save_path)
+                job.tags = tags
+                ids.append(job.item_id)
+                payloads.append({
+                    "image_path": save_path,
+                    "category": job.category,
+                    "description": job.description,
+                    "tags": tags or [],
+                    "content_hash": key,
+                })
+            self.vector_db.add_items(ids, embeddings, payloads)
+        except Exception:
+            self._discard(ids, written)
+            raise
+        for job, _ in accepted:
+            job.finish(DONE)
+        for job in repeats:
+            job.finish(DUPLICATE)
+
+        if self.complements is not None:
+            try:
+                self.complements.add_wardrobe_items(ids, embeddings, payloads)
+            except Exception as e:
+                # The uploads are stored; dropping the stored ideas makes the app fall back to live queries
+                print(f"Error updating complements, invalidating them: {str(e)}")
+                self.complements.invalidate()
+
+    def _discard(self, ids, paths):
+        """Undo a batch whose upsert failed, so its retry starts clean instead of finding its own leftovers"""
+        try:
+            # Upserts go out in batches, so some of the points may have landed
+            self.vector_db.delete_items(ids)
+        except Exception as e:
+            print(f"Error removing points of a failed upload batch: {str(e)}")
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            if self.path_index is not None:
+                self.path_index.invalidate(path)
@@ -1,26 +1,167 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from PIL import Image
-import torch
 import numpy as np
+from metrics import traced
+from preprocess import ImagePreprocessor, decode_image, draft_size
+# torch and transformers take seconds to import, so they are imported where first needed
+
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_DECODE_WORKERS = 4
+DEFAULT_MODEL_PATH = "./model"
+
+
+def load_model(model_path=DEFAULT_MODEL_PATH, backend: str = "torch", num_threads: int = None,
+               preprocess: str = "processor"):
+    """
+    Load the CLIP processor and model from a local directory.
+    backend is 'torch' (eager), 'int8' (dynamically quantised) or 'onnx'
+    (ONNX Runtime); num_threads caps intra-op threads for any of them.
+    preprocess='numpy' turns image batches into pixel values with
+    preprocess.ImagePreprocessor instead of the processor's per-image path.
+    """
+    from transformers import AutoProcessor, AutoModelForZeroShotImageClassification
+
+    processor = AutoProcessor.from_pretrained(model_path)
+    if preprocess == "numpy":
+        processor.pixel_preprocessor = ImagePreprocessor(processor)
+    elif preprocess != "processor":
+        raise ValueError(f"Unknown preprocess mode: {preprocess}")
+    model = AutoModelForZeroShotImageClassification.from_pretrained(model_path)
+    model.eval()
+    if backend != "torch" or num_threads:
+        from inference import load_backend
+        model = load_backend(model, processor, backend, num_threads)
+    return processor, model
+
+
+def add_model_arguments(parser, model_help: str = "Path to the CLIP model"):
+    """
+    --model, --backend, --threads and --preprocess for a CLI that embeds.
+    They default to the app's EMBEDDING_* settings, so vectors and cache
+    entries come from the same backend the app uses.
+    """
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help=model_help)
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"), choices=["torch", "int8", "onnx"],
+                        help="Inference backend (defaults to EMBEDDING_BACKEND)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBEDDING_THREADS", 0)) or None,
+                        help="Intra-op inference threads (defaults to EMBEDDING_THREADS)")
+    parser.add_argument("--preprocess", default=os.getenv("EMBEDDING_PREPROCESS", "processor"),
+                        choices=["processor", "numpy"], help="Image preprocessing path (defaults to EMBEDDING_PREPROCESS)")
+
+
+def model_fingerprint(model):
+    """Identify a model by its name/path and configuration, for cache keys"""
+    config = getattr(model, "config", None)
+    name = getattr(config, "_name_or_path", "") or type(model).__name__
+    config_json = config.to_json_string() if config is not None else ""
+    # Quantised/ONNX backends give slightly different vectors, so they get their own namespace
+    backend = getattr(model, "inference_backend", "torch")
+    if backend != "torch":
+        name = f"{name}\n{backend}"
+    return hashlib.blake2b(f"{name}\n{config_json}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _normalize_rows(embeddings):
+    """L2-normalise each row of an (N, D) matrix independently"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    # Guard against all-zero rows so they stay zero instead of becoming NaN
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def _chunked(iterable, size):
+    """Yield lists of at most `size` items from any iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@traced("embed_images")
+def embed_images(images, processor, model, batch_size=DEFAULT_BATCH_SIZE, num_workers=DEFAULT_DECODE_WORKERS,
+                 draft: bool = True):
+    """
+    Embed an iterable of image paths, bytes, file-like objects or PIL images.
+    Returns an L2-normalised (N, D) float32 matrix, one row per input.
+    Decoding of the next micro-batch runs in a thread pool while the
+    current one is going through the model. With `draft`, JPEGs are decoded
+    at a reduced scale that is still above the model's input size.
+    """
+    min_size = draft_size(processor) if draft else None
+    batches = []
+    with ThreadPoolExecutor(max_workers=max(1, num_workers)) as pool:
+        pending = None
+        for chunk in _chunked(images, batch_size):
+            # Submit decoding for this chunk before running inference on the previous one
+            decoding = [pool.submit(decode_image, image, min_size) for image in chunk]
+            if pending is not None:
+                batches.append(_image_batch_features(pending, processor, model))
+            pending = [future.result() for future in decoding]
+        if pending is not None:
+            batches.append(_image_batch_features(pending, processor, model))
+
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32)
+    return _normalize_rows(np.concatenate(batches, axis=0))
+
+
+def _image_batch_features(images, processor, model):
+    import torch
+
+    pixel_preprocessor = getattr(processor, "pixel_preprocessor", None)
+    if pixel_preprocessor is not None:
+        inputs = {"pixel_values": torch.from_numpy(pixel_preprocessor(images))}
+    else:
+        inputs = processor(images=images, return_tensors="pt")
 
-def embed_image(image_path, processor, model):
-    image = Image.open(image_path)
-    inputs = processor(images=image, return_tensors="pt")
-    
     with torch.no_grad():
         outputs = model.get_image_features(**inputs)
-    
-    embeddings = outputs.numpy()
-    embeddings = embeddings / np.linalg.norm(embeddings)
-    
-    return embeddings[0]
 
+    return outputs.numpy()
+
+
+@traced("embed_texts")
+def embed_texts(texts, processor, model, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Embed an iterable of strings.
+    Returns an L2-normalised (N, D) float32 matrix, one row per input.
+    """
+    import torch
+
+    batches = []
+    for chunk in _chunked(texts, batch_size):
+        inputs = processor(text=chunk, return_tensors="pt", padding=True)
+
+        with torch.no_grad():
+            outputs = model.get_text_features(**inputs)
+
+        batches.append(outputs.numpy())
+
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32)
+    return _normalize_rows(np.concatenate(batches, axis=0))
+
+
+@traced("embed_image")
+def embed_image(image_path, processor, model):
+    return embed_images([image_path], processor, model, batch_size=1, num_workers=1)[0]
+
+
+@traced("embed_text")
 def embed_text(text, processor, model):
-    inputs = processor(text=text, return_tensors="pt", padding=True)
-    
-    with torch.no_grad():
-        outputs = model.get_text_features(**inputs)
-    
-    embeddings = outputs.numpy()
-    embeddings = embeddings / np.linalg.norm(embeddings)
-    
-    return embeddings[0]
\ No newline at end of file
+    return embed_texts([text], processor, model, batch_size=1)[0]
+
+
+def warm_up(processor, model, batch_size=4):
+    """
+    Run a dummy text and image batch through the model so the first real
+    query doesn't pay for lazy initialisation (kernels, allocator, ONNX graph).
+    """
+    embed_texts(["warm up"] * batch_size, processor, model, batch_size=batch_size)
+    embed_images([Image.new("RGB", (224, 224))] * batch_size, processor, model, batch_size=batch_size, num_workers=1)
@@ -0,0 +1,142 @@
+"""
+CPU inference backends for the CLIP model.
+
+embeddings.load_model(backend=...) picks one of:
+    torch  - the eager PyTorch model (default)
+    int8   - the same model with its Linear layers dynamically quantised to int8
+    onnx   - vision and text towers exported to ONNX and run with ONNX Runtime
+
+Every backend exposes get_image_features / get_text_features, so
+embed_images and embed_texts work with any of them unchanged.
+
+Check parity against the eager model and compare throughput with:
+    python benchmarks/inference_backends.py --model ./model
+"""
+import os
+import torch
+import numpy as np
+
+BACKENDS = ("torch", "int8", "onnx")
+DEFAULT_ONNX_DIR = os.path.join(".cache", "onnx")
+ONNX_OPSET = 17
+
+
+def set_num_threads(num_threads: int = None):
+    """
+    Cap PyTorch's intra-op thread pool so several workers can share a host.
+    ONNX Runtime sessions take the same value through OnnxClipModel.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # can only be set once, before any parallel work has started
+
+
+def quantize_model(model):
+    """Dynamic int8 quantisation of every Linear layer (weights int8, activations quantised on the fly)"""
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    quantized.inference_backend = "int8"
+    return quantized
+
+
+class _VisionTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+def export_onnx(model, processor, export_dir: str):
+    """Export the vision and text towers as two ONNX graphs with dynamic batch (and sequence) axes"""
+    os.makedirs(export_dir, exist_ok=True)
+    image_size = processor.image_processor.crop_size
+    pixel_values = torch.zeros(1, 3, image_size["height"], image_size["width"])
+    text_inputs = processor(text=["a photo of clothing"], return_tensors="pt", padding=True)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _VisionTower(model), (pixel_values,), os.path.join(export_dir, "vision.onnx"),
+            input_names=["pixel_values"], output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=ONNX_OPSET, dynamo=False,
+        )
+        torch.onnx.export(
+            _TextTower(model), (text_inputs["input_ids"], text_inputs["attention_mask"]),
+            os.path.join(export_dir, "text.onnx"),
+            input_names=["input_ids", "attention_mask"], output_names=["text_embeds"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "text_embeds": {0: "batch"},
+            },
+            opset_version=ONNX_OPSET, dynamo=False,
+        )
+
+
+class OnnxClipModel:
+    def __init__(self, model, processor, export_dir: str = None, num_threads: int = None):
+        """
+        ONNX Runtime stand-in for a CLIP model. The towers are exported once
+        per model fingerprint under export_dir and reused afterwards.
+        """
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx backend needs onnxruntime (pip install onnx onnxruntime)") from e
+        from embeddings import model_fingerprint
+
+        self.config = model.config
+        self.inference_backend = "onnx"
+        self.export_dir = export_dir or os.path.join(DEFAULT_ONNX_DIR, model_fingerprint(model))
+        if not all(os.path.exists(os.path.join(self.export_dir, f"{tower}.onnx")) for tower in ("vision", "text")):
+            export_onnx(model, processor, self.export_dir)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        providers = ["CPUExecutionProvider"]
+        self.vision = onnxruntime.InferenceSession(os.path.join(self.export_dir, "vision.onnx"), options, providers=providers)
+        self.text = onnxruntime.InferenceSession(os.path.join(self.export_dir, "text.onnx"), options, providers=providers)
+
+    def eval(self):
+        return self
+
+    def get_image_features(self, pixel_values, **kwargs):
+        outputs = self.vision.run(None, {"pixel_values": pixel_values.numpy().astype(np.float32)})
+        return torch.from_numpy(outputs[0])
+
+    def get_text_features(self, input_ids, attention_mask=None, **kwargs):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        outputs = self.text.run(None, {
+            "input_ids": input_ids.numpy().astype(np.int64),
+            "attention_mask": attention_mask.numpy().astype(np.int64),
+        })
+        return torch.from_numpy(outputs[0])
+
+
+def load_backend(model, processor, backend: str = "torch", num_threads: int = None):
+    """Wrap an eager model in the requested backend"""
+    set_num_threads(num_threads)
+    if backend == "torch":
+        return model
+    if backend == "int8":
+        return quantize_model(model)
+    if backend == "onnx":
+        return OnnxClipModel(model, processor, num_threads=num_threads)
+    raise ValueError(f"Unknown inference backend '{backend}', expected one of {', '.join(BACKENDS)}")
@@ -0,0 +1,299 @@
+"""
+Bulk ingestion of clothing images into a Qdrant collection.
+
+Usage:
+    python ingest.py marketplace-images/ --collection marketplace --manifest items.csv
+    python ingest.py clothes-images/ --collection clothes --category top
+
+Points get ids derived from the image content hash, so re-running over the
+same tree only overwrites existing points. Completed files are appended to a
+checkpoint file after every upsert, which lets an interrupted run resume.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from collection_setup import ensure_collection, settings_from_env
+from complements import ComplementTable
+from dedup import DEFAULT_THRESHOLD as DEFAULT_DEDUP_THRESHOLD, update as dedup_update
+from embeddings import add_model_arguments, embed_images, load_model, _chunked
+from embedding_cache import ImageEmbeddingCache, content_hash, content_id
+from preprocess import decode_image, draft_size
+from tagging import AutoTagger, parse_clothing_tags
+from thumbnails import ThumbnailCache
+from vector_db import VectorDatabase, create_client
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+MANIFEST_FIELDS = ("product_name", "price", "category", "tags", "description")
+
+
+def find_images(root: str):
+    """Yield image paths under `root` relative to it, in a stable order"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, "/")
+
+
+def _parse_tags(tags):
+    if tags is None or isinstance(tags, list):
+        return tags
+    return [tag.strip() for tag in re.split(r"[,;|]", str(tags)) if tag.strip()]
+
+
+def _parse_price(price):
+    try:
+        return float(price)
+    except (TypeError, ValueError):
+        return price
+
+
+def load_manifest(manifest_path: str) -> dict:
+    """
+    Load a CSV or JSON manifest keyed by image path (relative to the image root).
+    CSV files need an `image` (or `filename`) column; JSON may be a list of such
+    records or an object mapping image paths to fields.
+    """
+    if not manifest_path:
+        return {}
+
+    if manifest_path.lower().endswith(".json"):
+        with open(manifest_path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            records = [{"image": key, **value} for key, value in data.items()]
+        else:
+            records = data
+    else:
+        with open(manifest_path, newline="", encoding="utf-8") as f:
+            records = list(csv.DictReader(f))
+
+    manifest = {}
+    for record in records:
+        key = record.get("image") or record.get("filename") or record.get("image_path")
+        if not key:
+            continue
+        fields = {field: record[field] for field in MANIFEST_FIELDS if record.get(field) not in (None, "")}
+        if "tags" in fields:
+            fields["tags"] = _parse_tags(fields["tags"])
+        if "price" in fields:
+            fields["price"] = _parse_price(fields["price"])
+        manifest[key.replace(os.sep, "/")] = fields
+    return manifest
+
+
+def load_checkpoint(checkpoint_path: str) -> set:
+    """Return the set of relative image paths already ingested"""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def _append_checkpoint(checkpoint_path: str, paths):
+    if not checkpoint_path:
+        return
+    with open(checkpoint_path, "a", encoding="utf-8") as f:
+        f.writelines(f"{path}\n" for path in paths)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_image(root: str, rel_path: str, image_cache: ImageEmbeddingCache = None, min_size: int = None):
+    """
+    Read and hash one file, then decode it (JPEGs in draft mode down to
+    `min_size`) unless its embedding is already cached; runs inside the
+    prefetch pool.
+    """
+    with open(os.path.join(root, rel_path), "rb") as f:
+        data = f.read()
+    key = content_hash(data)
+    vector = image_cache.get(key) if image_cache is not None else None
+    image = None
+    if vector is None:
+        image = decode_image(data, min_size)
+    return rel_path, content_id(data), key, image, vector
+
+
+def _prefetched_batches(root: str, paths, batch_size: int, num_workers: int, image_cache: ImageEmbeddingCache = None,
+                        min_size: int = None):
+    """Decode the next batch in a thread pool while the caller works on the current one"""
+    with ThreadPoolExecutor(max_workers=max(1, num_workers)) as pool:
+        pending = []
+        for chunk in _chunked(paths, batch_size):
+            futures = [pool.submit(_read_image, root, rel_path, image_cache, min_size) for rel_path in chunk]
+            # A batch where nothing decoded is dropped rather than handed on empty
+            if pending:
+                yield pending
+            pending = []
+            for rel_path, future in zip(chunk, futures):
+                try:
+                    pending.append(future.result())
+                except Exception as e:
+                    print(f"Skipping {rel_path}: {str(e)}")
+        if pending:
+            yield pending
+
+
+def ingest(root: str, vector_db: VectorDatabase, processor, model, manifest: dict = None, category: str = None,
+           checkpoint_path: str = None, batch_size: int = 32, upsert_batch_size: int = 256, num_workers: int = 4,
+           embed_fn=embed_images, tagger=None, tag_top_k: int = 5, tag_threshold: float = 0.2,
+           image_cache: ImageEmbeddingCache = None, thumbnails: ThumbnailCache = None,
+           complements: ComplementTable = None, complements_wardrobe_db: VectorDatabase = None, draft: bool = True):
+    """
+    Embed every image under `root` and upsert it into `vector_db`'s collection.
+    With a `tagger`, zero-shot tags from the same embeddings are written to
+    `auto_tags` (and to `tags` where the manifest has none). With an
+    `image_cache`, images whose bytes were embedded before skip decoding and
+    inference. With `thumbnails`, grid thumbnails are written from the
+    images decoded here. With `complements`, the complement table is updated
+    as items land: pass `complements_wardrobe_db` when ingesting marketplace
+    items (they are matched against that wardrobe), leave it unset when
+    ingesting wardrobe items. With `draft`, JPEGs are decoded at the
+    smallest scale that still covers the model input and the thumbnails.
+    Returns a dict with counts and throughput.
+    """
+    manifest = manifest or {}
+    done = load_checkpoint(checkpoint_path)
+    paths = (path for path in find_images(root) if path not in done)
+
+    min_size = draft_size(processor) if draft else None
+    if min_size and thumbnails is not None:
+        min_size = max(min_size, *thumbnails.size)
+
+    started = time.perf_counter()
+    ingested = 0
+    buffer_ids, buffer_vectors, buffer_payloads, buffer_paths = [], [], [], []
+    collection_ready = False
+
+    def flush():
+        nonlocal ingested, collection_ready
+        if not buffer_ids:
+            return
+        if not collection_ready:
+            # Creates the collection (with payload indexes) or migrates its settings, once per run
+            ensure_collection(vector_db.client, vector_db.collection_name, len(buffer_vectors[0]), **settings_from_env())
+            collection_ready = True
+        vector_db.add_items(buffer_ids, buffer_vectors, buffer_payloads, batch_size=upsert_batch_size)
+        if complements is not None and complements_wardrobe_db is not None:
+            complements.add_marketplace_items(buffer_ids, buffer_vectors, buffer_payloads, complements_wardrobe_db)
+        elif complements is not None:
+            complements.add_wardrobe_items(buffer_ids, buffer_vectors, buffer_payloads)
+        _append_checkpoint(checkpoint_path, buffer_paths)
+        ingested += len(buffer_ids)
+        elapsed = time.perf_counter() - started
+        print(f"Ingested {ingested} items ({ingested / elapsed:.1f} items/sec)")
+        buffer_ids.clear()
+        buffer_vectors.clear()
+        buffer_payloads.clear()
+        buffer_paths.clear()
+
+    for batch in _prefetched_batches(root, paths, batch_size, num_workers, image_cache, min_size):
+        # Only run the model for images that were not in the cache
+        misses = [i for i, (_, _, _, _, vector) in enumerate(batch) if vector is None]
+        embeddings = [vector for _, _, _, _, vector in batch]
+        if misses:
+            new_vectors = embed_fn([batch[i][3] for i in misses], processor, model, batch_size=batch_size)
+            for i, vector in zip(misses, new_vectors):
+                embeddings[i] = vector
+            if image_cache is not None:
+                image_cache.put_many([batch[i][2] for i in misses], new_vectors)
+        embeddings = np.stack(embeddings)
+        if thumbnails is not None:
+            for rel_path, _, key, image, _ in batch:
+                if image is not None:
+                    thumbnails.put_image(key, image, os.path.join(root, rel_path))
+        auto_tags = tagger.tag(embeddings, tag_top_k, tag_threshold) if tagger else [None] * len(batch)
+        for (rel_path, point_id, item_hash, _, _), embedding, item_tags in zip(batch, embeddings, auto_tags):
+            fields = manifest.get(rel_path) or manifest.get(os.path.basename(rel_path)) or {}
+            payload = {
+                "image_path": os.path.join(root, rel_path),
+                "category": fields.get("category") or category or os.path.basename(os.path.dirname(rel_path)) or None,
+                **{key: value for key, value in fields.items() if key != "category"},
+                "content_hash": item_hash,
+            }
+            if item_tags is not None:
+                payload["auto_tags"] = item_tags
+                payload.setdefault("tags", item_tags)
+            buffer_ids.append(point_id)
+            buffer_vectors.append(embedding)
+            buffer_payloads.append(payload)
+            buffer_paths.append(rel_path)
+        if len(buffer_ids) >= upsert_batch_size:
+            flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "ingested": ingested,
+        "skipped": len(done),
+        "seconds": elapsed,
+        "items_per_sec": ingested / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Bulk-ingest clothing images into a Qdrant collection")
+    parser.add_argument("root", help="Directory tree of images")
+    parser.add_argument("--collection", default=os.getenv("QDRANT_MARKETPLACE_COLLECTION"),
+                        help="Target collection (defaults to QDRANT_MARKETPLACE_COLLECTION)")
+    parser.add_argument("--manifest", help="CSV or JSON file with product_name, price, category, tags per image")
+    parser.add_argument("--category", help="Category for images the manifest does not cover")
+    parser.add_argument("--checkpoint", help="Checkpoint file (defaults to .ingest-<collection>.ckpt in the root)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per forward pass")
+    parser.add_argument("--upsert-batch-size", type=int, default=256, help="Points per Qdrant upsert")
+    parser.add_argument("--workers", type=int, default=4, help="Image decode threads")
+    add_model_arguments(parser)
+    parser.add_argument("--full-decode", action="store_true", help="Decode JPEGs at full size instead of in draft mode")
+    parser.add_argument("--location", help="Local Qdrant location instead of QDRANT_HOST, e.g. ':memory:' or a path")
+    parser.add_argument("--auto-tag", action="store_true", help="Zero-shot tag items from CLOTHING_TAGS")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the content-addressed embedding cache")
+    parser.add_argument("--thumbnails", action="store_true", help="Also write grid thumbnails")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Afterwards, place the new items into near-duplicate clusters (dedup.py update)")
+    parser.add_argument("--update-complements", action="store_true",
+                        help="Keep the marketplace -> wardrobe complement table current")
+    args = parser.parse_args()
+
+    client = create_client(os.getenv("QDRANT_HOST"), os.getenv("QDRANT_THRIFT_API_KEY"), args.location)
+    vector_db = VectorDatabase(None, None, args.collection, client=client)
+
+    checkpoint = args.checkpoint or os.path.join(args.root, f".ingest-{args.collection}.ckpt")
+    processor, model = load_model(args.model, args.backend, args.threads, args.preprocess)
+    tagger = AutoTagger(parse_clothing_tags(os.getenv("CLOTHING_TAGS")), processor, model) if args.auto_tag else None
+    complements, complements_wardrobe_db = None, None
+    if args.update_complements:
+        complements = ComplementTable(os.getenv("COMPLEMENTS_PATH", os.path.join(".cache", "complements.sqlite")),
+                                      k=int(os.getenv("COMPLEMENTS_TOP_K", 5)))
+        if args.collection != os.getenv("QDRANT_WARDROBE_COLLECTION"):
+            complements_wardrobe_db = VectorDatabase(None, None, os.getenv("QDRANT_WARDROBE_COLLECTION"), client=client)
+    stats = ingest(
+        args.root, vector_db, processor, model,
+        manifest=load_manifest(args.manifest),
+        category=args.category,
+        checkpoint_path=checkpoint,
+        batch_size=args.batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        num_workers=args.workers,
+        tagger=tagger,
+        image_cache=None if args.no_cache else ImageEmbeddingCache(model),
+        thumbnails=ThumbnailCache() if args.thumbnails else None,
+        complements=complements,
+        complements_wardrobe_db=complements_wardrobe_db,
+        draft=not args.full_decode,
+    )
+    print(f"Done: {stats['ingested']} ingested, {stats['skipped']} already done, "
+          f"{stats['items_per_sec']:.1f} items/sec")
+    if args.dedup:
+        print(f"Dedup: {dedup_update(vector_db, float(os.getenv('DEDUP_THRESHOLD', DEFAULT_DEDUP_THRESHOLD)))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,574 @@
+"""
+Local NumPy vector index that stands in for QdrantClient.
+
+LocalVectorStore implements the subset of the QdrantClient API that
+VectorDatabase, ingest.py and tagging.py use (upsert, query_points,
+query_batch_points, retrieve, scroll, count, delete, set_payload, ...) and
+returns the same qdrant_client model objects, so it can be passed as
+VectorDatabase(client=...) with no other changes. Select it with
+VECTOR_BACKEND=local.
+
+Each collection keeps its vectors in one (capacity, D) float32 or float16
+matrix, memory-mapped from disk when the store has a path, with payloads in
+a small SQLite table next to it. Category postings (payload value -> rows)
+make filtered search touch only matching rows, and search itself is a
+blocked brute-force matrix product with argpartition top-k selection.
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+import numpy as np
+from qdrant_client.http.models import (
+    CountResult, Datatype, Distance, FieldCondition, Filter, HasIdCondition, IsEmptyCondition, MatchAny, MatchValue,
+    PointIdsList, QueryResponse, Record, ScoredPoint, SetPayloadOperation, UpdateResult, UpdateStatus, VectorParams,
+)
+
+DEFAULT_BLOCK_SIZE = 65_536
+DEFAULT_INDEXED_FIELDS = ("category",)
+_COMPLETED = UpdateResult(operation_id=0, status=UpdateStatus.COMPLETED)
+
+
+def _point_key(point_id):
+    """Normalise a point id the way Qdrant does (unsigned int or UUID)"""
+    if isinstance(point_id, (int, np.integer)) and not isinstance(point_id, bool):
+        return int(point_id)
+    if isinstance(point_id, uuid.UUID):
+        return str(point_id)
+    try:
+        return str(uuid.UUID(str(point_id)))
+    except ValueError:
+        raise ValueError(f"Point id '{point_id}' is neither an unsigned integer nor a UUID")
+
+
+def _select_payload(payload, with_payload):
+    if not with_payload:
+        return None
+    if with_payload is True:
+        return dict(payload)
+    return {key: payload[key] for key in with_payload if key in payload}
+
+
+def _condition_values(condition: FieldCondition):
+    match = condition.match
+    if isinstance(match, MatchValue):
+        return {match.value}
+    if isinstance(match, MatchAny):
+        return set(match.any)
+    raise ValueError(f"Unsupported match for the local index: {type(match).__name__}")
+
+
+class LocalCollection:
+    def __init__(self, name: str, size: int, distance: Distance, dtype: str = "float32", path: str = None,
+                 indexed_fields=DEFAULT_INDEXED_FIELDS, block_size: int = DEFAULT_BLOCK_SIZE):
+        if distance not in (Distance.COSINE, Distance.DOT):
+            raise ValueError(f"Local index supports Cosine and Dot distance, not {distance}")
+        self.name = name
+        self.size = size
+        self.distance = distance
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.indexed_fields = tuple(indexed_fields)
+        self.block_size = block_size
+        self.lock = threading.RLock()
+
+        self._ids = []            # row -> point id
+        self._rows = {}           # point id -> row
+        self._payloads = []       # row -> payload dict
+        self._alive = np.zeros(0, dtype=bool)
+        self._postings = {field: {} for field in self.indexed_fields}  # field -> value -> set of rows
+        self._posting_arrays = {}
+        self._vectors = np.zeros((0, size), dtype=self.dtype)
+        self._conn = None
+        if path:
+            self._open(path)
+
+    # --- storage -----------------------------------------------------------
+
+    def _open(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        config_path = os.path.join(path, "config.json")
+        if not os.path.exists(config_path):
+            with open(config_path, "w", encoding="utf-8") as f:
+                json.dump({"size": self.size, "distance": self.distance.value, "dtype": self.dtype.name}, f)
+        self._conn = sqlite3.connect(os.path.join(path, "points.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS points (
+            row INTEGER PRIMARY KEY,
+            point_id TEXT NOT NULL UNIQUE,
+            payload TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        self._conn.commit()
+
+        rows = self._conn.execute('SELECT row, point_id, payload, deleted FROM points ORDER BY row').fetchall()
+        count = rows[-1][0] + 1 if rows else 0
+        self._map_vectors(max(count, 1024))
+        self._ids = [None] * count
+        self._payloads = [None] * count
+        for row, point_id, payload, deleted in rows:
+            point_id = json.loads(point_id)
+            self._ids[row] = point_id
+            self._payloads[row] = json.loads(payload)
+            if not deleted:
+                self._rows[point_id] = row
+                self._alive[row] = True
+                self._index_payload(row)
+
+    def _vectors_path(self):
+        return os.path.join(self.path, "vectors.bin")
+
+    def _map_vectors(self, capacity: int):
+        """(Re)map the vector file with room for `capacity` rows"""
+        row_bytes = self.size * self.dtype.itemsize
+        vectors_path = self._vectors_path()
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        with open(vectors_path, "ab") as f:
+            if f.tell() < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+        capacity = os.path.getsize(vectors_path) // row_bytes
+        self._vectors = np.memmap(vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self.size))
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _ensure_capacity(self, rows_needed: int):
+        capacity = self._vectors.shape[0]
+        if rows_needed <= capacity:
+            return
+        new_capacity = max(1024, capacity * 2, rows_needed)
+        if self.path:
+            self._map_vectors(new_capacity)
+        else:
+            vectors = np.zeros((new_capacity, self.size), dtype=self.dtype)
+            vectors[:capacity] = self._vectors
+            self._vectors = vectors
+            alive = np.zeros(new_capacity, dtype=bool)
+            alive[:capacity] = self._alive
+            self._alive = alive
+
+    def _persist(self, rows):
+        if self._conn is None:
+            return
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO points (row, point_id, payload, deleted) VALUES (?, ?, ?, ?)',
+            [(row, json.dumps(self._ids[row]), json.dumps(self._payloads[row]), int(not self._alive[row]))
+             for row in rows]
+        )
+        self._conn.commit()
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+
+    def close(self):
+        with self.lock:
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- payload postings --------------------------------------------------
+
+    def _index_payload(self, row: int, fields=None):
+        payload = self._payloads[row]
+        for field in fields or self.indexed_fields:
+            values = payload.get(field)
+            for value in values if isinstance(values, list) else [values]:
+                if value is not None:
+                    self._postings[field].setdefault(value, set()).add(row)
+                    self._posting_arrays.pop((field, value), None)
+
+    def add_indexed_field(self, field: str):
+        """Start keeping postings for another payload field (e.g. tags)"""
+        with self.lock:
+            if field in self.indexed_fields:
+                return
+            self.indexed_fields += (field,)
+            self._postings[field] = {}
+            for row in np.flatnonzero(self._alive[:len(self._payloads)]):
+                self._index_payload(int(row), (field,))
+
+    def _unindex_payload(self, row: int):
+        payload = self._payloads[row] or {}
+        for field in self.indexed_fields:
+            values = payload.get(field)
+            for value in values if isinstance(values, list) else [values]:
+                postings = self._postings[field].get(value)
+                if postings is not None:
+                    postings.discard(row)
+                    self._posting_arrays.pop((field, value), None)
+
+    def _posting_rows(self, field, value) -> np.ndarray:
+        key = (field, value)
+        rows = self._posting_arrays.get(key)
+        if rows is None:
+            rows = np.fromiter(sorted(self._postings[field].get(value, ())), dtype=np.int64)
+            self._posting_arrays[key] = rows
+        return rows
+
+    def _matches(self, payload, condition: FieldCondition) -> bool:
+        value = payload.get(condition.key)
+        values = value if isinstance(value, list) else [value]
+        return any(v in _condition_values(condition) for v in values)
+
+    def _condition_rows(self, condition) -> np.ndarray:
+        if isinstance(condition, HasIdCondition):
+            rows = [self._rows[key] for key in map(_point_key, condition.has_id) if key in self._rows]
+            return np.unique(np.asarray(rows, dtype=np.int64))
+        if isinstance(condition, FieldCondition):
+            if condition.key in self._postings:
+                arrays = [self._posting_rows(condition.key, value) for value in _condition_values(condition)]
+                return np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+            live = np.flatnonzero(self._alive[:len(self._ids)])
+            return np.asarray([row for row in live if self._matches(self._payloads[row], condition)], dtype=np.int64)
+        if isinstance(condition, IsEmptyCondition):
+            # Like Qdrant: a missing key, null and [] all count as empty
+            live = np.flatnonzero(self._alive[:len(self._ids)])
+            key = condition.is_empty.key
+            return np.asarray([row for row in live if self._payloads[row].get(key) in (None, [])], dtype=np.int64)
+        raise ValueError(f"Unsupported filter condition for the local index: {type(condition).__name__}")
+
+    def candidate_rows(self, query_filter: Filter = None):
+        """Sorted rows matching the filter, or None meaning every live row"""
+        if query_filter is None or not (query_filter.must or query_filter.must_not):
+            return None
+        rows = None
+        for condition in query_filter.must or []:
+            matched = self._condition_rows(condition)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        if rows is None:
+            rows = np.flatnonzero(self._alive[:len(self._ids)])
+        for condition in query_filter.must_not or []:
+            rows = np.setdiff1d(rows, self._condition_rows(condition), assume_unique=True)
+        return rows[self._alive[rows]]
+
+    # --- writes ------------------------------------------------------------
+
+    def upsert(self, points):
+        points = list(points)
+        self.upsert_matrix([point.id for point in points], [point.vector for point in points],
+                           [point.payload for point in points])
+
+    def upsert_matrix(self, ids, vectors, payloads=None):
+        """Upsert an (N, D) matrix of vectors with parallel ids and payloads"""
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        if vectors.shape[1] != self.size:
+            raise ValueError(f"Expected vectors of size {self.size}, got {vectors.shape[1]}")
+        if self.distance == Distance.COSINE:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors = vectors / norms
+        payloads = payloads if payloads is not None else [None] * len(ids)
+        with self.lock:
+            touched = []
+            for point_id, vector, payload in zip(ids, vectors, payloads):
+                key = _point_key(point_id)
+                row = self._rows.get(key)
+                if row is None:
+                    row = len(self._ids)
+                    self._ensure_capacity(row + 1)
+                    self._ids.append(key)
+                    self._payloads.append({})
+                    self._rows[key] = row
+                    self._alive[row] = True
+                else:
+                    self._unindex_payload(row)
+                self._vectors[row] = vector
+                self._payloads[row] = dict(payload or {})
+                self._index_payload(row)
+                touched.append(row)
+            self._persist(touched)
+
+    def set_payload(self, payload: dict, point_ids, overwrite: bool = False):
+        with self.lock:
+            touched = []
+            for key in map(_point_key, point_ids):
+                row = self._rows.get(key)
+                if row is None:
+                    continue
+                self._unindex_payload(row)
+                self._payloads[row] = dict(payload) if overwrite else {**self._payloads[row], **payload}
+                self._index_payload(row)
+                touched.append(row)
+            self._persist(touched)
+
+    def delete(self, point_ids):
+        with self.lock:
+            touched = []
+            for key in map(_point_key, point_ids):
+                row = self._rows.pop(key, None)
+                if row is None:
+                    continue
+                self._unindex_payload(row)
+                self._alive[row] = False
+                self._vectors[row] = 0
+                touched.append(row)
+            self._persist(touched)
+
+    # --- reads -------------------------------------------------------------
+
+    def count(self, query_filter: Filter = None) -> int:
+        with self.lock:
+            rows = self.candidate_rows(query_filter)
+            return len(self._rows) if rows is None else len(rows)
+
+    def record(self, row: int, with_payload=True, with_vectors=False, score: float = None, vector=None):
+        """
+        A Record (or ScoredPoint with `score`) whose vector is a float32
+        array rather than a list; the models are built without validation
+        so the array is kept as is.
+        """
+        payload = _select_payload(self._payloads[row], with_payload)
+        if with_vectors and vector is None:
+            vector = self._vectors[row].astype(np.float32)
+        elif not with_vectors:
+            vector = None
+        if score is None:
+            return Record.model_construct(id=self._ids[row], payload=payload, vector=vector)
+        return ScoredPoint.model_construct(id=self._ids[row], version=0, score=score, payload=payload, vector=vector)
+
+    def vectors_for_rows(self, rows) -> np.ndarray:
+        return self._vectors[np.asarray(rows, dtype=np.int64)].astype(np.float32)
+
+    def rows_for_ids(self, point_ids):
+        return [row for row in (self._rows.get(_point_key(point_id)) for point_id in point_ids) if row is not None]
+
+    def scroll_rows(self, query_filter: Filter = None, offset=None, limit: int = 10):
+        """Rows of one scroll page plus the id to continue from (None at the end)"""
+        with self.lock:
+            rows = self.candidate_rows(query_filter)
+            if rows is None:
+                rows = np.flatnonzero(self._alive[:len(self._ids)])
+            start = 0
+            if offset is not None:
+                offset_row = self._rows.get(_point_key(offset))
+                start = int(np.searchsorted(rows, offset_row)) if offset_row is not None else len(rows)
+            page = rows[start:start + limit]
+            next_offset = self._ids[rows[start + limit]] if start + limit < len(rows) else None
+            return page.tolist(), next_offset
+
+    def search(self, queries: np.ndarray, query_filter: Filter = None, limit: int = 10, offset: int = 0):
+        """
+        Blocked brute-force top-k for a (B, D) batch of queries sharing a filter.
+        Returns (rows, scores), each (B, k), best first.
+        """
+        k = limit + (offset or 0)
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.distance == Distance.COSINE:
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            queries = queries / norms
+
+        with self.lock:
+            rows = self.candidate_rows(query_filter)
+            total = len(self._ids) if rows is None else len(rows)
+            best_scores = np.empty((len(queries), 0), dtype=np.float32)
+            best_rows = np.empty((len(queries), 0), dtype=np.int64)
+            for start in range(0, total, self.block_size):
+                end = min(start + self.block_size, total)
+                if rows is None:
+                    block_rows = np.arange(start, end)
+                    block = self._vectors[start:end]
+                else:
+                    block_rows = rows[start:end]
+                    block = self._vectors[block_rows]
+                scores = queries @ block.astype(np.float32, copy=False).T
+                if rows is None:
+                    scores[:, ~self._alive[start:end]] = -np.inf
+                scores = np.concatenate([best_scores, scores], axis=1)
+                candidates = np.concatenate([best_rows, np.broadcast_to(block_rows, (len(queries), len(block_rows)))], axis=1)
+                if scores.shape[1] > k:
+                    keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                    scores = np.take_along_axis(scores, keep, axis=1)
+                    candidates = np.take_along_axis(candidates, keep, axis=1)
+                best_scores, best_rows = scores, candidates
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return best_rows[:, offset or 0:], best_scores[:, offset or 0:]
+
+
+class LocalVectorStore:
+    def __init__(self, path: str = None, dtype: str = "float32", block_size: int = DEFAULT_BLOCK_SIZE):
+        """
+        A QdrantClient look-alike backed by NumPy. With a `path` every collection
+        lives in its own sub-directory and is memory-mapped; without one
+        everything stays in RAM.
+        """
+        self.path = path
+        self.dtype = dtype
+        self.block_size = block_size
+        self._collections = {}
+        self._lock = threading.Lock()
+        if path and os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                config_path = os.path.join(path, name, "config.json")
+                if os.path.exists(config_path):
+                    with open(config_path, encoding="utf-8") as f:
+                        config = json.load(f)
+                    self._collections[name] = LocalCollection(
+                        name, config["size"], Distance(config["distance"]), config["dtype"],
+                        os.path.join(path, name), block_size=block_size
+                    )
+
+    def _collection(self, collection_name: str) -> LocalCollection:
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            raise ValueError(f"Collection {collection_name} not found")
+        return collection
+
+    # --- collections -------------------------------------------------------
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self._collections
+
+    def create_collection(self, collection_name: str, vectors_config: VectorParams, **kwargs) -> bool:
+        with self._lock:
+            if collection_name in self._collections:
+                raise ValueError(f"Collection {collection_name} already exists")
+            path = os.path.join(self.path, collection_name) if self.path else None
+            self._collections[collection_name] = LocalCollection(
+                collection_name, vectors_config.size, vectors_config.distance, self.dtype, path,
+                block_size=self.block_size
+            )
+            return True
+
+    def vector_params(self, collection_name: str) -> VectorParams:
+        """The stored vectors' size, distance and datatype, as get_collection(...).config.params.vectors would give"""
+        collection = self._collection(collection_name)
+        return VectorParams(size=collection.size, distance=collection.distance,
+                            datatype=Datatype(collection.dtype.name))
+
+    def delete_collection(self, collection_name: str, **kwargs) -> bool:
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+            if collection is None:
+                return False
+            collection.close()
+            if collection.path:
+                for filename in os.listdir(collection.path):
+                    os.remove(os.path.join(collection.path, filename))
+                os.rmdir(collection.path)
+            return True
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None, wait: bool = True,
+                             **kwargs) -> UpdateResult:
+        """Filters on indexed fields only scan matching rows"""
+        self._collection(collection_name).add_indexed_field(field_name)
+        return _COMPLETED
+
+    def get_collections(self):
+        return sorted(self._collections)
+
+    def close(self, **kwargs):
+        for collection in self._collections.values():
+            collection.close()
+
+    # --- points ------------------------------------------------------------
+
+    def upsert(self, collection_name: str, points, wait: bool = True, **kwargs) -> UpdateResult:
+        self._collection(collection_name).upsert(points)
+        return _COMPLETED
+
+    def upload_collection(self, collection_name: str, vectors, payload=None, ids=None, batch_size: int = 64,
+                          wait: bool = True, **kwargs):
+        """Write a vector matrix straight into the collection (ids are generated when not given)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in range(len(vectors))]
+        self._collection(collection_name).upsert_matrix(ids, vectors, list(payload) if payload is not None else None)
+
+    def delete(self, collection_name: str, points_selector, wait: bool = True, **kwargs) -> UpdateResult:
+        if isinstance(points_selector, PointIdsList):
+            points_selector = points_selector.points
+        self._collection(collection_name).delete(points_selector)
+        return _COMPLETED
+
+    def set_payload(self, collection_name: str, payload: dict, points, wait: bool = True, **kwargs) -> UpdateResult:
+        if isinstance(points, PointIdsList):
+            points = points.points
+        self._collection(collection_name).set_payload(payload, points)
+        return _COMPLETED
+
+    def overwrite_payload(self, collection_name: str, payload: dict, points, wait: bool = True, **kwargs):
+        if isinstance(points, PointIdsList):
+            points = points.points
+        self._collection(collection_name).set_payload(payload, points, overwrite=True)
+        return _COMPLETED
+
+    def batch_update_points(self, collection_name: str, update_operations, wait: bool = True, **kwargs):
+        results = []
+        for operation in update_operations:
+            if not isinstance(operation, SetPayloadOperation):
+                raise ValueError(f"Unsupported operation for the local index: {type(operation).__name__}")
+            results.append(self.set_payload(collection_name, operation.set_payload.payload, operation.set_payload.points))
+        return results
+
+    def count(self, collection_name: str, count_filter: Filter = None, exact: bool = True, **kwargs) -> CountResult:
+        return CountResult(count=self._collection(collection_name).count(count_filter))
+
+    def retrieve(self, collection_name: str, ids, with_payload=True, with_vectors=False, **kwargs):
+        collection = self._collection(collection_name)
+        with collection.lock:
+            return [collection.record(row, with_payload, with_vectors) for row in collection.rows_for_ids(ids)]
+
+    def scroll(self, collection_name: str, scroll_filter: Filter = None, limit: int = 10, offset=None,
+               with_payload=True, with_vectors=False, **kwargs):
+        collection = self._collection(collection_name)
+        rows, next_offset = collection.scroll_rows(scroll_filter, offset, limit)
+        with collection.lock:
+            return [collection.record(row, with_payload, with_vectors) for row in rows], next_offset
+
+    def _search(self, collection: LocalCollection, queries, query_filter, limit, offset, with_payload, with_vectors,
+                score_threshold=None):
+        rows, scores = collection.search(queries, query_filter, limit, offset)
+        responses = []
+        with collection.lock:
+            for query_rows, query_scores in zip(rows, scores):
+                keep = np.isfinite(query_scores)
+                if score_threshold is not None:
+                    keep &= query_scores >= score_threshold
+                query_rows, query_scores = query_rows[keep], query_scores[keep]
+                # One gather (and float16 -> float32 cast) for all hits; each point gets a row of it
+                vectors = collection.vectors_for_rows(query_rows) if with_vectors else [None] * len(query_rows)
+                points = [
+                    collection.record(int(row), with_payload, with_vectors, float(score), vector)
+                    for row, score, vector in zip(query_rows, query_scores, vectors)
+                ]
+                responses.append(QueryResponse.model_construct(points=points))
+        return responses
+
+    def query_points(self, collection_name: str, query=None, query_filter: Filter = None, limit: int = 10,
+                     offset: int = None, with_payload=True, with_vectors=False, score_threshold: float = None,
+                     **kwargs) -> QueryResponse:
+        collection = self._collection(collection_name)
+        return self._search(collection, [query], query_filter, limit, offset, with_payload, with_vectors,
+                            score_threshold)[0]
+
+    def query_batch_points(self, collection_name: str, requests, **kwargs):
+        """Requests that share a filter and limit are answered with one matrix product"""
+        collection = self._collection(collection_name)
+        responses = [None] * len(requests)
+        groups = {}
+        for i, request in enumerate(requests):
+            key = (request.filter.model_dump_json() if request.filter else None, request.limit or 10,
+                   request.offset or 0, repr(request.with_payload), repr(request.with_vector),
+                   request.score_threshold)
+            groups.setdefault(key, []).append(i)
+        for indexes in groups.values():
+            first = requests[indexes[0]]
+            group_responses = self._search(
+                collection, [requests[i].query for i in indexes], first.filter, first.limit or 10, first.offset or 0,
+                True if first.with_payload is None else first.with_payload, bool(first.with_vector),
+                first.score_threshold
+            )
+            for i, response in zip(indexes, group_responses):
+                responses[i] = response
+        return responses
@@ -0,0 +1,268 @@
+"""
+Lightweight spans, histograms and counters.
+
+Disabled unless METRICS_ENABLED=1 (or enable() is called). When disabled,
+span() hands back a shared no-op context manager and @traced functions
+call straight through after a single flag check.
+
+    with span("qdrant.search"):
+        ...
+
+    @traced("embed_texts")
+    def embed_texts(...):
+        ...
+
+Span durations go into per-name histograms; counters are free-form and
+labelled (e.g. cache hits and misses). Snapshots can be exported in
+Prometheus text format or as JSON lines, on demand or from a background
+thread (METRICS_EXPORT_PATH, METRICS_EXPORT_FORMAT, METRICS_EXPORT_INTERVAL).
+"""
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+# Upper bounds in seconds, Prometheus-style
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+_enabled = os.getenv("METRICS_ENABLED", "0") == "1"
+_noop = nullcontext()
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_traces = deque(maxlen=20)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile, interpolating linearly inside the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if self.buckets[i] != float("inf") else lower * 2 or 1.0
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-2]
+
+
+def observe(name: str, seconds: float):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+def increment(name: str, value: float = 1, **labels):
+    """Add to a counter; a no-op while metrics are disabled"""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Span:
+    __slots__ = ("name", "started", "trace", "token", "depth")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        trace = _current_trace.get()
+        if trace is None:
+            # Outermost span: collect its children into a trace for the debug panel
+            self.trace = []
+            self.token = _current_trace.set(self.trace)
+            self.depth = 0
+        else:
+            self.trace = trace
+            self.token = None
+            self.depth = sum(1 for entry in trace if entry[2] is None)  # spans still open
+        self.trace.append([self.name, self.depth, None])
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        observe(self.name, elapsed)
+        if exc_type is not None:
+            increment("span_errors_total", span=self.name)
+        for entry in reversed(self.trace):
+            if entry[0] == self.name and entry[2] is None:
+                entry[2] = elapsed
+                break
+        if self.token is not None:
+            _current_trace.reset(self.token)
+            with _lock:
+                _traces.append({"name": self.name, "at": time.time(), "spans": [tuple(e) for e in self.trace]})
+        return False
+
+
+def span(name: str):
+    """Time a block under `name`"""
+    if not _enabled:
+        return _noop
+    return _Span(name)
+
+
+def traced(name: str = None):
+    """Decorator form of span(); works on plain and async functions"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await fn(*args, **kwargs)
+                with _Span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument(prefix: str):
+    """Class decorator: trace every method defined on the class (dunder methods excepted) as prefix.method"""
+    def decorator(cls):
+        for attribute, value in list(vars(cls).items()):
+            if inspect.isfunction(value) and not attribute.startswith("__"):
+                setattr(cls, attribute, traced(f"{prefix}.{attribute}")(value))
+        return cls
+    return decorator
+
+
+def snapshot() -> dict:
+    """Current histograms (with approximate quantiles) and counters"""
+    with _lock:
+        histograms = {
+            name: {
+                "count": histogram.count,
+                "sum_s": histogram.sum,
+                "p50_s": histogram.quantile(0.5),
+                "p95_s": histogram.quantile(0.95),
+                "p99_s": histogram.quantile(0.99),
+            }
+            for name, histogram in _histograms.items()
+        }
+        counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in _counters.items()]
+    return {"histograms": histograms, "counters": counters}
+
+
+def recent_traces() -> list:
+    """The last few outermost spans with their nested (name, depth, seconds) entries, newest first"""
+    with _lock:
+        return list(reversed(_traces))
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _traces.clear()
+
+
+def _label_string(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def export_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = ["# TYPE span_duration_seconds histogram"]
+    with _lock:
+        for name, histogram in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'span_duration_seconds_bucket{_label_string({"span": name, "le": le})} {cumulative}')
+            lines.append(f'span_duration_seconds_sum{_label_string({"span": name})} {histogram.sum}')
+            lines.append(f'span_duration_seconds_count{_label_string({"span": name})} {histogram.count}')
+        typed = set()
+        for (name, labels), value in sorted(_counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_label_string(dict(labels))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write(path: str, export_format: str = "prometheus"):
+    """Write a Prometheus snapshot to `path` (replacing it) or append one JSON line"""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if export_format == "jsonl":
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"timestamp": time.time(), **snapshot()}) + "\n")
+    else:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(export_prometheus())
+        os.replace(tmp_path, path)
+
+
+_exporter = None
+
+
+def start_exporter(path: str, export_format: str = "prometheus", interval: float = 15.0):
+    """Write metrics to `path` every `interval` seconds from a daemon thread (once per process)"""
+    global _exporter
+    with _lock:
+        if _exporter is not None:
+            return _exporter
+
+        def run():
+            while True:
+                time.sleep(interval)
+                if _enabled:
+                    write(path, export_format)
+
+        _exporter = threading.Thread(target=run, name="metrics-exporter", daemon=True)
+        _exporter.start()
+        return _exporter
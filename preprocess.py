@@ -0,0 +1,130 @@
+"""
+Image decoding and CLIP preprocessing ahead of the model.
+
+decode_image() accepts a path, raw bytes, a file-like object or a PIL
+image. A JPEG is decoded in draft mode: libjpeg scales it down by 1/2, 1/4
+or 1/8 while decoding, so a 12MP phone photo never has to be fully
+decoded. The draft is kept at least DRAFT_MARGIN times the model's input
+size, so the final bicubic resize still downsamples and embeddings stay
+within float noise of a full decode. Images come back in RGB. Transparent
+pixels are composited onto white rather than losing their alpha channel.
+
+ImagePreprocessor does the processor's resize, centre crop, rescale and
+normalise. The resize runs per image with the same PIL filter and output
+size as the processor. The rest runs once on the whole (N, H, W, 3) batch
+in NumPy, and the result matches the processor's pixel_values.
+"""
+import io
+import os
+from math import ceil
+import numpy as np
+from PIL import Image
+
+DRAFT_MARGIN = 2
+WHITE = (255, 255, 255)
+
+
+def open_image(source):
+    """A PIL image from a path, bytes, a file-like object or a PIL image (not yet decoded)"""
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    if isinstance(source, (str, os.PathLike)) or hasattr(source, "read"):
+        return Image.open(source)
+    raise TypeError(f"Can't read an image from {type(source).__name__}")
+
+
+def to_rgb(image):
+    """RGB copy of any PIL mode; transparent areas become white"""
+    if image.mode == "RGB":
+        return image
+    if image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA", "PA", "RGBa", "La"):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, WHITE)
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def draft_size(processor):
+    """Smallest edge a draft-decoded image may have for this CLIP processor (None to decode fully)"""
+    image_processor = getattr(processor, "image_processor", processor)
+    size = getattr(image_processor, "size", None) or {}
+    crop_size = getattr(image_processor, "crop_size", None) or {}
+    edges = [size.get("shortest_edge"), size.get("height"), size.get("width"),
+             crop_size.get("height"), crop_size.get("width")]
+    edges = [edge for edge in edges if edge]
+    return max(edges) * DRAFT_MARGIN if edges else None
+
+
+def decode_image(source, min_size: int = None):
+    """
+    Fully decode `source` to an RGB PIL image. With `min_size`, JPEGs are
+    decoded in draft mode to the smallest scale whose edges are both at
+    least `min_size` pixels.
+    """
+    image = open_image(source)
+    if min_size and image.format == "JPEG":
+        image.draft("RGB", (min_size, min_size))
+    image.load()
+    return to_rgb(image)
+
+
+class ImagePreprocessor:
+    def __init__(self, image_processor):
+        """Vectorised stand-in for a CLIPImageProcessor's image path"""
+        image_processor = getattr(image_processor, "image_processor", image_processor)
+        size = image_processor.size
+        self.shortest_edge = size.get("shortest_edge")
+        self.size = None if self.shortest_edge else (size["height"], size["width"])
+        self.do_resize = image_processor.do_resize
+        self.do_center_crop = image_processor.do_center_crop
+        self.crop_size = (image_processor.crop_size["height"], image_processor.crop_size["width"])
+        self.resample = image_processor.resample
+        self.do_rescale = image_processor.do_rescale
+        self.rescale_factor = image_processor.rescale_factor
+        self.do_normalize = image_processor.do_normalize
+        self.mean = np.array(image_processor.image_mean, dtype=np.float32)
+        self.std = np.array(image_processor.image_std, dtype=np.float32)
+
+    def _output_size(self, width: int, height: int):
+        """(width, height) after resizing, computed exactly as the processor does"""
+        if self.size is not None:
+            return self.size[1], self.size[0]
+        short, long = (width, height) if width <= height else (height, width)
+        new_short, new_long = self.shortest_edge, int(self.shortest_edge * long / short)
+        return (new_short, new_long) if width <= height else (new_long, new_short)
+
+    def _crop(self, pixels: np.ndarray) -> np.ndarray:
+        height, width = pixels.shape[:2]
+        crop_height, crop_width = self.crop_size
+        if height < crop_height or width < crop_width:
+            # Pad with zeros like the processor when the image is smaller than the crop
+            padded = np.zeros((max(height, crop_height), max(width, crop_width), 3), dtype=pixels.dtype)
+            top, left = ceil((padded.shape[0] - height) / 2), ceil((padded.shape[1] - width) / 2)
+            padded[top:top + height, left:left + width] = pixels
+            pixels = padded
+            height, width = pixels.shape[:2]
+        top, left = (height - crop_height) // 2, (width - crop_width) // 2
+        return pixels[top:top + crop_height, left:left + crop_width]
+
+    def __call__(self, images) -> np.ndarray:
+        """(N, 3, H, W) float32 pixel values for a list of PIL images"""
+        crops = []
+        for image in images:
+            image = to_rgb(image)
+            if self.do_resize:
+                image = image.resize(self._output_size(*image.size), resample=self.resample, reducing_gap=None)
+            pixels = np.asarray(image)
+            crops.append(self._crop(pixels) if self.do_center_crop else pixels)
+        batch = np.stack(crops)
+        if self.do_rescale:
+            batch = (batch.astype(np.float64) * self.rescale_factor).astype(np.float32)
+        else:
+            batch = batch.astype(np.float32)
+        if self.do_normalize:
+            batch = (batch - self.mean) / self.std
+        return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
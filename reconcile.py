@@ -0,0 +1,456 @@
+"""
+Reconcile image files on disk with the points that reference them.
+
+    python reconcile.py images marketplace-images           # report only
+    python reconcile.py images marketplace-images --fix     # repair the collections
+
+Each image directory is scanned. The points of both collections are
+streamed one scroll page at a time, reading only the `image_path` and
+`content_hash` fields. Both streams go into a scratch SQLite database, and
+the comparison runs there as indexed joins, so memory stays flat on a
+million-point collection. Ingested and uploaded points have the content_id
+of their image bytes as id and record the bytes' `content_hash` in the
+payload. That lets a point be checked against the file its path names:
+
+- missing:    the point's file does not exist (an orphaned point)
+- changed:    the point's recorded content hash differs from the file's
+- unverified: the point records no content hash and its id isn't the
+              file's content id (e.g. a hand-made point with a random id),
+              so whether the file changed can't be told
+- collision:  several points of one collection name the same file (e.g. two
+              uploads with one name); those that don't match the file are `stale`
+- unindexed:  a file no point references
+
+Files are only re-hashed when their size or mtime differs from the previous
+run's index. --fix deletes orphaned and stale points and re-embeds changed
+files under their new content id, carrying the old payload over. Unverified
+points are only re-embedded with --reembed-unverified. Deletes and upserts
+go out in batches.
+
+Every run writes a compact path -> (status, mtime, size) index to
+IMAGE_INDEX_PATH. The app opens it once at startup (ImageStatusIndex), so
+grids don't stat every image they show.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from embedding_cache import content_id
+from embeddings import _chunked, add_model_arguments
+from vector_db import VectorDatabase, create_client
+
+DEFAULT_INDEX_PATH = os.path.join(".cache", "image_index.sqlite")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+OK, MISSING, CHANGED, COLLISION, UNINDEXED = "ok", "missing", "changed", "collision", "unindexed"
+UNVERIFIED = "unverified"
+STALE = "stale"  # a colliding point whose id isn't the file's content id
+
+INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    mtime REAL,
+    size INTEGER,
+    content_id TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+
+class ImageStatusIndex:
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        """Read-only view of the index written by the reconciler; lookups are indexed SQLite reads"""
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str = DEFAULT_INDEX_PATH):
+        """The index at `path`, or None if the reconciler hasn't written one yet"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except sqlite3.Error:
+            return None
+
+    def get(self, image_path: str):
+        """(status, mtime, size) for a path the reconciler saw, else None"""
+        with self._lock:
+            return self._conn.execute('SELECT status, mtime, size FROM images WHERE path = ?',
+                                      (image_path,)).fetchone()
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute('SELECT status, COUNT(*) FROM images GROUP BY status').fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _path_key(path: str) -> str:
+    """Paths are compared in absolute, normalised form; payloads keep whatever form they were written in"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _scan_files(roots):
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                    yield os.path.join(dirpath, filename)
+
+
+def _recorded_content_id(payload: dict):
+    """The content_id of the bytes the point was embedded from, if its payload records their hash"""
+    try:
+        return str(uuid.UUID(hex=payload["content_hash"])) if payload.get("content_hash") else None
+    except ValueError:
+        return None
+
+
+def _hash_file(path: str):
+    with open(path, "rb") as f:
+        return content_id(f.read())
+
+
+class Reconciler:
+    def __init__(self, collections: dict, roots, index_path: str = DEFAULT_INDEX_PATH, page_size: int = 1024,
+                 hash_workers: int = 4):
+        """
+        `collections` maps a name to the VectorDatabase to reconcile and
+        `roots` are the image directories to scan. Scratch tables live in a
+        temporary SQLite file next to the index.
+        """
+        self.collections = collections
+        self.roots = list(roots)
+        self.index_path = index_path
+        self.page_size = page_size
+        self.hash_workers = hash_workers
+        index_dir = os.path.dirname(index_path) or "."
+        os.makedirs(index_dir, exist_ok=True)
+        handle, self._scratch_path = tempfile.mkstemp(prefix="reconcile-", suffix=".sqlite", dir=index_dir)
+        os.close(handle)
+        self._conn = sqlite3.connect(self._scratch_path)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.executescript('''
+        CREATE TABLE files (
+            key TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            mtime REAL NOT NULL,
+            size INTEGER NOT NULL,
+            content_id TEXT NOT NULL
+        );
+        CREATE TABLE points (
+            collection TEXT NOT NULL,
+            id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            path TEXT NOT NULL,
+            content_id TEXT,
+            PRIMARY KEY (collection, id)
+        );
+        CREATE INDEX idx_points_key ON points (key);
+        CREATE INDEX idx_points_collection_key ON points (collection, key);
+        ''')
+
+    # --- loading ------------------------------------------------------------
+
+    def scan(self):
+        """Stat every image under the roots and hash those whose size or mtime changed since the last run"""
+        previous = None
+        if os.path.exists(self.index_path):
+            previous = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+        scanned = hashed = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.hash_workers)) as pool:
+            for chunk in _chunked(_scan_files(self.roots), self.page_size):
+                rows, to_hash = [], []
+                for path in chunk:
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    known = previous.execute('SELECT mtime, size, content_id FROM images WHERE path = ?',
+                                             (path,)).fetchone() if previous is not None else None
+                    if known is not None and known[2] and known[0] == st.st_mtime and known[1] == st.st_size:
+                        rows.append((_path_key(path), path, st.st_mtime, st.st_size, known[2]))
+                    else:
+                        to_hash.append((path, st))
+                for (path, st), file_id in zip(to_hash, pool.map(_hash_file, [path for path, _ in to_hash])):
+                    rows.append((_path_key(path), path, st.st_mtime, st.st_size, file_id))
+                self._conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)', rows)
+                scanned += len(rows)
+                hashed += len(to_hash)
+        self._conn.commit()
+        if previous is not None:
+            previous.close()
+        return scanned, hashed
+
+    def load_points(self):
+        """Stream the image path and content hash of every point in every collection into the scratch database"""
+        loaded, without_path = 0, 0
+        for name, vector_db in self.collections.items():
+            points = vector_db.iter_items(page_size=self.page_size, payload_fields=["image_path", "content_hash"])
+            for chunk in _chunked(points, self.page_size):
+                rows = [(name, str(point.id), _path_key(point.payload["image_path"]), point.payload["image_path"],
+                         _recorded_content_id(point.payload))
+                        for point in chunk if (point.payload or {}).get("image_path")]
+                without_path += len(chunk) - len(rows)
+                self._conn.executemany('INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?)', rows)
+                loaded += len(rows)
+        self._conn.commit()
+        return loaded, without_path
+
+    # --- classification -----------------------------------------------------
+
+    def classify(self):
+        """(Re)build point_status: one row per point with its status"""
+        self._conn.executescript(f'''
+        DROP TABLE IF EXISTS point_status;
+        CREATE TABLE point_status AS
+        SELECT p.collection, p.id, p.key, p.path, f.content_id,
+               CASE
+                   WHEN f.key IS NULL THEN '{MISSING}'
+                   WHEN f.content_id = COALESCE(p.content_id, p.id) THEN '{OK}'
+                   WHEN EXISTS (SELECT 1 FROM points q WHERE q.collection = p.collection AND q.key = p.key
+                                AND f.content_id = COALESCE(q.content_id, q.id)) THEN '{STALE}'
+                   WHEN p.content_id IS NULL THEN '{UNVERIFIED}'
+                   ELSE '{CHANGED}'
+               END AS status
+        FROM points p LEFT JOIN files f ON f.key = p.key;
+        CREATE INDEX idx_point_status ON point_status (status, collection);
+        CREATE INDEX idx_point_status_key ON point_status (collection, key);
+        ''')
+
+    def counts(self) -> dict:
+        counts = dict(self._conn.execute('SELECT status, COUNT(*) FROM point_status GROUP BY status').fetchall())
+        counts[COLLISION] = self._conn.execute(
+            'SELECT COUNT(*) FROM (SELECT 1 FROM points GROUP BY collection, key HAVING COUNT(*) > 1)').fetchone()[0]
+        counts[UNINDEXED] = self._conn.execute(
+            'SELECT COUNT(*) FROM files f WHERE NOT EXISTS (SELECT 1 FROM points p WHERE p.key = f.key)').fetchone()[0]
+        return counts
+
+    def issues(self):
+        """Stream every problem found, one dict per point or file"""
+        cursor = self._conn.execute(f"SELECT collection, id, path, status FROM point_status WHERE status != '{OK}'")
+        for collection, point_id, path, status in cursor:
+            yield {"status": status, "collection": collection, "id": point_id, "path": path}
+        cursor = self._conn.execute('''
+        SELECT collection, MIN(path), COUNT(*), GROUP_CONCAT(id) FROM points
+        GROUP BY collection, key HAVING COUNT(*) > 1
+        ''')
+        for collection, path, count, ids in cursor:
+            yield {"status": COLLISION, "collection": collection, "path": path, "points": count, "ids": ids.split(",")}
+        cursor = self._conn.execute(
+            'SELECT path FROM files f WHERE NOT EXISTS (SELECT 1 FROM points p WHERE p.key = f.key)')
+        for (path,) in cursor:
+            yield {"status": UNINDEXED, "path": path}
+
+    # --- repair -------------------------------------------------------------
+
+    def _delete(self, status: str, batch_size: int) -> int:
+        deleted = 0
+        for name, vector_db in self.collections.items():
+            cursor = self._conn.execute('SELECT id FROM point_status WHERE status = ? AND collection = ?', (status, name))
+            while True:
+                ids = [point_id for (point_id,) in cursor.fetchmany(batch_size)]
+                if not ids:
+                    break
+                vector_db.delete_items(ids, batch_size=batch_size)
+                self._conn.executemany('DELETE FROM points WHERE collection = ? AND id = ?',
+                                       [(name, point_id) for point_id in ids])
+                deleted += len(ids)
+        self._conn.commit()
+        return deleted
+
+    def _reembed(self, embed_fn, batch_size: int, statuses=(CHANGED,)) -> int:
+        """Embed the files of points with one of `statuses` and move the points to the new content id"""
+        reembedded = 0
+        for name, vector_db in self.collections.items():
+            # One row per (changed file, collection); every point naming it is replaced by one new point.
+            # The rows go into a table first, so points can be written while they are read in blocks.
+            self._conn.execute('DROP TABLE IF EXISTS reembed')
+            self._conn.execute(f'''
+            CREATE TABLE reembed AS
+            SELECT MIN(s.path) AS path, f.path AS file_path, f.content_id, GROUP_CONCAT(s.id) AS ids
+            FROM point_status s JOIN files f ON f.key = s.key
+            WHERE s.status IN ({",".join("?" * len(statuses))}) AND s.collection = ?
+            GROUP BY s.key
+            ''', (*statuses, name))
+            cursor = self._conn.execute('SELECT path, file_path, content_id, ids FROM reembed')
+            while True:
+                chunk = cursor.fetchmany(batch_size)
+                if not chunk:
+                    break
+                old_ids = {file_id: ids.split(",") for _, _, file_id, ids in chunk}
+                # A file whose bytes are already indexed under another path only needs its stale points removed
+                indexed = {file_id for file_id in old_ids if self._conn.execute(
+                    'SELECT 1 FROM points WHERE collection = ? AND id = ?', (name, file_id)).fetchone()}
+                chunk = [row for row in chunk if row[2] not in indexed]
+                if chunk:
+                    first_ids = [old_ids[file_id][0] for _, _, file_id, _ in chunk]
+                    payloads = {str(point.id): point.payload for point in vector_db.get_items(first_ids)}
+                    embeddings = embed_fn([file_path for _, file_path, _, _ in chunk])
+                    vector_db.add_items(
+                        [file_id for _, _, file_id, _ in chunk], embeddings,
+                        [{**payloads.get(point_id, {}), "image_path": image_path,
+                          "content_hash": uuid.UUID(file_id).hex}
+                         for (image_path, _, file_id, _), point_id in zip(chunk, first_ids)],
+                        batch_size=batch_size
+                    )
+                    self._conn.executemany('INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?)',
+                                           [(name, file_id, _path_key(image_path), image_path, file_id)
+                                            for image_path, _, file_id, _ in chunk])
+                stale = [point_id for ids in old_ids.values() for point_id in ids]
+                vector_db.delete_items(stale, batch_size=batch_size)
+                self._conn.executemany('DELETE FROM points WHERE collection = ? AND id = ?',
+                                       [(name, point_id) for point_id in stale])
+                reembedded += len(chunk)
+            self._conn.execute('DROP TABLE reembed')
+        self._conn.commit()
+        return reembedded
+
+    def fix(self, embed_fn=None, batch_size: int = 256, reembed_unverified: bool = False) -> dict:
+        """
+        Delete orphaned and stale points, and re-embed changed files with
+        `embed_fn(paths) -> (N, D) matrix` when given (unverified ones too
+        with `reembed_unverified`). Re-run classify() after.
+        """
+        result = {"deleted_missing": self._delete(MISSING, batch_size), "deleted_stale": self._delete(STALE, batch_size)}
+        statuses = (CHANGED, UNVERIFIED) if reembed_unverified else (CHANGED,)
+        result["reembedded"] = self._reembed(embed_fn, batch_size, statuses) if embed_fn is not None else 0
+        return result
+
+    # --- output -------------------------------------------------------------
+
+    def write_index(self) -> int:
+        """Atomically replace the path -> status index; returns the number of paths"""
+        tmp_path = f"{self.index_path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        index = sqlite3.connect(tmp_path)
+        index.executescript(INDEX_SCHEMA)
+        index.close()
+        self._conn.execute('ATTACH DATABASE ? AS idx', (tmp_path,))
+        try:
+            # Paths as the payloads spell them, so the app can look up payload["image_path"] directly
+            self._conn.execute(f'''
+            INSERT OR REPLACE INTO idx.images (path, status, mtime, size, content_id)
+            SELECT s.path,
+                   CASE
+                       WHEN MAX(s.status = '{MISSING}') THEN '{MISSING}'
+                       WHEN MAX(c.points) > 1 THEN '{COLLISION}'
+                       WHEN MAX(s.status = '{OK}') THEN '{OK}'
+                       WHEN MAX(s.status = '{UNVERIFIED}') THEN '{UNVERIFIED}'
+                       ELSE '{CHANGED}'
+                   END,
+                   f.mtime, f.size, f.content_id
+            FROM point_status s
+            JOIN (SELECT collection, key, COUNT(*) AS points FROM points GROUP BY collection, key) c
+                ON c.collection = s.collection AND c.key = s.key
+            LEFT JOIN files f ON f.key = s.key
+            GROUP BY s.key, s.path
+            ''')
+            # Scanned paths too, so the next run can skip re-hashing unchanged files
+            self._conn.execute(f'''
+            INSERT OR IGNORE INTO idx.images (path, status, mtime, size, content_id)
+            SELECT f.path,
+                   CASE WHEN EXISTS (SELECT 1 FROM points p WHERE p.key = f.key) THEN '{OK}' ELSE '{UNINDEXED}' END,
+                   f.mtime, f.size, f.content_id
+            FROM files f
+            ''')
+            self._conn.execute("INSERT OR REPLACE INTO idx.meta (key, value) VALUES ('created_at', ?)",
+                               (str(time.time()),))
+            self._conn.commit()
+            written = self._conn.execute('SELECT COUNT(*) FROM idx.images').fetchone()[0]
+        finally:
+            self._conn.execute('DETACH DATABASE idx')
+        os.replace(tmp_path, self.index_path)
+        return written
+
+    def close(self):
+        self._conn.close()
+        os.remove(self._scratch_path)
+
+    def run(self, fix: bool = False, embed_fn=None, report_path: str = None, batch_size: int = 256,
+            reembed_unverified: bool = False) -> dict:
+        """Scan, compare, optionally fix, and write the index; returns counts"""
+        started = time.perf_counter()
+        stats = {}
+        stats["files"], stats["hashed"] = self.scan()
+        stats["points"], stats["points_without_path"] = self.load_points()
+        self.classify()
+        stats["found"] = self.counts()
+        if report_path:
+            with open(report_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(issue) + "\n" for issue in self.issues())
+        if fix:
+            stats["fixed"] = self.fix(embed_fn, batch_size, reembed_unverified)
+            self.classify()
+        stats["indexed_paths"] = self.write_index()
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Reconcile image directories with the Qdrant collections")
+    parser.add_argument("roots", nargs="*", default=["images"], help="Image directories to scan")
+    parser.add_argument("--collections", nargs="+",
+                        default=[name for name in (os.getenv("QDRANT_WARDROBE_COLLECTION"),
+                                                   os.getenv("QDRANT_MARKETPLACE_COLLECTION")) if name],
+                        help="Collections to check (defaults to the wardrobe and marketplace collections)")
+    parser.add_argument("--index", default=os.getenv("IMAGE_INDEX_PATH", DEFAULT_INDEX_PATH),
+                        help="Where to write the path -> status index")
+    parser.add_argument("--report", help="Write every issue found as JSON lines here")
+    parser.add_argument("--fix", action="store_true",
+                        help="Delete orphaned and stale points and re-embed changed files")
+    parser.add_argument("--reembed-unverified", action="store_true",
+                        help="With --fix, also re-embed files of points that record no content hash")
+    add_model_arguments(parser, model_help="Path to the CLIP model (for --fix)")
+    parser.add_argument("--page-size", type=int, default=1024, help="Points per scroll page and files per hash batch")
+    parser.add_argument("--batch-size", type=int, default=256, help="Points per delete or upsert request")
+    parser.add_argument("--workers", type=int, default=4, help="File hashing threads")
+    parser.add_argument("--location", help="Local Qdrant location instead of QDRANT_HOST, e.g. a path")
+    args = parser.parse_args()
+
+    client = create_client(os.getenv("QDRANT_HOST"), os.getenv("QDRANT_THRIFT_API_KEY"), args.location)
+    collections = {name: VectorDatabase(None, None, name, client=client) for name in args.collections}
+
+    loaded = {}
+
+    def embed_fn(paths):
+        # The model is only loaded when there is something to re-embed
+        from embeddings import embed_images, load_model
+        if "model" not in loaded:
+            loaded["model"] = load_model(args.model, args.backend, args.threads, args.preprocess)
+        return embed_images(paths, *loaded["model"])
+
+    reconciler = Reconciler(collections, args.roots, args.index, page_size=args.page_size, hash_workers=args.workers)
+    try:
+        stats = reconciler.run(fix=args.fix, embed_fn=embed_fn if args.fix else None, report_path=args.report,
+                               batch_size=args.batch_size, reembed_unverified=args.reembed_unverified)
+    finally:
+        reconciler.close()
+    print(json.dumps(stats, indent=2))
+    if args.fix and any(stats["fixed"].values()):
+        complements_path = os.getenv("COMPLEMENTS_PATH", os.path.join(".cache", "complements.sqlite"))
+        if os.path.exists(complements_path):
+            # Stored outfit ideas may point at deleted or re-keyed wardrobe items
+            from complements import ComplementTable
+            ComplementTable(complements_path).invalidate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Cold-start helpers for the Streamlit app.
+
+BackgroundModel loads (and optionally warms up) the CLIP model on a daemon
+thread, so pages that never embed anything render without waiting for
+torch. StartupTimings collects import, load, warm-up and first-request
+timings for the sidebar.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class StartupTimings:
+    def __init__(self):
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, once: bool = False):
+        """Store a timing; with once=True only the first value for `name` is kept"""
+        with self._lock:
+            if once and name in self._timings:
+                return
+            self._timings[name] = seconds
+
+    def has(self, name: str) -> bool:
+        with self._lock:
+            return name in self._timings
+
+    @contextmanager
+    def measure(self, name: str, once: bool = False):
+        if once and self.has(name):
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, once)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return dict(self._timings)
+
+
+# Process-wide, so timings survive Streamlit reruns
+timings = StartupTimings()
+
+
+class BackgroundModel:
+    def __init__(self, loader, warm_up=None, timings: StartupTimings = timings):
+        """
+        Call `loader()` -> (processor, model) on a daemon thread, then
+        `warm_up(processor, model)` if given. get() blocks until both are done.
+        """
+        self._loader = loader
+        self._warm_up = warm_up
+        self._timings = timings
+        self._result = Future()
+        threading.Thread(target=self._run, name="model-loader", daemon=True).start()
+
+    def _run(self):
+        try:
+            with self._timings.measure("model_load_s"):
+                processor, model = self._loader()
+            if self._warm_up is not None and model is not None:
+                with self._timings.measure("model_warm_up_s"):
+                    self._warm_up(processor, model)
+            self._result.set_result((processor, model))
+        except Exception as e:
+            self._result.set_exception(e)
+
+    @property
+    def ready(self) -> bool:
+        return self._result.done()
+
+    def get(self, timeout: float = None):
+        """(processor, model); re-raises whatever the loader raised"""
+        return self._result.result(timeout)
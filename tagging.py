@@ -0,0 +1,149 @@
+"""
+Zero-shot auto-tagging against the CLOTHING_TAGS vocabulary.
+
+The tag vocabulary is embedded once through the text tower and the resulting
+(T, D) matrix is cached on disk, keyed by the model and the vocabulary. Tagging
+an item is then a single matrix product against the item embedding that was
+already computed for indexing.
+
+Backfill existing points:
+    python tagging.py --collection marketplace
+"""
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client.models import SetPayload, SetPayloadOperation
+from embeddings import add_model_arguments, embed_texts, load_model, model_fingerprint
+from vector_db import VectorDatabase, create_client
+from vectors import stack_vectors
+
+DEFAULT_TAG_CACHE_DIR = os.path.join(".cache", "tags")
+DEFAULT_TEMPLATE = "a photo of {} clothing"
+
+
+def parse_clothing_tags(raw: str) -> list[str]:
+    """Parse the CLOTHING_TAGS env value (a JSON list) into a clean, de-duplicated vocabulary"""
+    if not raw:
+        return []
+    try:
+        tags = json.loads(raw)
+    except json.JSONDecodeError:
+        tags = raw.strip("[]").replace('"', "").split(",")
+    seen = []
+    for tag in tags:
+        tag = str(tag).strip()
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+class AutoTagger:
+    def __init__(self, tags: list[str], processor, model, template: str = DEFAULT_TEMPLATE,
+                 cache_dir: str = DEFAULT_TAG_CACHE_DIR):
+        """Build (or load from cache) the tag embedding matrix"""
+        self.tags = list(tags)
+        self.template = template
+        self.cache_dir = cache_dir
+        self.tag_matrix = self._load_or_build(processor, model)
+
+    def _cache_path(self, model) -> str:
+        vocabulary = json.dumps([self.template, self.tags], ensure_ascii=False)
+        vocabulary_hash = hashlib.blake2b(vocabulary.encode("utf-8"), digest_size=8).hexdigest()
+        return os.path.join(self.cache_dir, f"{model_fingerprint(model)}-{vocabulary_hash}.npy")
+
+    def _load_or_build(self, processor, model) -> np.ndarray:
+        if not self.tags:
+            return np.zeros((0, 0), dtype=np.float32)
+        path = self._cache_path(model)
+        if os.path.exists(path):
+            matrix = np.load(path)
+            if matrix.shape[0] == len(self.tags):
+                return matrix
+        matrix = embed_texts([self.template.format(tag) for tag in self.tags], processor, model)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temp file first so a concurrent reader never sees a partial matrix
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, path)
+        return matrix
+
+    def score(self, embeddings: np.ndarray) -> np.ndarray:
+        """Cosine similarity of each item embedding against every tag, shape (N, T)"""
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if not self.tags:
+            # An empty vocabulary scores nothing; the tag matrix has no dimension to multiply with
+            return np.zeros((embeddings.shape[0], 0), dtype=np.float32)
+        return embeddings @ self.tag_matrix.T
+
+    def tag(self, embeddings: np.ndarray, top_k: int = 5, threshold: float = 0.2) -> list[list[str]]:
+        """Top `top_k` tags scoring at least `threshold` for each item embedding"""
+        scores = self.score(embeddings)
+        if scores.size == 0:
+            return [[] for _ in range(scores.shape[0])]
+        k = min(top_k, scores.shape[1])
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, best):
+            candidates = candidates[np.argsort(-row[candidates])]
+            results.append([self.tags[i] for i in candidates if row[i] >= threshold])
+        return results
+
+
+def backfill(vector_db: VectorDatabase, tagger: AutoTagger, top_k: int = 5, threshold: float = 0.2,
+             overwrite: bool = False, page_size: int = 256) -> int:
+    """
+    Tag every point already in `vector_db`'s collection from its stored vector.
+    Writes `auto_tags` on every point and fills `tags` where it is missing
+    (or always, with `overwrite`). Returns the number of points updated.
+    """
+    client = vector_db.client
+    offset = None
+    updated = 0
+    while True:
+        points, offset = client.scroll(
+            collection_name=vector_db.collection_name,
+            limit=page_size,
+            offset=offset,
+            with_payload=["tags"],
+            with_vectors=True,
+        )
+        if points:
+            tags = tagger.tag(stack_vectors(points), top_k, threshold)
+            operations = []
+            for point, point_tags in zip(points, tags):
+                payload = {"auto_tags": point_tags}
+                if overwrite or not (point.payload or {}).get("tags"):
+                    payload["tags"] = point_tags
+                operations.append(SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point.id])))
+            client.batch_update_points(collection_name=vector_db.collection_name, update_operations=operations)
+            updated += len(points)
+        if offset is None:
+            return updated
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Backfill zero-shot tags for points already in a collection")
+    parser.add_argument("--collection", default=os.getenv("QDRANT_MARKETPLACE_COLLECTION"))
+    add_model_arguments(parser)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--overwrite", action="store_true", help="Replace existing hand-written tags")
+    parser.add_argument("--location", help="Local Qdrant location instead of QDRANT_HOST, e.g. a path")
+    args = parser.parse_args()
+
+    client = create_client(os.getenv("QDRANT_HOST"), os.getenv("QDRANT_THRIFT_API_KEY"), args.location)
+    vector_db = VectorDatabase(None, None, args.collection, client=client)
+
+    processor, model = load_model(args.model, args.backend, args.threads, args.preprocess)
+    tagger = AutoTagger(parse_clothing_tags(os.getenv("CLOTHING_TAGS")), processor, model)
+    updated = backfill(vector_db, tagger, args.top_k, args.threshold, args.overwrite)
+    print(f"Tagged {updated} points in '{args.collection}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Thumbnails and cached path lookups for the image grids.
+
+Grid views show small WebP thumbnails instead of full-resolution originals.
+Thumbnails are content-addressed (named after a hash of the source bytes and
+the target size), generated lazily on first request or up front by ingest.py,
+and kept under a total size limit with least-recently-used eviction.
+
+ImagePathIndex answers "does this image exist?" from memory so a rerun of a
+50-item grid does not stat 50 files. Given the reconciler's index
+(reconcile.ImageStatusIndex), paths it knows are answered from there
+without any stat at all.
+"""
+import io
+import os
+import threading
+import time
+from PIL import Image, ImageOps
+import metrics
+from embedding_cache import content_hash
+
+DEFAULT_THUMBNAIL_DIR = os.path.join(".cache", "thumbnails")
+DEFAULT_THUMBNAIL_SIZE = (320, 320)
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class ImagePathIndex:
+    def __init__(self, ttl: float = 300.0, snapshot=None):
+        """
+        Memoised os.stat results; entries are re-checked after `ttl` seconds.
+        `snapshot` (an ImageStatusIndex) is trusted for the paths it lists
+        until they are invalidated.
+        """
+        self.ttl = ttl
+        self.snapshot = snapshot
+        self._entries = {}
+        self._overridden = set()  # paths written since the snapshot was taken
+        self._lock = threading.Lock()
+
+    def stat(self, path: str):
+        """(mtime, size) for an existing file, or None"""
+        if not path:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and now - entry[0] < self.ttl:
+                return entry[1]
+            known = self.snapshot.get(path) if self.snapshot is not None and path not in self._overridden else None
+        if known is not None:
+            status, mtime, size = known
+            result = None if status == "missing" else (mtime, size)
+            with self._lock:
+                self._entries[path] = (now, result)
+            return result
+        try:
+            st = os.stat(path)
+            result = (st.st_mtime, st.st_size)
+        except OSError:
+            result = None
+        with self._lock:
+            self._entries[path] = (now, result)
+        return result
+
+    def exists(self, path: str) -> bool:
+        return self.stat(path) is not None
+
+    def invalidate(self, path: str = None):
+        """Forget one path (e.g. after writing it) or everything, snapshot included"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self.snapshot = None
+            else:
+                self._entries.pop(path, None)
+                self._overridden.add(path)
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir: str = DEFAULT_THUMBNAIL_DIR, size=DEFAULT_THUMBNAIL_SIZE, image_format: str = "WEBP",
+                 quality: int = 80, max_bytes: int = DEFAULT_MAX_CACHE_BYTES, path_index: ImagePathIndex = None):
+        self.cache_dir = cache_dir
+        self.size = tuple(size)
+        self.image_format = image_format.upper()
+        self.extension = "jpg" if self.image_format == "JPEG" else self.image_format.lower()
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.path_index = path_index or ImagePathIndex()
+        self._by_source = {}  # source path -> (source stat, thumbnail path)
+        self._last_used = {}  # thumbnail path -> time of its last in-memory hit
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.is_file())
+
+    def _thumbnail_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}_{self.size[0]}x{self.size[1]}.{self.extension}")
+
+    def get(self, source_path: str):
+        """
+        Path of the thumbnail for `source_path`, creating it on first request.
+        Returns None if the source image does not exist or cannot be decoded.
+        """
+        source_stat = self.path_index.stat(source_path)
+        if source_stat is None:
+            return None
+        with self._lock:
+            cached = self._by_source.get(source_path)
+            if cached is not None and cached[0] == source_stat:
+                # Recency for eviction without touching the file on every grid render
+                self._last_used[cached[1]] = time.time()
+        if cached is not None and cached[0] == source_stat:
+            metrics.increment("thumbnail_cache_lookups_total", result="hit")
+            return cached[1]
+
+        try:
+            with open(source_path, "rb") as f:
+                data = f.read()
+            thumbnail_path = self._thumbnail_path(content_hash(data))
+            if os.path.exists(thumbnail_path):
+                os.utime(thumbnail_path)  # mark as recently used for eviction
+                metrics.increment("thumbnail_cache_lookups_total", result="disk_hit")
+            else:
+                with metrics.span("thumbnail.generate"), Image.open(io.BytesIO(data)) as image:
+                    # Let the JPEG decoder downscale while decoding; thumbnail() finishes the resize.
+                    # Only here: images handed to put_image are already decoded.
+                    if image.format == "JPEG":
+                        image.draft("RGB", self.size)
+                    self._write(image, thumbnail_path)
+                metrics.increment("thumbnail_cache_lookups_total", result="miss")
+        except OSError:
+            return None
+        with self._lock:
+            self._by_source[source_path] = (source_stat, thumbnail_path)
+        return thumbnail_path
+
+    def put_image(self, key: str, image: Image.Image, source_path: str = None):
+        """Store a thumbnail for an image that is already decoded (e.g. during ingestion)"""
+        thumbnail_path = self._thumbnail_path(key)
+        if not os.path.exists(thumbnail_path):
+            self._write(image, thumbnail_path)
+        if source_path is not None:
+            source_stat = self.path_index.stat(source_path)
+            if source_stat is not None:
+                with self._lock:
+                    self._by_source[source_path] = (source_stat, thumbnail_path)
+        return thumbnail_path
+
+    def _write(self, image: Image.Image, thumbnail_path: str):
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        if self.image_format == "JPEG" and image.mode == "RGBA":
+            image = image.convert("RGB")
+        thumbnail = image.copy()
+        thumbnail.thumbnail(self.size)
+
+        tmp_path = f"{thumbnail_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        thumbnail.save(tmp_path, format=self.image_format, quality=self.quality)
+        os.replace(tmp_path, thumbnail_path)
+        size = os.path.getsize(thumbnail_path)
+        with self._lock:
+            self._total_bytes += size
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+
+    def _evict(self):
+        """Delete least recently used thumbnails until the cache is below 90% of its limit"""
+        # One eviction at a time; writers that find one running just carry on
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                last_used = dict(self._last_used)
+                counted = self._total_bytes
+            # The directory scan and stats run without the lock, so get() is not held up
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                try:
+                    if entry.is_file():
+                        st = entry.stat()
+                        entries.append((max(st.st_mtime, last_used.get(entry.path, 0.0)), st.st_size, entry.path))
+                except OSError:
+                    continue
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            removed, freed = set(), 0
+            for _, size, path in entries:
+                if total - freed <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                freed += size
+                removed.add(path)
+            with self._lock:
+                # Thumbnails written during the scan were counted after `counted` was read
+                self._total_bytes = total - freed + (self._total_bytes - counted)
+                for path in removed:
+                    self._last_used.pop(path, None)
+                self._by_source = {
+                    source: cached for source, cached in self._by_source.items() if cached[1] not in removed
+                }
+        finally:
+            self._evict_lock.release()
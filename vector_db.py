@@ -1,104 +1,548 @@
+import asyncio
 import os
+import threading
+import uuid
+from collections import OrderedDict
 import numpy as np
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue, PointStruct
-from embeddings import embed_text, embed_image
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchValue, PointIdsList, QueryRequest, SearchParams
+import metrics
+from vectors import PointMatrix, as_matrix, as_vector, normalize_rows, stack_vectors
 
-class VectorDatabase:
-    def __init__(self, host: str, api_key: str, collection_name: str):
-        """Initialize the vector database connection"""
-        self.client = QdrantClient(
-            url=host,
-            api_key=api_key,
+DEFAULT_QUERY_TIMEOUT = 5.0
+# Payload keys the wardrobe and marketplace grids actually render
+GRID_PAYLOAD_FIELDS = ["image_path", "product_name", "price"]
+# Outfit slots in the order beam search fills them; each slot is a wardrobe category
+OUTFIT_SLOTS = ["top", "bottom", "outerwear", "shoes", "accessories"]
+DEFAULT_BEAM_WIDTH = 128
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """One event loop on a daemon thread, shared by every AsyncVectorDatabase used from sync code"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="qdrant-async", daemon=True).start()
+        return _loop
+
+
+def run_sync(coroutine, timeout: float = None):
+    """Run a coroutine on the shared background loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coroutine, _background_loop()).result(timeout)
+
+
+class PointCache:
+    def __init__(self, max_items: int = 10_000):
+        """LRU of recently seen points (with vectors), per collection and id"""
+        self.max_items = max_items
+        self._points = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, collection_name: str, point_id):
+        with self._lock:
+            key = (collection_name, str(point_id))
+            point = self._points.get(key)
+            if point is not None:
+                self._points.move_to_end(key)
+        metrics.increment("point_cache_lookups_total", result="hit" if point is not None else "miss")
+        return point
+
+    def put_many(self, collection_name: str, points):
+        """Remember points that carry both a vector and a payload"""
+        with self._lock:
+            for point in points:
+                if point.vector is None or point.payload is None:
+                    continue
+                key = (collection_name, str(point.id))
+                self._points[key] = point
+                self._points.move_to_end(key)
+            while len(self._points) > self.max_items:
+                self._points.popitem(last=False)
+
+    def invalidate(self, collection_name: str, point_ids=None):
+        """Drop the given ids from a collection, or the whole collection"""
+        with self._lock:
+            if point_ids is None:
+                for key in [key for key in self._points if key[0] == collection_name]:
+                    del self._points[key]
+            else:
+                for point_id in point_ids:
+                    self._points.pop((collection_name, str(point_id)), None)
+
+
+# Shared by every VectorDatabase so an upsert through one instance invalidates all of them
+point_cache = PointCache()
+
+
+def _category_filter(category: str):
+    return Filter(must=[FieldCondition(key="category", match=MatchValue(value=category))]) if category else None
+
+
+def collapse_filter(query_filter: Filter = None) -> Filter:
+    """
+    `query_filter` plus a condition that hides the non-canonical members of
+    near-duplicate clusters (see dedup.py). Items that were never clustered
+    have no `canonical` field and still match.
+    """
+    hide_duplicates = FieldCondition(key="canonical", match=MatchValue(value=False))
+    if query_filter is None:
+        return Filter(must_not=[hide_duplicates])
+    return query_filter.model_copy(update={"must_not": [*(query_filter.must_not or []), hide_duplicates]})
+
+
+def _batch_requests(specs, search_params: SearchParams = None, with_vectors: bool = True):
+    """Turn (query vector, category, limit) specs into QueryRequests"""
+    return [
+        QueryRequest(
+            query=as_vector(query),
+            filter=_category_filter(category),
+            limit=limit,
+            with_payload=True,
+            with_vector=with_vectors,
+            params=search_params,
         )
+        for query, category, limit in specs
+    ]
+
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def shared_client(host: str, api_key: str = None, asynchronous: bool = False, timeout: int = None):
+    """
+    One client per (host, api key), shared by every VectorDatabase. Each
+    client keeps its own HTTP connection pool, so sharing it means one
+    pool and one handshake instead of one per collection. With
+    QDRANT_PREFER_GRPC=1 it talks gRPC, which sends vectors as packed
+    float32 instead of JSON numbers.
+    """
+    key = (host, api_key, asynchronous, timeout)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client_class = AsyncQdrantClient if asynchronous else QdrantClient
+            options = {"timeout": timeout} if timeout else {}
+            if os.getenv("QDRANT_PREFER_GRPC", "0") == "1":
+                options["prefer_grpc"] = True
+            client = _shared_clients[key] = client_class(url=host, api_key=api_key, **options)
+        return client
+
+
+def _is_shared_client(client) -> bool:
+    with _shared_clients_lock:
+        return any(client is shared for shared in _shared_clients.values())
+
+
+def create_client(host: str = None, api_key: str = None, location: str = None, backend: str = None):
+    """
+    Create a Qdrant client for a remote host, or a local one for `location` (':memory:' or a path).
+    backend='local' (or VECTOR_BACKEND=local) returns a NumPy LocalVectorStore instead,
+    persisted under `location` (or LOCAL_INDEX_PATH) unless that is ':memory:'.
+    """
+    backend = backend or os.getenv("VECTOR_BACKEND", "qdrant")
+    if backend == "local":
+        from local_index import LocalVectorStore
+        path = location or os.getenv("LOCAL_INDEX_PATH", os.path.join(".cache", "local_index"))
+        return LocalVectorStore(
+            path=None if path == ":memory:" else path,
+            dtype=os.getenv("LOCAL_INDEX_DTYPE", "float32"),
+        )
+    if location == ":memory:":
+        return QdrantClient(location=location)
+    if location:
+        return QdrantClient(path=location)
+    return shared_client(host, api_key)
+
+
+
+def _score_weights(options: dict) -> dict:
+    """The relevance/coherence weights among get_outfits options, for the top+bottom scorer"""
+    return {key: options[key] for key in ("relevance_weight", "coherence_weight") if key in options}
+
+
+@metrics.traced("score_outfit_combinations")
+def score_outfit_combinations(query_embedding, tops, bottoms, limit: int = 3,
+                              relevance_weight: float = 0.5, coherence_weight: float = 0.5):
+    """Score outfit combinations based on coherence and query relevance"""
+    if not tops or not bottoms or limit <= 0:
+        return []
+
+    # Stack each candidate pool once and normalise rows so dot products are cosines
+    top_matrix = normalize_rows(stack_vectors(tops))
+    bottom_matrix = normalize_rows(stack_vectors(bottoms))
+    query = as_vector(query_embedding)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    top_relevance = top_matrix @ query
+    bottom_relevance = bottom_matrix @ query
+    coherence = top_matrix @ bottom_matrix.T
+    query_relevance = (top_relevance[:, None] + bottom_relevance[None, :]) / 2
+    scores = (relevance_weight * query_relevance + coherence_weight * coherence).ravel()
+
+    # Partial selection of the best pairs, then sort only those
+    k = min(limit, scores.size)
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind="stable")]
+
+    for point in (*tops, *bottoms):
+        point.payload['id'] = point.id
+
+    pair_scores = []
+    for flat_index in best:
+        top_index, bottom_index = divmod(int(flat_index), len(bottoms))
+        pair_scores.append({
+            "score": float(scores[flat_index]),
+            "top": tops[top_index].payload,
+            "bottom": bottoms[bottom_index].payload,
+        })
+    return pair_scores
+
+
+def _select_diverse(items, count, max_uses):
+    """
+    Walk the rows of `items` (best first) and take up to `count` in which no
+    item is used more than `max_uses` times, then fill any remaining places
+    best first regardless. Returns the chosen row indices.
+    """
+    chosen, skipped, uses = [], [], {}
+    for position in range(len(items)):
+        row = list(enumerate(items[position].tolist()))
+        if all(uses.get(key, 0) < max_uses for key in row):
+            chosen.append(position)
+            for key in row:
+                uses[key] = uses.get(key, 0) + 1
+            if len(chosen) == count:
+                return chosen
+        else:
+            skipped.append(position)
+    return chosen + skipped[:count - len(chosen)]
+
+
+@metrics.traced("beam_search_outfits")
+def beam_search_outfits(query_embedding, pools: dict, slots=None, limit: int = 3, beam_width: int = DEFAULT_BEAM_WIDTH,
+                        relevance_weight: float = 0.5, coherence_weight: float = 0.5, required: dict = None,
+                        excluded=None, max_item_uses: int = None):
+    """
+    Best outfits with one item per slot, filling slots in order with a beam search.
+
+    `pools` maps each slot to its candidate points (with vectors) or a
+    PointMatrix. An outfit
+    scores relevance_weight * mean query similarity plus coherence_weight *
+    mean pairwise similarity of its items; every step extends each of the
+    best `beam_width` partial outfits by every candidate for the next slot in
+    one matrix product and keeps the best `beam_width`. With two slots and a
+    beam at least as wide as the first pool this is exhaustive.
+
+    `required` pins a slot to an item id, `excluded` ids are never used, and
+    slots with no candidates are skipped (at least two must remain). With
+    `max_item_uses`, outfits reusing an item more often are only returned
+    when there aren't enough others; the beam then keeps at most
+    beam_width / limit partial outfits per item, so enough alternatives
+    survive to the last slot.
+    """
+    slots = list(slots or pools)
+    required = required or {}
+    excluded = set(excluded or ())
+    query = as_vector(query_embedding)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    filled, matrices, relevances = [], [], []
+    for slot in slots:
+        pool = pools.get(slot) or []
+        if not isinstance(pool, PointMatrix):
+            pool = PointMatrix.from_points(pool)
+        keep = [point_id not in excluded and (slot not in required or point_id == required[slot])
+                for point_id in pool.ids]
+        if not any(keep):
+            continue
+        pool = pool.take(np.array(keep))
+        matrix = normalize_rows(pool.vectors)
+        filled.append((slot, pool))
+        matrices.append(matrix)
+        relevances.append(matrix @ query)
+    if len(filled) < 2 or limit <= 0:
+        return []
+
+    # Beam state: chosen pool index per filled slot, the sum of the chosen
+    # vectors, and running sums of query relevance and pairwise coherence
+    items = np.zeros((1, 0), dtype=np.int64)
+    vector_sum = np.zeros((1, query.size), dtype=np.float32)
+    relevance_sum = np.zeros(1, dtype=np.float32)
+    coherence_sum = np.zeros(1, dtype=np.float32)
+    for step, (matrix, relevance) in enumerate(zip(matrices, relevances)):
+        size = step + 1
+        pairs = size * (size - 1) // 2
+        # Coherence with every item already chosen: sum_j v_j . c == (sum_j v_j) . c
+        candidate_relevance = relevance_sum[:, None] + relevance[None, :]
+        candidate_coherence = coherence_sum[:, None] + vector_sum @ matrix.T
+        scores = relevance_weight * candidate_relevance / size
+        if pairs:
+            scores = scores + coherence_weight * candidate_coherence / pairs
+        scores = scores.ravel()
+
+        last = step == len(matrices) - 1
+        width = limit if last else beam_width
+        k = min(width, scores.size)
+        if max_item_uses is None:
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best], kind="stable")]
+        else:
+            order = np.argsort(-scores, kind="stable")
+            beams, candidates = np.divmod(order, len(relevance))
+            expanded = np.column_stack([items[beams], candidates])
+            uses = max_item_uses if last else max(max_item_uses, beam_width // limit)
+            best = order[_select_diverse(expanded, k, uses)]
+        beams, candidates = np.divmod(best, len(relevance))
+        items = np.column_stack([items[beams], candidates])
+        vector_sum = vector_sum[beams] + matrix[candidates]
+        relevance_sum = candidate_relevance.ravel()[best]
+        coherence_sum = candidate_coherence.ravel()[best]
+        best_scores = scores[best]
+
+    for _, pool in filled:
+        for point_id, payload in zip(pool.ids, pool.payloads):
+            payload['id'] = point_id
+
+    outfits = []
+    for row, score in zip(items, best_scores):
+        outfit = {"score": float(score)}
+        for (slot, pool), index in zip(filled, row):
+            outfit[slot] = pool.payloads[index]
+        outfits.append(outfit)
+    return outfits
+
+
+@metrics.instrument("vector_db")
+class VectorDatabase:
+    def __init__(self, host: str, api_key: str, collection_name: str, client: QdrantClient = None,
+                 search_params: SearchParams = None):
+        """
+        Initialize the vector database connection (or reuse an existing client).
+        search_params (HNSW ef, quantisation rescoring) apply to every search.
+        """
+        self.client = client or shared_client(host, api_key)
         self.collection_name = collection_name
+        self.search_params = search_params
+        # Only a remote Qdrant can be reached from a second (async) client
+        remote = host and _is_shared_client(self.client)
+        self._async_db = AsyncVectorDatabase(host, api_key, collection_name, search_params=search_params) if remote else None
 
-    def add_item(self, image_path: str, category: str, description: str, embedding: np.ndarray, clothing_tags: list[str]):
+    def add_item(self, image_path: str, category: str, description: str, embedding: np.ndarray, clothing_tags: list[str],
+                 item_id: str = None):
         """Add a new clothing item to the database"""
         try:
-            self.client.upsert(
+            item_id = item_id or str(uuid.uuid4())
+            self.client.upload_collection(
                 collection_name=self.collection_name,
-                points=[
-                    PointStruct(
-                        vector=embedding.tolist(),
-                        payload={
-                            "image_path": image_path,
-                            "category": category,
-                            "description": description
-                        }
-                    )
-                ]
+                vectors=as_matrix(embedding),
+                payload=[{
+                    "image_path": image_path,
+                    "category": category,
+                    "description": description,
+                    "tags": clothing_tags or []
+                }],
+                ids=[item_id],
+                wait=True
             )
+            point_cache.invalidate(self.collection_name, [item_id])
             return True
         except Exception as e:
             raise Exception(f"Error adding item: {str(e)}")
 
-    def get_items_by_category(self, category: str, query_embedding: np.ndarray, limit: int = 5):
-        """Get items by category with similarity search"""
+    def add_items(self, ids: list, embeddings: np.ndarray, payloads: list[dict], batch_size: int = 256):
+        """
+        Upsert many items at once, `batch_size` points per request. The
+        (N, D) matrix goes to the client as is rather than as one
+        PointStruct of Python floats per item.
+        """
+        try:
+            ids = list(ids)
+            self.client.upload_collection(
+                collection_name=self.collection_name,
+                vectors=as_matrix(embeddings),
+                payload=payloads,
+                ids=ids,
+                batch_size=batch_size,
+                wait=True
+            )
+            point_cache.invalidate(self.collection_name, ids)
+            return True
+        except Exception as e:
+            raise Exception(f"Error adding items: {str(e)}")
+
+    def delete_items(self, ids: list, batch_size: int = 256):
+        """Delete points by id, `batch_size` ids per request"""
         try:
-            return self.client.query_points(
+            ids = list(ids)
+            for start in range(0, len(ids), batch_size):
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=PointIdsList(points=ids[start:start + batch_size]),
+                    wait=True
+                )
+            point_cache.invalidate(self.collection_name, ids)
+            return True
+        except Exception as e:
+            raise Exception(f"Error deleting items: {str(e)}")
+
+    def get_items_by_category(self, category: str, query_embedding: np.ndarray, limit: int = 5,
+                              with_vectors: bool = True, collapse_duplicates: bool = False):
+        """
+        Get items by category with similarity search (without vectors when only
+        displayed). `collapse_duplicates` returns one item per near-duplicate cluster.
+        """
+        try:
+            query_filter = Filter(must=[FieldCondition(key="category", match=MatchValue(value=category))])
+            points = self.client.query_points(
                 collection_name=self.collection_name,
-                query=query_embedding.tolist(),
-                query_filter=Filter(
-                    must=[FieldCondition(key="category", match=MatchValue(value=category))]
-                ),
-                with_vectors=True,
+                query=as_vector(query_embedding),
+                query_filter=collapse_filter(query_filter) if collapse_duplicates else query_filter,
+                with_vectors=with_vectors,
                 with_payload=True,
-                limit=limit
+                limit=limit,
+                search_params=self.search_params
             ).points
+            point_cache.put_many(self.collection_name, points)
+            return points
         except Exception as e:
             raise Exception(f"Error querying items: {str(e)}")
 
-    def get_all_items(self, limit: int = 100):
-        """Get all items in the wardrobe"""
+    def search_batch(self, specs, collection_name: str = None, max_batch: int = 64, with_vectors: bool = True,
+                     matrices: bool = False):
+        """
+        Run several filtered searches in one request.
+        `specs` is a list of (query vector, category, limit); returns one list of
+        points per spec, in order, or one PointMatrix per spec with `matrices`.
+        Very long spec lists are split into requests of `max_batch` searches each.
+        """
         try:
-            scroll_result = self.client.scroll(
+            collection_name = collection_name or self.collection_name
+            results = []
+            for start in range(0, len(specs), max_batch):
+                responses = self.client.query_batch_points(
+                    collection_name=collection_name,
+                    requests=_batch_requests(specs[start:start + max_batch], self.search_params, with_vectors),
+                )
+                for response in responses:
+                    point_cache.put_many(collection_name, response.points)
+                    results.append(PointMatrix.from_points(response.points) if matrices else response.points)
+            return results
+        except Exception as e:
+            raise Exception(f"Error running batch search: {str(e)}")
+
+    def get_all_items(self, limit: int = 100, payload_fields: list[str] = None, page_size: int = 256):
+        """Get up to `limit` items, following scroll pages rather than stopping at the first one"""
+        items = []
+        for item in self.iter_items(page_size=min(page_size, limit), payload_fields=payload_fields):
+            items.append(item)
+            if len(items) >= limit:
+                break
+        return items
+
+    def get_page(self, offset=None, limit: int = 30, payload_fields: list[str] = None, with_vectors: bool = False,
+                 scroll_filter: Filter = None):
+        """
+        One scroll page starting at `offset`. Returns (points, next_offset);
+        next_offset is None on the last page. `payload_fields` limits the
+        payload to those keys.
+        """
+        try:
+            return self.client.scroll(
                 collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
                 limit=limit,
-                with_payload=True
+                offset=offset,
+                with_payload=payload_fields if payload_fields else True,
+                with_vectors=with_vectors
             )
-            return scroll_result[0]
         except Exception as e:
-            raise Exception(f"Error loading wardrobe: {str(e)}")
-        
-    def get_item_by_id(self, item_id: str):
-        """Get a specific item by its ID"""
+            raise Exception(f"Error loading items: {str(e)}")
+
+    def iter_items(self, page_size: int = 256, payload_fields: list[str] = None, with_vectors: bool = False,
+                   scroll_filter: Filter = None):
+        """Stream every item in the collection, one scroll page at a time"""
+        offset = None
+        while True:
+            points, offset = self.get_page(offset, page_size, payload_fields, with_vectors, scroll_filter)
+            yield from points
+            if offset is None:
+                return
+
+    def get_items(self, ids: list, with_vectors: bool = False, batch_size: int = 256):
+        """Retrieve many points by id (missing ids are left out), `batch_size` ids per request"""
+        try:
+            ids = list(ids)
+            points = []
+            for start in range(0, len(ids), batch_size):
+                points.extend(self.client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=ids[start:start + batch_size],
+                    with_payload=True,
+                    with_vectors=with_vectors
+                ))
+            return points
+        except Exception as e:
+            raise Exception(f"Error retrieving items: {str(e)}")
+
+    def get_item_by_id(self, item_id: str, collection_name: str = None):
+        """Get a specific item by its ID, from the point cache when possible"""
+        collection_name = collection_name or self.collection_name
+        cached = point_cache.get(collection_name, item_id)
+        if cached is not None:
+            return cached
         try:
             # The retrieve method returns a list of points, even if only one ID is requested.
             points = self.client.retrieve(
-                collection_name=self.collection_name,
+                collection_name=collection_name,
                 ids=[item_id],
                 with_payload=True,
-                with_vectors=True  # Or False, depending on whether you need the vector
+                with_vectors=True
             )
             if points:
+                point_cache.put_many(collection_name, points)
                 return points[0]  # Return the first (and should be only) point
             return None
         except Exception as e:
             raise Exception(f"Error retrieving item with ID '{item_id}': {str(e)}")
 
         
-    def get_similar_items_in_collection(self, item_id: int ,origin_collection_name:str,  target_collection_name: str, filter: str, limit: int = 2):
+    def get_similar_items_in_collection(self, item_id, origin_collection_name: str, target_collection_name: str,
+                                        filter: str, limit: int = 2, item_vector=None,
+                                        collapse_duplicates: bool = False):
         """
         Get similar items from a specified target collection based on a query embedding.
         This can be used to find items in one collection (e.g., marketplace)
         that are coherent with an item from another collection (e.g., wardrobe).
+
+        `item_id` may also be a point that already carries its vector; pass
+        `item_vector` directly when the caller holds it. Otherwise the vector
+        comes from the point cache, and only then from Qdrant.
+        With `collapse_duplicates`, only one item per near-duplicate cluster
+        of the target collection is returned.
         """
-        item_vector = self.client.retrieve(
-            collection_name=origin_collection_name,
-            ids=[item_id],
-            with_vectors=True
-        )[0].vector
+        if item_vector is None and getattr(item_id, "vector", None) is not None:
+            item_vector = item_id.vector
+        if item_vector is None:
+            point_id = getattr(item_id, "id", item_id)
+            point = self.get_item_by_id(point_id, collection_name=origin_collection_name)
+            if point is None:
+                raise Exception(f"Item '{point_id}' not found in collection '{origin_collection_name}'")
+            item_vector = point.vector
 
         try:
+            query_filter = Filter(must=[FieldCondition(key="category", match=MatchValue(value=filter))])
             search_results = self.client.query_points(
                 collection_name=target_collection_name,
-                query=item_vector,
+                query=as_vector(item_vector),
                 with_payload=True,
-                query_filter=Filter(
-                must=[FieldCondition(key="category", match=MatchValue(value=filter))]
-                ),
-                limit=limit
+                query_filter=collapse_filter(query_filter) if collapse_duplicates else query_filter,
+                limit=limit,
+                search_params=self.search_params
             )
             # Returns one image path
             return search_results.points
@@ -106,48 +550,301 @@ class VectorDatabase:
             raise Exception(f"Error querying similar items from collection '{target_collection_name}': {str(e)}")
 
 
-    def get_outfit_recommendations(self, query_embedding: np.ndarray, limit: int = 5):
+    def get_outfit_recommendations(self, query_embedding: np.ndarray, limit: int = 5, candidate_limit: int = None,
+                                   relevance_weight: float = 0.5, coherence_weight: float = 0.5):
         """Get outfit recommendations based on a query"""
         try:
-            # Get top candidates
-            tops = self.get_items_by_category("top", query_embedding, limit)
-            # Get bottom candidates
-            bottoms = self.get_items_by_category("bottom", query_embedding, limit)
+            # Candidate pools can be much larger than the number of outfits returned
+            candidate_limit = candidate_limit or limit
+            # Get top and bottom candidates in a single request
+            tops, bottoms = self.search_batch([
+                (query_embedding, "top", candidate_limit),
+                (query_embedding, "bottom", candidate_limit),
+            ])
 
             if not tops or not bottoms:
                 return []
 
             # Score and get outfit pairs
-            return self._score_outfit_combinations(query_embedding, tops, bottoms, limit)
+            return self._score_outfit_combinations(query_embedding, tops, bottoms, limit,
+                                                   relevance_weight=relevance_weight,
+                                                   coherence_weight=coherence_weight)
+        except Exception as e:
+            raise Exception(f"Error generating recommendations: {str(e)}")
+
+    def get_outfits(self, query_embedding: np.ndarray, slots=OUTFIT_SLOTS, limit: int = 5, candidate_limit: int = None,
+                    beam_width: int = DEFAULT_BEAM_WIDTH, relevance_weight: float = 0.5,
+                    coherence_weight: float = 0.5, required: dict = None, excluded=None, max_item_uses: int = None):
+        """
+        Outfits with one item per slot (see beam_search_outfits). Every slot's
+        candidates come back in a single batched request; `required` maps
+        slots to item ids and `excluded` is a collection of item ids.
+        """
+        try:
+            candidate_limit = candidate_limit or limit
+            required = required or {}
+            excluded = set(excluded or ())
+            searched = [slot for slot in slots if slot not in required]
+            # Over-fetch so excluded items don't shrink the pools
+            results = self.search_batch([
+                (query_embedding, slot, candidate_limit + len(excluded)) for slot in searched
+            ], matrices=True)
+            pools = dict(zip(searched, results))
+            for slot, item_id in required.items():
+                point = self.get_item_by_id(item_id)
+                if point is None:
+                    raise Exception(f"Required item '{item_id}' not found")
+                pools[slot] = PointMatrix.from_points([point])
+            return beam_search_outfits(query_embedding, pools, slots, limit, beam_width, relevance_weight,
+                                       coherence_weight, required, excluded, max_item_uses)
+        except Exception as e:
+            raise Exception(f"Error generating recommendations: {str(e)}")
+
+    def get_outfit_recommendations_batch(self, query_embeddings, limit: int = 5, candidate_limit: int = None,
+                                         relevance_weight: float = 0.5, coherence_weight: float = 0.5):
+        """
+        Outfit recommendations for many prompts at once (e.g. a nightly
+        "outfit of the day" run). All top/bottom searches go out as batched
+        requests; returns one list of outfits per query embedding.
+        """
+        try:
+            candidate_limit = candidate_limit or limit
+            specs = []
+            for query_embedding in query_embeddings:
+                specs.append((query_embedding, "top", candidate_limit))
+                specs.append((query_embedding, "bottom", candidate_limit))
+            results = self.search_batch(specs)
+
+            recommendations = []
+            for i, query_embedding in enumerate(query_embeddings):
+                tops, bottoms = results[2 * i], results[2 * i + 1]
+                recommendations.append(
+                    score_outfit_combinations(query_embedding, tops, bottoms, limit, relevance_weight, coherence_weight)
+                )
+            return recommendations
         except Exception as e:
             raise Exception(f"Error generating recommendations: {str(e)}")
 
-    def _score_outfit_combinations(self, query_embedding, tops, bottoms, limit: int = 3):
+    def get_outfit_bundle(self, query_embedding: np.ndarray, complement_collection: str, complement_category: str,
+                          limit: int = 3, candidate_limit: int = None, complement_limit: int = 2,
+                          timeout: float = DEFAULT_QUERY_TIMEOUT, slots=None, **outfit_options):
+        """
+        Outfit recommendations plus marketplace complements for the best outfit's bottom.
+        Synchronous wrapper around AsyncVectorDatabase.get_outfit_bundle; with an
+        injected (e.g. local) client it runs the same lookups one after another.
+        With `slots`, outfits come from get_outfits (outfit_options are passed on);
+        without, only its relevance/coherence weights apply.
+        """
+        if self._async_db is not None:
+            return run_sync(self._async_db.get_outfit_bundle(
+                query_embedding, complement_collection, complement_category,
+                limit=limit, candidate_limit=candidate_limit, complement_limit=complement_limit, timeout=timeout,
+                slots=slots, **outfit_options
+            ))
+
+        if slots:
+            outfits = self.get_outfits(query_embedding, slots, limit=limit, candidate_limit=candidate_limit,
+                                       **outfit_options)
+        else:
+            outfits = self.get_outfit_recommendations(query_embedding, limit=limit, candidate_limit=candidate_limit,
+                                                      **_score_weights(outfit_options))
+        base_item = outfits[0].get("bottom") if outfits else None
+        complements = []
+        if base_item is not None:
+            complements = self.get_similar_items_in_collection(
+                base_item["id"], self.collection_name, complement_collection, complement_category, complement_limit
+            )
+        return {"outfits": outfits, "base_item": base_item, "complements": complements, "errors": []}
+
+    def _score_outfit_combinations(self, query_embedding, tops, bottoms, limit: int = 3,
+                                   relevance_weight: float = 0.5, coherence_weight: float = 0.5):
         """Score outfit combinations based on coherence and query relevance"""
-        pair_scores = []
-        for top in tops:
-            for bottom in bottoms:
-                top_vector = np.array(top.vector)
-                bottom_vector = np.array(bottom.vector)
-                
-                coherence = self._cosine_similarity(top_vector, bottom_vector)
-                query_relevance = (
-                    self._cosine_similarity(query_embedding, top_vector) +
-                    self._cosine_similarity(query_embedding, bottom_vector)
-                ) / 2
-                top.payload['id'] = top.id
-                bottom.payload['id'] = bottom.id
-                score = 0.5 * query_relevance + 0.5 * coherence
-                pair_scores.append({
-                    "score": score,
-                    "top": top.payload,
-                    "bottom": bottom.payload,
-                })
-
-        pair_scores.sort(key=lambda x: x["score"], reverse=True)
-        return pair_scores[:limit]
+        return score_outfit_combinations(query_embedding, tops, bottoms, limit, relevance_weight, coherence_weight)
 
     @staticmethod
     def _cosine_similarity(vec1, vec2):
         """Calculate cosine similarity between two vectors"""
-        return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
\ No newline at end of file
+        return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+
+
+
+@metrics.instrument("async_vector_db")
+class AsyncVectorDatabase:
+    def __init__(self, host: str, api_key: str, collection_name: str, client: AsyncQdrantClient = None,
+                 timeout: float = DEFAULT_QUERY_TIMEOUT, search_params: SearchParams = None):
+        """Async counterpart of VectorDatabase for fanning out independent queries"""
+        self.client = client or shared_client(host, api_key, asynchronous=True, timeout=max(1, int(timeout)))
+        self.collection_name = collection_name
+        self.timeout = timeout
+        self.search_params = search_params
+
+    async def get_items_by_category(self, category: str, query_embedding: np.ndarray, limit: int = 5,
+                                    collection_name: str = None, with_vectors: bool = True):
+        """Get items by category with similarity search (without vectors when only displayed)"""
+        try:
+            collection_name = collection_name or self.collection_name
+            result = await self.client.query_points(
+                collection_name=collection_name,
+                query=as_vector(query_embedding),
+                query_filter=Filter(
+                    must=[FieldCondition(key="category", match=MatchValue(value=category))]
+                ),
+                with_vectors=with_vectors,
+                with_payload=True,
+                limit=limit,
+                search_params=self.search_params
+            )
+            point_cache.put_many(collection_name, result.points)
+            return result.points
+        except Exception as e:
+            raise Exception(f"Error querying items: {str(e)}")
+
+    async def get_item_by_id(self, item_id: str, collection_name: str = None):
+        """Get a specific item by its ID, from the point cache when possible"""
+        collection_name = collection_name or self.collection_name
+        cached = point_cache.get(collection_name, item_id)
+        if cached is not None:
+            return cached
+        try:
+            points = await self.client.retrieve(
+                collection_name=collection_name,
+                ids=[item_id],
+                with_payload=True,
+                with_vectors=True
+            )
+            point_cache.put_many(collection_name, points)
+            return points[0] if points else None
+        except Exception as e:
+            raise Exception(f"Error retrieving item with ID '{item_id}': {str(e)}")
+
+    async def search_batch(self, specs, collection_name: str = None, with_vectors: bool = True,
+                           matrices: bool = False):
+        """Run several (query vector, category, limit) searches in one request"""
+        try:
+            collection_name = collection_name or self.collection_name
+            responses = await self.client.query_batch_points(
+                collection_name=collection_name,
+                requests=_batch_requests(specs, self.search_params, with_vectors),
+            )
+            for response in responses:
+                point_cache.put_many(collection_name, response.points)
+            if matrices:
+                return [PointMatrix.from_points(response.points) for response in responses]
+            return [response.points for response in responses]
+        except Exception as e:
+            raise Exception(f"Error running batch search: {str(e)}")
+
+    async def _gather(self, *coroutines, timeout: float = None):
+        """
+        Run coroutines concurrently, each bounded by `timeout`.
+        Returns (results, errors); a failed or timed-out lookup yields None.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(coroutine, timeout) for coroutine in coroutines), return_exceptions=True
+        )
+        results, errors = [], []
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                errors.append("Query timed out" if isinstance(outcome, asyncio.TimeoutError) else str(outcome))
+                results.append(None)
+            else:
+                results.append(outcome)
+        return results, errors
+
+    async def get_outfit_recommendations(self, query_embedding: np.ndarray, limit: int = 5, candidate_limit: int = None,
+                                         relevance_weight: float = 0.5, coherence_weight: float = 0.5,
+                                         timeout: float = None):
+        """Get outfit recommendations, fetching tops and bottoms in one batched request"""
+        candidate_limit = candidate_limit or limit
+        (result,), errors = await self._gather(
+            self.search_batch([
+                (query_embedding, "top", candidate_limit),
+                (query_embedding, "bottom", candidate_limit),
+            ]),
+            timeout=timeout,
+        )
+        if errors:
+            raise Exception(f"Error generating recommendations: {'; '.join(errors)}")
+        tops, bottoms = result
+        return score_outfit_combinations(query_embedding, tops, bottoms, limit, relevance_weight, coherence_weight)
+
+    async def get_outfits(self, query_embedding: np.ndarray, slots=OUTFIT_SLOTS, limit: int = 5,
+                          candidate_limit: int = None, timeout: float = None, beam_width: int = DEFAULT_BEAM_WIDTH,
+                          relevance_weight: float = 0.5, coherence_weight: float = 0.5, required: dict = None,
+                          excluded=None, max_item_uses: int = None):
+        """Outfits with one item per slot, fetching every slot's candidates in one batched request"""
+        candidate_limit = candidate_limit or limit
+        required = required or {}
+        excluded = set(excluded or ())
+        searched = [slot for slot in slots if slot not in required]
+        results, errors = await self._gather(
+            self.search_batch([(query_embedding, slot, candidate_limit + len(excluded)) for slot in searched],
+                              matrices=True),
+            *(self.get_item_by_id(item_id) for item_id in required.values()),
+            timeout=timeout,
+        )
+        if errors:
+            raise Exception(f"Error generating recommendations: {'; '.join(errors)}")
+        pools = dict(zip(searched, results[0]))
+        for (slot, item_id), point in zip(required.items(), results[1:]):
+            if point is None:
+                raise Exception(f"Error generating recommendations: Required item '{item_id}' not found")
+            pools[slot] = PointMatrix.from_points([point])
+        return beam_search_outfits(query_embedding, pools, slots, limit, beam_width, relevance_weight,
+                                   coherence_weight, required, excluded, max_item_uses)
+
+    async def get_outfit_bundle(self, query_embedding: np.ndarray, complement_collection: str, complement_category: str,
+                                limit: int = 3, candidate_limit: int = None, complement_limit: int = 2,
+                                timeout: float = None, slots=None, **outfit_options):
+        """
+        Outfits from this collection plus `complement_category` items from
+        `complement_collection` that go with the best outfit's bottom.
+
+        Tops and bottoms are fetched concurrently; the complement search reuses
+        the bottom's vector from that response instead of retrieving it again,
+        so a click costs two round trips instead of four. Lookups that fail or
+        time out are reported in `errors` and leave the rest of the bundle intact.
+        With `slots`, outfits come from get_outfits (outfit_options are passed on);
+        without, only its relevance/coherence weights apply.
+        """
+        candidate_limit = candidate_limit or limit
+        bundle = {"outfits": [], "base_item": None, "complements": [], "errors": []}
+        if slots:
+            try:
+                outfits = await self.get_outfits(query_embedding, slots, limit, candidate_limit, timeout,
+                                                 **outfit_options)
+            except Exception as e:
+                bundle["errors"].append(str(e))
+                return bundle
+        else:
+            (tops, bottoms), errors = await self._gather(
+                self.get_items_by_category("top", query_embedding, candidate_limit),
+                self.get_items_by_category("bottom", query_embedding, candidate_limit),
+                timeout=timeout,
+            )
+            bundle["errors"] = errors
+            if not tops or not bottoms:
+                return bundle
+            outfits = score_outfit_combinations(query_embedding, tops, bottoms, limit, **_score_weights(outfit_options))
+        bundle["outfits"] = outfits
+        if not outfits or not outfits[0].get("bottom"):
+            return bundle
+
+        base_item = outfits[0]["bottom"]
+        bundle["base_item"] = base_item
+        # The bottom came back from a search with vectors, so this is normally a point cache hit
+        (base_point,), lookup_errors = await self._gather(self.get_item_by_id(base_item["id"]), timeout=timeout)
+        bundle["errors"].extend(lookup_errors)
+        if base_point is None:
+            if not lookup_errors:
+                bundle["errors"].append(f"Item '{base_item['id']}' not found")
+            return bundle
+        (complements,), complement_errors = await self._gather(
+            self.get_items_by_category(complement_category, base_point.vector, complement_limit, complement_collection,
+                                       with_vectors=False),
+            timeout=timeout,
+        )
+        bundle["complements"] = complements or []
+        bundle["errors"].extend(complement_errors)
+        return bundle
@@ -0,0 +1,71 @@
+"""
+NumPy-native vector handling.
+
+Inside the app, vectors are contiguous float32 arrays. Search results are
+stacked once into a PointMatrix: an (N, D) matrix plus parallel id,
+payload and score lists. Scorers use that matrix instead of rebuilding
+arrays from lists of Python floats. The local index hands out rows of its
+own matrix, so no list is ever built. Qdrant still returns lists over
+REST, and those are converted in a single np.array call.
+
+Wire size depends on the client. REST sends each float as JSON text, about
+20 bytes. With QDRANT_PREFER_GRPC=1 vectors are sent as packed float32, 4
+bytes each. Float16 storage (QDRANT_VECTOR_DATATYPE=float16 or
+LOCAL_INDEX_DTYPE=float16) halves the memory each stored vector takes.
+benchmarks/vector_transport.py measures these paths.
+"""
+import numpy as np
+
+
+def as_vector(vector, dtype=np.float32) -> np.ndarray:
+    """A contiguous 1-D array, without copying when it already is one"""
+    return np.ascontiguousarray(vector, dtype=dtype).reshape(-1)
+
+
+def as_matrix(vectors, dtype=np.float32) -> np.ndarray:
+    """A contiguous 2-D (N, D) array from a matrix or a sequence of vectors"""
+    return np.ascontiguousarray(np.atleast_2d(np.asarray(vectors, dtype=dtype)))
+
+
+def normalize_rows(matrix):
+    """L2-normalise each row of a matrix, leaving zero rows untouched"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def stack_vectors(points, dtype=np.float32) -> np.ndarray:
+    """(N, D) matrix of the points' vectors; array vectors are stacked without going through lists"""
+    vectors = [point.vector for point in points]
+    if not vectors:
+        return np.zeros((0, 0), dtype=dtype)
+    if all(isinstance(vector, np.ndarray) for vector in vectors):
+        return np.stack(vectors).astype(dtype, copy=False)
+    return np.array(vectors, dtype=dtype)
+
+
+class PointMatrix:
+    __slots__ = ("ids", "vectors", "payloads", "scores")
+
+    def __init__(self, ids, vectors: np.ndarray, payloads, scores=None):
+        """Search results as an (N, D) float32 matrix with parallel ids, payloads and scores"""
+        self.ids = list(ids)
+        self.vectors = vectors
+        self.payloads = list(payloads)
+        self.scores = scores
+
+    @classmethod
+    def from_points(cls, points, dtype=np.float32):
+        points = list(points)
+        scores = np.array([getattr(point, "score", 0.0) for point in points], dtype=np.float32)
+        return cls([point.id for point in points], stack_vectors(points, dtype),
+                   [point.payload for point in points], scores)
+
+    def take(self, rows):
+        """A new PointMatrix with only `rows` (indices or a boolean mask)"""
+        rows = np.flatnonzero(rows) if np.asarray(rows).dtype == bool else np.asarray(rows, dtype=np.int64)
+        scores = self.scores[rows] if self.scores is not None else None
+        return PointMatrix([self.ids[i] for i in rows], self.vectors[rows], [self.payloads[i] for i in rows], scores)
+
+    def __len__(self):
+        return len(self.ids)